@@ -0,0 +1,118 @@
+## Append-only answer store shared by the rag_scenarios scripts
+## Every answer is appended as one JSONL line next to the usual answers .json file, instead of
+## rewriting the whole JSON list after each question. `export` compacts the JSONL back into the
+## JSON list layout read by the evaluation and print_results scripts.
+##   python common/answer_store.py ../data/law_en_bge_answers.jsonl   # -> ../data/law_en_bge_answers.json
+import json
+import os
+import sys
+
+
+def jsonl_path_for(json_path):
+    """Path of the JSONL log that backs an answers .json file."""
+    return os.path.splitext(json_path)[0] + ".jsonl"
+
+
+def read_records(jsonl_path):
+    """Yield the records of a JSONL file, ignoring a truncated last line left by a crash."""
+    if not os.path.exists(jsonl_path):
+        return
+    with open(jsonl_path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Skipping truncated record in '{jsonl_path}'")
+
+
+def export_json(jsonl_path, json_path):
+    """Write all JSONL records as one JSON list, atomically replacing `json_path`."""
+    tmp_path = json_path + ".tmp"
+    count = 0
+    with open(tmp_path, 'w') as f:
+        f.write("[")
+        for record in read_records(jsonl_path):
+            if count:
+                f.write(", ")
+            json.dump(record, f)
+            count += 1
+        f.write("]")
+    os.replace(tmp_path, json_path)
+    return count
+
+
+class AnswerStore:
+    """
+    Appends one JSON record per line and fsyncs every `fsync_every` records.
+
+    A legacy answers .json file without a JSONL log is imported once, so previous
+    generations are kept when switching an existing output file over.
+    """
+
+    def __init__(self, json_path, fsync_every=20):
+        self.json_path = json_path
+        self.jsonl_path = jsonl_path_for(json_path)
+        self.fsync_every = fsync_every
+        self.pending = 0
+        if os.path.dirname(self.jsonl_path):
+            os.makedirs(os.path.dirname(self.jsonl_path), exist_ok=True)
+        if not os.path.exists(self.jsonl_path) and os.path.exists(self.json_path):
+            self._import_legacy_json()
+        self.file = open(self.jsonl_path, 'a')
+
+    def _import_legacy_json(self):
+        try:
+            with open(self.json_path, 'r') as f:
+                records = json.load(f)
+        except (OSError, ValueError):
+            return
+        with open(self.jsonl_path, 'w') as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(self, record):
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        self.pending += 1
+        if self.pending >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        os.fsync(self.file.fileno())
+        self.pending = 0
+
+    def records(self):
+        return read_records(self.jsonl_path)
+
+    def export(self):
+        """Compact the JSONL log into the answers .json file and return the record count."""
+        self.file.flush()
+        return export_json(self.jsonl_path, self.json_path)
+
+    def close(self, export=True):
+        if self.file.closed:
+            return
+        self.sync()
+        self.file.close()
+        if export:
+            count = export_json(self.jsonl_path, self.json_path)
+            print(f"Exported {count} records to '{self.json_path}'")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: answer_store.py <answers.jsonl> [answers.json]")
+        sys.exit(1)
+    source = sys.argv[1]
+    target = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(source)[0] + ".json"
+    print(f"Exported {export_json(source, target)} records to '{target}'")
@@ -0,0 +1,176 @@
+## Per-call metrics of the LLM and ES requests: tokens, cost, latency, retries and ES `took`
+## Every request is recorded with its stage (generation, judge, critique...), retriever and question hash as one
+## short JSON line of a metrics file (zero / empty fields left out), so a run of thousands of calls stays small.
+## print_summary shows p50 / p95 / p99 latency, tokens, cost and retries per stage and retriever, and the
+## costliest questions; cached calls are counted but kept out of the latency percentiles.
+##   python common/call_metrics.py ../data/metrics/run_retrievers.jsonl    # summary of a metrics file
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.checkpoint import question_hash
+
+PERCENTILES = (50, 95, 99)
+# USD per million (prompt, completion) tokens; calls of other models get no cost
+PRICES_PER_MILLION = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+}
+TOP_QUESTIONS = 5
+
+
+def token_usage(response):
+    """(prompt, completion) tokens of an OpenAI completion or a langchain message; (0, 0) when not reported."""
+    usage = getattr(response, "usage", None)
+    if usage is not None and hasattr(usage, "prompt_tokens"):
+        return usage.prompt_tokens or 0, usage.completion_tokens or 0
+    metadata = getattr(response, "usage_metadata", None)  # langchain_openai models
+    if metadata:
+        return metadata.get("input_tokens", 0), metadata.get("output_tokens", 0)
+    usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}  # community models
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+def cost(model, prompt_tokens, completion_tokens):
+    prices = PRICES_PER_MILLION.get(model)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1e6
+
+
+class CallMetrics:
+    """Records calls in memory and, when `path` is given, appends them to a JSONL file. Safe to share between threads."""
+
+    def __init__(self, path=None, name="calls"):
+        self.path = path
+        self.name = name
+        self.records = []
+        self.lock = threading.Lock()
+        self.file = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.file = open(path, 'a')
+
+    def record(self, kind, stage, seconds, retriever=None, question=None, model=None, prompt_tokens=0,
+               completion_tokens=0, retries=0, took=None, cached=False, error=None):
+        """Record one finished call; `kind` is "llm" or "es", `took` the ES server time in ms."""
+        record = {"kind": kind, "stage": stage, "retriever": retriever,
+                  "question": question_hash(question) if question is not None else None, "model": model,
+                  "seconds": round(seconds, 4), "prompt_tokens": prompt_tokens,
+                  "completion_tokens": completion_tokens, "retries": retries, "took": took, "cached": cached,
+                  "error": error, "at": round(time.time(), 3)}
+        record = {key: value for key, value in record.items() if value not in (None, 0, False)}
+        with self.lock:
+            self.records.append(record)
+            if self.file:
+                self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+                self.file.flush()
+        return record
+
+    def llm(self, stage, start, response, retriever=None, question=None, model=None, retries=0, cached=False):
+        """Record an LLM call started at `start` (time.perf_counter()) from its response's token usage."""
+        prompt_tokens, completion_tokens = token_usage(response)
+        return self.record("llm", stage, time.perf_counter() - start, retriever, question, model, prompt_tokens,
+                           completion_tokens, retries, cached=cached)
+
+    def es(self, stage, start, response=None, retriever=None, question=None, cached=False):
+        """Record an ES search started at `start`; `response` is the search response (None for a cache hit)."""
+        took = response.get("took") if response is not None else None
+        return self.record("es", stage, time.perf_counter() - start, retriever, question, took=took, cached=cached)
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+    def print_summary(self):
+        print_summary(self.records, self.name)
+
+
+def read_records(path):
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(records):
+    """One row per (kind, stage, retriever): calls, cached calls, latency percentiles, tokens, cost, retries, took."""
+    groups = {}
+    for record in records:
+        groups.setdefault((record["kind"], record["stage"], record.get("retriever") or "-"), []).append(record)
+    rows = []
+    for (kind, stage, retriever), group in sorted(groups.items()):
+        live = [record for record in group if not record.get("cached")]
+        seconds = np.array([record.get("seconds", 0.0) for record in live])
+        took = np.array([record["took"] for record in live if "took" in record])
+        prompt_tokens = sum(record.get("prompt_tokens", 0) for record in group)
+        completion_tokens = sum(record.get("completion_tokens", 0) for record in group)
+        costs = [cost(record.get("model"), record.get("prompt_tokens", 0), record.get("completion_tokens", 0))
+                 for record in live if kind == "llm"]
+        row = {"kind": kind, "stage": stage, "retriever": retriever, "calls": len(group),
+               "cached": len(group) - len(live), "errors": sum("error" in record for record in group),
+               "retries": sum(record.get("retries", 0) for record in group),
+               "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+               # cache hits carry no tokens, so the per-call figure is over the calls that reached the model
+               "prompt_tokens_per_call": sum(record.get("prompt_tokens", 0) for record in live) / len(live)
+               if live else 0,
+               "cost": sum(c for c in costs if c is not None) if any(c is not None for c in costs) else None,
+               "took_p50": float(np.percentile(took, 50)) if len(took) else None}
+        for p in PERCENTILES:
+            row[f"p{p}"] = float(np.percentile(seconds, p)) if len(seconds) else None
+        rows.append(row)
+    return rows
+
+
+def question_totals(records):
+    """Per question hash: seconds, tokens and cost summed over all its calls."""
+    totals = {}
+    for record in records:
+        if "question" not in record:
+            continue
+        total = totals.setdefault(record["question"], {"calls": 0, "seconds": 0.0, "tokens": 0, "cost": 0.0})
+        total["calls"] += 1
+        total["seconds"] += record.get("seconds", 0.0)
+        total["tokens"] += record.get("prompt_tokens", 0) + record.get("completion_tokens", 0)
+        total["cost"] += cost(record.get("model"), record.get("prompt_tokens", 0),
+                              record.get("completion_tokens", 0)) or 0.0
+    return totals
+
+
+def print_summary(records, name="calls"):
+    if not records:
+        print(f"{name}: no calls recorded")
+        return
+    print(f"\n{name}: {len(records)} calls")
+    print(f"{'kind':4} {'stage':22} {'retriever':20} {'calls':>6} {'cached':>6} {'retry':>5} {'err':>4} "
+          f"{'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'took ms':>7} {'prompt tok':>10} {'/call':>7} "
+          f"{'compl tok':>9} {'cost $':>8}")
+    for row in summarize(records):
+        latency = " ".join("      -" if row[f"p{p}"] is None else f"{row[f'p{p}']:7.3f}" for p in PERCENTILES)
+        took = "      -" if row["took_p50"] is None else f"{row['took_p50']:7.0f}"
+        spent = "       -" if row["cost"] is None else f"{row['cost']:8.4f}"
+        print(f"{row['kind']:4} {row['stage'][:22]:22} {row['retriever'][:20]:20} {row['calls']:6} {row['cached']:6} "
+              f"{row['retries']:5} {row['errors']:4} {latency} {took} {row['prompt_tokens']:10} "
+              f"{row['prompt_tokens_per_call']:7.0f} {row['completion_tokens']:9} {spent}")
+    totals = question_totals(records)
+    costliest = sorted(totals.items(), key=lambda item: (item[1]["cost"], item[1]["tokens"]), reverse=True)
+    print(f"costliest questions (of {len(totals)}):")
+    for question, total in costliest[:TOP_QUESTIONS]:
+        print(f"  {question}  {total['calls']:3} calls {total['seconds']:7.2f}s {total['tokens']:7} tokens "
+              f"${total['cost']:.4f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summary of a call metrics file")
+    parser.add_argument("metrics_file")
+    args = parser.parse_args()
+    print_summary(read_records(args.metrics_file), os.path.basename(args.metrics_file))
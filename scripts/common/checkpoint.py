@@ -0,0 +1,74 @@
+## Checkpoint keys shared by the rag_scenarios runners and the evaluation scripts
+## A unit of work is identified by (question hash, retriever/eval config hash, model). The key is
+## stored inside the record it produced, so a record and its checkpoint are written in the same
+## append and a restart after a kill can neither redo nor duplicate finished questions.
+import hashlib
+import json
+
+from common.answer_store import AnswerStore
+
+KEY_FIELD = "checkpoint_key"
+
+
+def stable_hash(value):
+    """Short sha256 of a JSON-serialisable value, independent of dict ordering."""
+    data = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+
+def question_hash(question):
+    return stable_hash(" ".join(str(question).split()).lower())
+
+
+def checkpoint_key(question, config, model):
+    return f"{question_hash(question)}:{stable_hash(config)}:{model}"
+
+
+def retriever_config(index, build_es_query, **settings):
+    """Config of a retriever scenario: its index, query template and the prompt/packing `settings` the answers depend on."""
+    return dict(settings, index=index, query=build_es_query("{question}"))
+
+
+def completed_keys(records, config=None, model=None):
+    """
+    Checkpoint keys of records that were already written.
+
+    Records imported from a legacy answers .json file have no key; with `config` and `model` they
+    count as done under that config, so a resumed run doesn't answer (and append) them again.
+    """
+    keys = set()
+    for record in records:
+        if not isinstance(record, dict):
+            continue
+        if KEY_FIELD in record:
+            keys.add(record[KEY_FIELD])
+        elif config is not None and "question" in record:
+            keys.add(checkpoint_key(record["question"], config, model))
+    return keys
+
+
+class CheckpointLog:
+    """
+    Per-question progress log for the evaluators, backed by an append-only AnswerStore.
+
+    Finished items are looked up by key so a rerun reuses their scores instead of calling the judge again.
+    """
+
+    def __init__(self, path):
+        self.store = AnswerStore(path)
+        self.records = {record[KEY_FIELD]: record for record in self.store.records() if KEY_FIELD in record}
+
+    def __contains__(self, key):
+        return key in self.records
+
+    def get(self, key):
+        return self.records.get(key)
+
+    def add(self, key, record):
+        record = dict(record, **{KEY_FIELD: key})
+        self.store.append(record)
+        self.records[key] = record
+        return record
+
+    def close(self):
+        self.store.close(export=False)
@@ -0,0 +1,178 @@
+## Columnar (Parquet / Arrow IPC) copies of the answer and evaluation files
+## Answers become one row per question with question, retriever, answers and contexts columns; eval files
+## become one row per (answer file, question) with one column per metric. Readers open the file
+## memory-mapped and decode only the requested columns, so a plot of judge scores never parses contexts.
+## load_answers / load_eval accept the old .json files too and return the same records as json.load.
+##   python common/columnar.py answers ../data/fulltext_answers.json              # -> ../data/fulltext_answers.parquet
+##   python common/columnar.py eval ../../data/eval/medical/multi/eval_ragas.json  # -> .../eval_ragas.parquet
+import argparse
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+COLUMNAR_EXTENSIONS = (".parquet", ".arrow", ".feather")
+ANSWERS_SCHEMA = pa.schema([
+    ("retriever", pa.string()),
+    ("question", pa.string()),
+    ("ref_answer", pa.string()),
+    ("generated_answer", pa.string()),
+    ("retrieved_context", pa.list_(pa.string())),
+    ("ref_context", pa.string()),  # JSON: its layout differs between datasets
+    ("context_tokens", pa.int64()),
+    ("checkpoint_key", pa.string()),
+    ("extra", pa.string()),  # JSON of any other field of the record
+])
+# eval file keys: total_scores_<metric> for ragas, total_scores for the LLM judge
+JUDGE_METRIC = "judge_score"
+
+
+def is_columnar(path):
+    return path.endswith(COLUMNAR_EXTENSIONS)
+
+
+def retriever_name(path):
+    return os.path.basename(path).replace("_answers", "").rsplit(".", 1)[0]
+
+
+def write_table(table, path):
+    """Parquet (zstd) or, for .arrow / .feather, uncompressed Arrow IPC that maps without copying."""
+    tmp_path = path + ".tmp"
+    if path.endswith(".parquet"):
+        pq.write_table(table, tmp_path, compression="zstd")
+    else:
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+
+
+def read_table(path, columns=None):
+    """Memory-mapped read of only `columns` (all when None)."""
+    if path.endswith(".parquet"):
+        return pq.read_table(path, columns=columns, memory_map=True)
+    return feather.read_table(path, columns=columns, memory_map=True)
+
+
+def column_names(path):
+    if path.endswith(".parquet"):
+        return pq.read_schema(path).names
+    return read_table(path).column_names  # mapped, nothing is decoded
+
+
+def contexts_of(record):
+    """Retrieved contexts of an answer record as a list of strings, whatever the file's vintage."""
+    contexts = record.get("retrieved_context") or record.get("raw_context") or []
+    if isinstance(contexts, str):
+        return [contexts]
+    return [context if isinstance(context, str) else json.dumps(context, ensure_ascii=False) for context in contexts]
+
+
+def answers_to_table(records, retriever):
+    known = {"question", "ref_answer", "generated_answer", "retrieved_context", "raw_context", "ref_context",
+             "context_tokens", "checkpoint_key"}
+    columns = {
+        "retriever": [retriever] * len(records),
+        "question": [record.get("question") for record in records],
+        "ref_answer": [record.get("ref_answer") for record in records],
+        "generated_answer": [record.get("generated_answer") for record in records],
+        "retrieved_context": [contexts_of(record) for record in records],
+        "ref_context": [json.dumps(record.get("ref_context", record.get("context")), ensure_ascii=False)
+                        for record in records],
+        "context_tokens": [record.get("context_tokens") for record in records],
+        "checkpoint_key": [record.get("checkpoint_key") for record in records],
+        "extra": [json.dumps({key: value for key, value in record.items() if key not in known}, ensure_ascii=False)
+                  for record in records],
+    }
+    return pa.table(columns, schema=ANSWERS_SCHEMA)
+
+
+def load_answers(path, columns=None):
+    """Answer records of a .json or columnar file; for columnar files only `columns` are read."""
+    if not is_columnar(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    records = read_table(path, columns).to_pylist()
+    for record in records:
+        if "ref_context" in record:
+            record["ref_context"] = json.loads(record["ref_context"])
+        if "extra" in record:
+            record.update(json.loads(record.pop("extra")))
+    return records
+
+
+def eval_to_table(entries):
+    """One row per (answer file, question), one float column per metric found in the eval entries."""
+    metrics = sorted({key[len("total_scores_"):] for entry in entries for key in entry
+                      if key.startswith("total_scores_")})
+    if any("total_scores" in entry for entry in entries):
+        metrics.append(JUDGE_METRIC)
+    columns = {"path": [], "retriever": [], "question_index": [], "question_id": []}
+    columns.update({metric: [] for metric in metrics})
+    for entry in entries:
+        count = entry.get("total_questions", 0)
+        columns["path"] += [entry["path"]] * count
+        columns["retriever"] += [retriever_name(entry["path"])] * count
+        columns["question_index"] += list(range(count))
+        question_ids = list(entry.get("question_ids") or [])[:count]
+        columns["question_id"] += question_ids + [None] * (count - len(question_ids))
+        for metric in metrics:
+            key = "total_scores" if metric == JUDGE_METRIC else f"total_scores_{metric}"
+            scores = entry.get(key) or [None] * count
+            columns[metric] += [None if score is None else float(score) for score in scores]
+    columns["question_id"] = pa.array(columns["question_id"], type=pa.string())
+    return pa.table(columns)
+
+
+def load_eval(path, metrics=None):
+    """
+    Eval entries ({"path", "total_questions", "total_scores_<metric>", "average_score_<metric>"}) of a .json
+    or columnar eval file; for columnar files only the `metrics` columns are read.
+    """
+    if not is_columnar(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    if metrics is None:
+        metrics = [name for name in column_names(path)
+                   if name not in ("path", "retriever", "question_index", "question_id")]
+    # files written before question ids were recorded have no question_id column
+    id_column = ["question_id"] if "question_id" in column_names(path) else []
+    table = read_table(path, ["path"] + id_column + list(metrics))
+    paths = table.column("path").to_pylist()
+    entries = {}
+    for row, file_path in enumerate(paths):
+        entries.setdefault(file_path, []).append(row)
+    result = []
+    for file_path, rows in entries.items():
+        entry = {"path": file_path, "total_questions": len(rows)}
+        question_ids = table.column("question_id").take(pa.array(rows)).to_pylist() if id_column else []
+        if question_ids and None not in question_ids:
+            entry["question_ids"] = question_ids
+        for metric in metrics:
+            values = table.column(metric).take(pa.array(rows)).to_pylist()
+            suffix = "" if metric == JUDGE_METRIC else f"_{metric}"
+            entry[f"total_scores{suffix}"] = values
+            present = [value for value in values if value is not None]
+            entry[f"average_score{suffix}"] = sum(present) / len(present) if present else None
+        result.append(entry)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert answer / eval JSON files to Parquet or Arrow")
+    parser.add_argument("kind", choices=["answers", "eval"])
+    parser.add_argument("json_path")
+    parser.add_argument("-o", "--output", help="default: json_path with a .parquet extension")
+    parser.add_argument("--retriever", help="retriever column of an answers file (default: from the file name)")
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.json_path)[0] + ".parquet"
+    with open(args.json_path, 'r') as f:
+        data = json.load(f)
+    if args.kind == "answers":
+        table = answers_to_table(data, args.retriever or retriever_name(args.json_path))
+    else:
+        table = eval_to_table(data)
+    write_table(table, output)
+    print(f"Wrote {table.num_rows} rows x {table.num_columns} columns to '{output}' "
+          f"({os.path.getsize(args.json_path) / 1024:.0f} KB -> {os.path.getsize(output) / 1024:.0f} KB)")
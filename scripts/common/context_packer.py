@@ -0,0 +1,101 @@
+## Token-budgeted context packing for the generation prompt
+## Chunks arrive in rank order as (document id, text). Exact duplicates are dropped, text that a chunk
+## shares with an already packed chunk of the same document (semantic_text chunk overlap) is trimmed,
+## and chunks are added until the token budget is full; the chunk crossing the budget is truncated.
+import functools
+import os
+import re
+
+DEFAULT_CONTEXT_TOKENS = 4000
+# shorter shared runs between two chunks of a document are treated as coincidence, not chunk overlap
+MIN_OVERLAP_CHARS = 40
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model=None):
+    """tiktoken encoding of `model` (cl100k_base when unknown), or None when tiktoken can't load one offline."""
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model or "")
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"tiktoken unavailable ({e.__class__.__name__}), estimating 4 characters per token")
+        return None
+
+
+def count_tokens(text, model=None):
+    encoding = get_encoding(model or os.getenv("AZURE_OPENAI_MODEL"))
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text, tokens, model=None):
+    """The first `tokens` tokens of `text`."""
+    encoding = get_encoding(model or os.getenv("AZURE_OPENAI_MODEL"))
+    if encoding is None:
+        return text[:tokens * 4]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:tokens])
+
+
+def overlap(previous, chunk):
+    """Length of the longest suffix of `previous` that is a prefix of `chunk` (0 below MIN_OVERLAP_CHARS)."""
+    head = chunk[:MIN_OVERLAP_CHARS]
+    if len(head) < MIN_OVERLAP_CHARS:
+        return 0
+    start = previous.find(head)
+    while start != -1:
+        if chunk.startswith(previous[start:]):
+            return len(previous) - start
+        start = previous.find(head, start + 1)
+    return 0
+
+
+def trim_overlap(chunk, packed):
+    """Remove from `chunk` the text it shares with the start or end of the already packed chunks."""
+    for previous in packed:
+        if chunk in previous:
+            return ""
+        chunk = chunk[overlap(previous, chunk):]
+        tail = overlap(chunk, previous)
+        if tail:
+            chunk = chunk[:len(chunk) - tail]
+    return chunk.strip()
+
+
+def pack_context(chunks, budget=DEFAULT_CONTEXT_TOKENS, model=None):
+    """
+    Pack (document id, text) chunks in rank order into at most `budget` tokens (None or 0 = no limit).
+
+    Returns (texts, tokens used).
+    """
+    packed, by_document, seen = [], {}, set()
+    used = 0
+    for document, text in chunks:
+        normalized = re.sub(r"\s+", " ", text or "").strip()
+        if not normalized or normalized in seen:
+            continue
+        seen.add(normalized)
+        original = text
+        text = trim_overlap(text, by_document.get(document, []))
+        by_document.setdefault(document, []).append(original)
+        if not text:
+            continue
+        tokens = count_tokens(text, model)
+        if budget and used + tokens > budget:
+            remaining = budget - used
+            if remaining > 0:
+                text = truncate_tokens(text, remaining, model)
+                packed.append(text)
+                used += count_tokens(text, model)
+            break
+        packed.append(text)
+        used += tokens
+    return packed, used
+
+
+def context_tokens(texts, model=None):
+    """Tokens of a packed context, as counted against the budget."""
+    return sum(count_tokens(text, model) for text in texts)
@@ -0,0 +1,70 @@
+## Streaming readers for the raw corpus files in data/raw
+## Documents are decoded one at a time from either a JSON array (dragonball_docs*.json) or NDJSON,
+## so memory stays flat no matter how large the corpus is.
+import json
+import random
+import re
+
+BUFFER_SIZE = 1 << 20
+# whitespace and commas between array elements
+SEPARATORS = re.compile(r"[\s,]*")
+
+
+def iter_json_array(path, buffer_size=BUFFER_SIZE):
+    """Yield the elements of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = f.read(buffer_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"'{path}' is not a JSON array")
+        # elements are decoded in place from `offset`; the consumed prefix is only cut off when reading more,
+        # so each character is copied about once instead of once per element
+        offset, eof = 1, False
+        while True:
+            offset = SEPARATORS.match(buffer, offset).end()
+            if buffer.startswith("]", offset):
+                return
+            try:
+                element, end = decoder.raw_decode(buffer, offset)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                end = None  # element cut off by the end of the buffer: read on
+            if end == len(buffer) and not eof:
+                end = None  # a number ending with the buffer may go on in the next chunk
+            if end is not None:
+                yield element
+                offset = end
+            if end is None or (len(buffer) - offset < buffer_size and not eof):
+                data = f.read(buffer_size)
+                eof = not data
+                buffer, offset = buffer[offset:] + data, 0
+
+
+def iter_ndjson(path):
+    """Yield one JSON document per non-empty line."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_documents(path):
+    """Yield documents from a JSON array or NDJSON file, detected from the first character."""
+    with open(path, 'r', encoding='utf-8') as f:
+        first = f.read(64).lstrip()[:1]
+    return iter_json_array(path) if first == "[" else iter_ndjson(path)
+
+
+def reservoir_sample(iterable, k, rng=None):
+    """Uniform sample of k items from an iterable of unknown length (Algorithm R), in O(k) memory."""
+    rng = rng or random.Random()
+    sample = []
+    for seen, item in enumerate(iterable):
+        if seen < k:
+            sample.append(item)
+        else:
+            slot = rng.randint(0, seen)
+            if slot < k:
+                sample[slot] = item
+    return sample
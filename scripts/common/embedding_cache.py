@@ -0,0 +1,95 @@
+## Embedding cache backed by a memory-mapped float32 matrix
+## vectors.f32 holds one row per text, index.tsv maps a text hash to its row. Cached vectors are
+## read straight from the mapped file, so a hit costs neither a network call nor JSON parsing.
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """Append-only float32 vector store with a text-hash index. Safe to share between threads."""
+
+    def __init__(self, directory, name="embedding"):
+        self.directory = directory
+        self.name = name
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.index_path = os.path.join(directory, "index.tsv")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        self.dim = None
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r') as f:
+                self.dim = json.load(f)["dim"]
+
+        self.rows = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) == 2:
+                        self.rows[parts[0]] = int(parts[1])
+        self.row_count = 0
+        if self.dim and os.path.exists(self.vectors_path):
+            # drop a partially written row left by a crash so later appends stay aligned
+            self.row_count = os.path.getsize(self.vectors_path) // (4 * self.dim)
+            with open(self.vectors_path, 'r+b') as f:
+                f.truncate(self.row_count * 4 * self.dim)
+        self.rows = {key: row for key, row in self.rows.items() if row < self.row_count}
+        self.matrix = None
+
+    @staticmethod
+    def key(model, deployment, text):
+        return hashlib.sha256(f"{model}\x1f{deployment}\x1f{text}".encode("utf-8")).hexdigest()[:32]
+
+    def _mapped(self):
+        """Memory map of every row written so far, remapped when the file has grown."""
+        if self.matrix is None or self.matrix.shape[0] < self.row_count:
+            self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(self.row_count, self.dim))
+        return self.matrix
+
+    def get_many(self, keys):
+        """Return a float32 row (a view into the mapped file) for each key, or None when missing."""
+        with self.lock:
+            rows = [self.rows.get(key) for key in keys]
+            found = sum(row is not None for row in rows)
+            self.hits += found
+            self.misses += len(keys) - found
+            if not found:
+                return [None] * len(keys)
+            matrix = self._mapped()
+            return [matrix[row] if row is not None else None for row in rows]
+
+    def put_many(self, keys, vectors):
+        unique = {}
+        for key, vector in zip(keys, vectors):
+            unique.setdefault(key, vector)
+        if not unique:
+            return
+        keys = list(unique)
+        vectors = np.asarray(list(unique.values()), dtype=np.float32)
+        with self.lock:
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with open(self.meta_path, 'w') as f:
+                    json.dump({"dim": self.dim}, f)
+            # vectors first, index second: an index line never points past the data
+            with open(self.vectors_path, 'ab') as f:
+                f.write(vectors.tobytes())
+            with open(self.index_path, 'a') as f:
+                for offset, key in enumerate(keys):
+                    f.write(f"{key}\t{self.row_count + offset}\n")
+                    self.rows[key] = self.row_count + offset
+            self.row_count += len(keys)
+
+    def print_stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups * 100 if lookups else 0
+        print(f"{self.name} cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate), "
+              f"{self.row_count} vectors in '{self.directory}'")
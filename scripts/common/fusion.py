@@ -0,0 +1,63 @@
+## Client-side fusion of ranked lists from several sub-retrievers
+## Inputs are dense [retriever, question, candidate] arrays (see evaluation/sweep_fusion.candidate_arrays):
+## 1-based ranks with inf when a retriever did not return the candidate, and raw scores with nan.
+## Every function returns a fused [question, candidate] score matrix; rank with top_k.
+import numpy as np
+
+
+def rrf(ranks, rank_constant=60, rank_window_size=10):
+    """ES `rrf`: sum of 1 / (rank_constant + rank) over the sub-retrievers that ranked a doc within the window."""
+    inside = ranks <= rank_window_size
+    return np.where(inside, 1.0 / (rank_constant + np.where(inside, ranks, 0)), 0.0).sum(axis=0)
+
+
+def minmax(scores):
+    """Scale each retriever's scores to [0, 1] per question; a constant row becomes 1, missing stays nan."""
+    missing = np.isnan(scores)
+    low = np.where(missing, np.inf, scores).min(axis=-1, keepdims=True)
+    high = np.where(missing, -np.inf, scores).max(axis=-1, keepdims=True)
+    spread = np.where(high > low, high - low, 1.0)
+    scaled = np.where(high > low, (scores - low) / spread, 1.0)
+    return np.where(missing, np.nan, scaled)
+
+
+def zscore(scores):
+    """Standardise each retriever's scores per question; a constant row becomes 0, missing stays nan."""
+    missing = np.isnan(scores)
+    count = np.maximum((~missing).sum(axis=-1, keepdims=True), 1)
+    mean = np.where(missing, 0.0, scores).sum(axis=-1, keepdims=True) / count
+    std = np.sqrt((np.where(missing, 0.0, scores - mean) ** 2).sum(axis=-1, keepdims=True) / count)
+    standardised = np.where(std > 0, (scores - mean) / np.where(std > 0, std, 1.0), 0.0)
+    return np.where(missing, np.nan, standardised)
+
+
+NORMALIZERS = {"minmax": minmax, "zscore": zscore, "none": lambda scores: scores}
+
+
+def linear(scores, weights, normalizer="minmax"):
+    """
+    Weighted sum of normalised scores; a retriever that did not return a candidate contributes nothing.
+
+    With z-scores "nothing" is 0, i.e. the average of that retriever's hits for the question.
+    """
+    weights = np.asarray(weights, dtype=float).reshape(-1, 1, 1)
+    normalised = NORMALIZERS[normalizer](scores)
+    return np.nansum(weights * normalised, axis=0)
+
+
+def convex(scores, alpha, normalizer="minmax"):
+    """alpha * first retriever + (1 - alpha) * second retriever, on normalised scores."""
+    return linear(scores[:2], [alpha, 1 - alpha], normalizer)
+
+
+def retrieved(ranks):
+    """Mask of the candidates returned by at least one sub-retriever."""
+    return np.isfinite(ranks).any(axis=0)
+
+
+def top_k(scores, keep, size):
+    """Column indices of the `size` best kept scores per row and a mask of the slots actually filled."""
+    masked = np.where(keep, scores, -np.inf)
+    order = np.argsort(-masked, axis=1, kind="stable")[:, :size]
+    filled = np.take_along_axis(keep, order, axis=1)
+    return order, filled
@@ -0,0 +1,71 @@
+## Ranking metrics for the retrieval-only evaluation
+## A ranking is the list of document ids (hospital_patient_name) returned for a question, best first;
+## relevance is binary: a document is relevant when it is one of the question's references.
+## batch_scores computes the same metrics for a whole question set at once from a gains matrix.
+import math
+
+import numpy as np
+
+
+def dedupe(ranking):
+    """Keep the first occurrence of every id, so chunk-level hits count once per document."""
+    seen = set()
+    return [doc for doc in ranking if not (doc in seen or seen.add(doc))]
+
+
+def recall_at_k(ranking, relevant, k):
+    if not relevant:
+        return 0.0
+    return len(set(ranking[:k]) & relevant) / len(relevant)
+
+
+def reciprocal_rank(ranking, relevant):
+    for rank, doc in enumerate(ranking, start=1):
+        if doc in relevant:
+            return 1.0 / rank
+    return 0.0
+
+
+def ndcg_at_k(ranking, relevant, k):
+    dcg = sum(1.0 / math.log2(rank + 1) for rank, doc in enumerate(ranking[:k], start=1) if doc in relevant)
+    ideal = sum(1.0 / math.log2(rank + 1) for rank in range(1, min(len(relevant), k) + 1))
+    return dcg / ideal if ideal else 0.0
+
+
+def score_ranking(ranking, relevant, ks=(1, 3, 5, 10)):
+    """All metrics of one question as a flat dict, e.g. {'recall@3': .., 'mrr': .., 'ndcg@10': ..}."""
+    ranking = dedupe(ranking)
+    scores = {f"recall@{k}": recall_at_k(ranking, relevant, k) for k in ks}
+    scores["mrr"] = reciprocal_rank(ranking, relevant)
+    scores.update({f"ndcg@{k}": ndcg_at_k(ranking, relevant, k) for k in ks})
+    return scores
+
+
+def mean_scores(rows):
+    """Average a list of score dicts key by key."""
+    if not rows:
+        return {}
+    return {key: sum(row[key] for row in rows) / len(rows) for key in rows[0]}
+
+
+def batch_scores(gains, n_relevant, ks=(1, 3, 5, 10)):
+    """
+    Mean metrics over questions from a boolean [questions, ranks] matrix of relevant hits.
+
+    `n_relevant[q]` is the number of references of question q; a ranking must not repeat a document.
+    """
+    gains = np.asarray(gains, dtype=bool)
+    n_relevant = np.asarray(n_relevant)
+    depth = gains.shape[1]
+    discounts = 1.0 / np.log2(np.arange(2, depth + 2))
+    ideal = np.cumsum(discounts)
+    scores = {}
+    for k in ks:
+        scores[f"recall@{k}"] = float(np.mean(gains[:, :k].sum(axis=1) / np.maximum(n_relevant, 1)))
+    first = gains.argmax(axis=1)
+    scores["mrr"] = float(np.mean(np.where(gains.any(axis=1), 1.0 / (first + 1), 0.0)))
+    for k in ks:
+        dcg = (gains[:, :k] * discounts[:min(k, depth)]).sum(axis=1)
+        best = ideal[np.clip(np.minimum(n_relevant, k), 1, depth) - 1]
+        scores[f"ndcg@{k}"] = float(np.mean(np.where(n_relevant > 0, dcg / best, 0.0)))
+    return scores
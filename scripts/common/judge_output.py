@@ -0,0 +1,221 @@
+## Parsing of LLM-judge verdicts (a 1-5 score plus its rationale)
+## The judge is asked for JSON through a json_schema `response_format` (structured outputs); when the model or
+## API version rejects it, or returns free text anyway, the verdict is read with tolerant regexes that accept
+## the prompt's own marker ("[RESULT] 4", "Total rating: 4") and common drift ("**Score:** 4/5", "Rating - 4").
+## Only an item whose output can't be parsed is asked again, with a reminder of the expected format.
+## A combined format (combined_format) scores several criteria in one call; its verdict maps criterion -> verdict.
+import json
+import re
+import threading
+
+MAX_PARSE_RETRIES = 2
+# numbered, so every retry is a different request (and cache key) from the ones before it
+RETRY_REMINDER = ("Retry {attempt}: your previous answer could not be parsed. Answer again with only the {text} as "
+                  "text and the {score} as an integer between {low} and {high}, in the requested format.")
+
+# verdict formats: JSON field names of the structured output and the text markers of the prompt
+JUDGE_FORMAT = {"name": "judge_verdict", "text": "feedback", "score": "score",
+                "text_marker": "Feedback:", "score_marker": r"\[RESULT\]"}
+CRITIQUE_FORMAT = {"name": "critique", "text": "evaluation", "score": "total_rating",
+                   "text_marker": "Evaluation:", "score_marker": r"Total rating"}
+
+# fallbacks tried in order after the format's own marker
+SCORE_PATTERNS = [
+    r"\b(?:score|rating|result)\b[*_\s]*[:=\-]?[*_\s]*(\d+(?:\.\d+)?)",
+    r"\b(\d+(?:\.\d+)?)\s*/\s*5\b",
+    # a bare number only when it is the whole answer, not a numbered-list line
+    r"\A\W*(\d+(?:\.\d+)?)\W*\Z",
+]
+# markdown and separators left around a rationale once the score is cut out
+MARKUP = " \t\r\n*_#:-"
+
+
+def combined_format(fmt, criteria):
+    """`fmt` for one answer rating every criterion, as "<Criterion> evaluation: ... <Criterion> total rating: n"."""
+    return dict(fmt, name=f"combined_{fmt['name']}", criteria=list(criteria))
+
+
+def verdict_schema(fmt, low=1, high=5):
+    return {
+        "type": "object",
+        "properties": {fmt["text"]: {"type": "string"},
+                       fmt["score"]: {"type": "integer", "description": f"between {low} and {high}"}},
+        "required": [fmt["text"], fmt["score"]],
+        "additionalProperties": False,
+    }
+
+
+def response_format(fmt, low=1, high=5):
+    """OpenAI `response_format` asking for {text, score} JSON, or {criterion: {text, score}} (strict json_schema)."""
+    schema = verdict_schema(fmt, low, high)
+    if fmt.get("criteria"):
+        schema = {"type": "object", "properties": {criterion: schema for criterion in fmt["criteria"]},
+                  "required": fmt["criteria"], "additionalProperties": False}
+    return {"type": "json_schema", "json_schema": {"name": fmt["name"], "strict": True, "schema": schema}}
+
+
+def valid_score(value, low=1, high=5):
+    """`value` as an int within [low, high], or None."""
+    try:
+        score = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not score.is_integer() or not low <= score <= high:
+        return None
+    return int(score)
+
+
+def json_verdict(data, fmt, low=1, high=5):
+    if not isinstance(data, dict):
+        return None
+    score = valid_score(data.get(fmt["score"]), low, high)
+    if score is None:
+        return None
+    return {"score": score, "feedback": str(data.get(fmt["text"], "")).strip()}
+
+
+def parse_json(text, fmt, low=1, high=5):
+    """Verdict of a JSON answer (possibly inside a ``` fence or surrounded by prose), or None."""
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        return None
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    if not fmt.get("criteria"):
+        return json_verdict(data, fmt, low, high)
+    if not isinstance(data, dict):
+        return None
+    verdicts = {criterion: json_verdict(data.get(criterion), fmt, low, high) for criterion in fmt["criteria"]}
+    return None if None in verdicts.values() else verdicts
+
+
+def criterion_sections(text, criteria):
+    """Part of a combined answer about each criterion: from the line naming it to the next criterion's line."""
+    starts = {}
+    for criterion in criteria:
+        match = re.search(rf"^\W*{re.escape(criterion)}\b", text, re.IGNORECASE | re.MULTILINE)
+        if match:
+            starts[criterion] = match.start()
+    bounds = sorted(starts.values()) + [len(text)]
+    return {criterion: text[start:bounds[bounds.index(start) + 1]] for criterion, start in starts.items()}
+
+
+def parse_text(text, fmt, low=1, high=5):
+    """Verdict of a free-text answer, using the format's score marker first and SCORE_PATTERNS after it."""
+    if fmt.get("criteria"):
+        sections = criterion_sections(text, fmt["criteria"])
+        single = {key: value for key, value in fmt.items() if key != "criteria"}
+        verdicts = {criterion: parse_text(sections.get(criterion, ""),
+                                          dict(single, score_marker=rf"(?:{re.escape(criterion)}\W*)?{fmt['score_marker']}"),
+                                          low, high)
+                    for criterion in fmt["criteria"]}
+        return None if None in verdicts.values() else verdicts
+    patterns = [fmt["score_marker"] + r"[*_\s]*[:=\-]?[*_\s]*(\d+(?:\.\d+)?)"] + SCORE_PATTERNS
+    for pattern in patterns:
+        matches = list(re.finditer(pattern, text, re.IGNORECASE | re.MULTILINE))
+        if not matches:
+            continue
+        match = matches[-1]  # the verdict comes after the rationale
+        score = valid_score(match.group(1), low, high)
+        if score is None:
+            continue
+        feedback = text[:match.start()].strip(MARKUP) or re.sub(r"^\s*/\s*5", "", text[match.end():]).strip(MARKUP)
+        feedback = re.split(re.escape(fmt["text_marker"]), feedback, 1, flags=re.IGNORECASE)[-1]
+        return {"score": score, "feedback": feedback.strip(MARKUP)}
+    return None
+
+
+def parse_verdict(text, fmt, low=1, high=5):
+    """(verdict, method) with method "json" or "regex", or (None, "failed")."""
+    text = text or ""
+    verdict = parse_json(text, fmt, low, high)
+    if verdict is not None:
+        return verdict, "json"
+    verdict = parse_text(text, fmt, low, high)
+    if verdict is not None:
+        return verdict, "regex"
+    return None, "failed"
+
+
+def rejects_response_format(error):
+    """True when an API error says the deployment doesn't support structured outputs."""
+    message = str(error).lower()
+    return "response_format" in message or "json_schema" in message
+
+
+class Judge:
+    """
+    Runs judge calls with structured outputs and parse retries, and counts how every verdict was obtained.
+
+    `call(options, reminder)` sends one request: `options` are extra chat-completion arguments (the
+    response_format, or nothing once structured outputs are rejected) and `reminder` is None or a
+    sentence to append to the prompt. Safe to share between threads.
+    """
+
+    def __init__(self, fmt, structured=True, retries=MAX_PARSE_RETRIES, low=1, high=5, name="judge"):
+        self.fmt = fmt
+        self.structured = structured
+        self.retries = retries
+        self.low = low
+        self.high = high
+        self.name = name
+        self.counts = {"json": 0, "regex": 0, "failed": 0}
+        self.calls = 0
+        self.first_attempt_failures = 0
+        self.retried_ok = 0
+        self.lock = threading.Lock()
+
+    def options(self):
+        return {"response_format": response_format(self.fmt, self.low, self.high)} if self.structured else {}
+
+    def send(self, call, reminder):
+        try:
+            return call(self.options(), reminder)
+        except Exception as e:
+            if not self.structured or not rejects_response_format(e):
+                raise
+            with self.lock:
+                if self.structured:
+                    print(f"{self.name}: structured outputs rejected ({e.__class__.__name__}), parsing free text")
+                self.structured = False
+            return call({}, reminder)
+
+    def parses(self, text):
+        """True when `text` holds a verdict, e.g. to cache only replies that parse."""
+        return parse_verdict(text, self.fmt, self.low, self.high)[0] is not None
+
+    def judge(self, call):
+        """
+        Verdict {"score", "feedback"} of one item ({criterion: verdict} for a combined format), or None when
+        no attempt could be parsed.
+        """
+        reminder = None
+        for attempt in range(self.retries + 1):
+            verdict, method = parse_verdict(self.send(call, reminder), self.fmt, self.low, self.high)
+            with self.lock:
+                self.calls += 1
+                if attempt == 0 and verdict is None:
+                    self.first_attempt_failures += 1
+                if verdict is not None:
+                    self.counts[method] += 1
+                    self.retried_ok += attempt > 0
+                    return verdict
+            reminder = RETRY_REMINDER.format(attempt=attempt + 1, text=self.fmt["text"], score=self.fmt["score"],
+                                             low=self.low, high=self.high)
+            if self.fmt.get("criteria"):
+                reminder += f" Rate each of: {', '.join(self.fmt['criteria'])}."
+        with self.lock:
+            self.counts["failed"] += 1
+        return None
+
+    def print_stats(self):
+        items = sum(self.counts.values())
+        if not items:
+            return
+        print(f"{self.name} verdicts: {items} items in {self.calls} calls, "
+              f"{self.counts['json']} structured, {self.counts['regex']} parsed from text, "
+              f"{self.retried_ok} recovered by a retry, {self.counts['failed']} failed; "
+              f"parse failure rate {self.first_attempt_failures / items * 100:.1f}% on first attempt, "
+              f"{self.counts['failed'] / items * 100:.1f}% after retries")
@@ -0,0 +1,143 @@
+## Persistent, content-addressed cache for LLM (and embedding) responses
+## Keys are a sha256 of (model, deployment, temperature, messages), values live in a SQLite file
+## capped at `max_bytes` with least-recently-used eviction. Rerunning a judge over unchanged
+## answers is then served from disk without any network call.
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from common.call_metrics import token_usage
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def cache_key(model, deployment, temperature, messages):
+    """Content address of a request; `messages` is anything JSON-serialisable (list of role/content pairs, text...)."""
+    payload = json.dumps([model, deployment, temperature, messages], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite key/value store with an LRU size cap and hit/miss counters. Safe to share between threads."""
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, name="llm"):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                               key TEXT PRIMARY KEY,
+                               value TEXT NOT NULL,
+                               size INTEGER NOT NULL,
+                               last_used REAL NOT NULL)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+        self.db.commit()
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        """Return the cached JSON value for `key`, or None, and count the hit/miss."""
+        with self.lock:
+            row = self.db.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.db.commit()
+            return json.loads(row[0])
+
+    def put(self, key, value):
+        data = json.dumps(value, ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        with self.lock:
+            previous = self.db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.db.execute("INSERT OR REPLACE INTO responses (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                            (key, data, size, time.time()))
+            self.total_bytes += size - (previous[0] if previous else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self.db.commit()
+
+    def delete(self, key):
+        with self.lock:
+            row = self.db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.total_bytes -= row[0]
+                self.db.commit()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is back under 90% of its cap."""
+        target = self.max_bytes * 0.9
+        rows = self.db.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall()
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def print_stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups * 100 if lookups else 0
+        print(f"{self.name} cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate), "
+              f"{self.evictions} evictions, {self.total_bytes / 1024 / 1024:.1f} MB in '{self.path}'")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class CachedChatModel:
+    """Wraps a langchain chat model so `invoke(messages)` is answered from the cache when possible."""
+
+    def __init__(self, llm, cache):
+        self.llm = llm
+        self.cache = cache
+        self.usage = {"calls": 0, "cached_calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def key(self, messages, options=None):
+        """Cache key of a request; call options (e.g. a response_format) are part of it when given."""
+        content = [(message.type, message.content) for message in messages]
+        return cache_key(
+            getattr(self.llm, "model_name", None),
+            getattr(self.llm, "deployment_name", None),
+            getattr(self.llm, "temperature", None),
+            [content, options] if options else content,
+        )
+
+    def invoke(self, messages, accept=None, **kwargs):
+        """
+        Cached or fresh reply to `messages`. With `accept(content)`, only replies it accepts (e.g. parsable
+        verdicts) are cached, and a cached reply it rejects is dropped and asked again.
+        """
+        from langchain_core.messages import AIMessage
+
+        key = self.key(messages, kwargs)
+        cached = self.cache.get(key)
+        if cached is not None and (accept is None or accept(cached["content"])):
+            self.usage["cached_calls"] += 1
+            return AIMessage(content=cached["content"], response_metadata={"cached": True})
+        if cached is not None:  # written before replies were checked
+            self.cache.delete(key)
+        response = self.llm.invoke(messages, **kwargs)
+        if accept is None or accept(response.content):
+            self.cache.put(key, {"content": response.content})
+        prompt_tokens, completion_tokens = token_usage(response)
+        self.usage["calls"] += 1
+        self.usage["prompt_tokens"] += prompt_tokens
+        self.usage["completion_tokens"] += completion_tokens
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
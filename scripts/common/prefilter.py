@@ -0,0 +1,105 @@
+## Local checks on generated QA couples, run before any paid critique call
+## Rejects answers that are too long, questions of implausible length or that refer to "the context" /
+## "the passage" (the generation prompt forbids it), and near duplicates of questions already accepted.
+## Near duplicates are found with MinHash signatures of character shingles: the share of equal signature
+## slots estimates the Jaccard similarity of two questions.
+import re
+import threading
+import zlib
+
+import numpy as np
+
+MAX_ANSWER_CHARS = 300
+MIN_QUESTION_CHARS = 15
+MAX_QUESTION_CHARS = 300
+# references to the source text; "in the context of pregnancy" is a legitimate question
+BANNED_PATTERNS = [
+    r"\b(?:the|this|that|given|provided|above) (?:context|passage|text|document|article|excerpt)\b(?! of\b)",
+    r"\baccording to the\b",
+    r"\bmentioned (?:above|here)\b",
+]
+NEAR_DUPLICATE_SIMILARITY = 0.7  # estimated Jaccard similarity of the questions' shingle sets
+SHINGLE_CHARS = 5
+NUM_PERMUTATIONS = 128
+MERSENNE_PRIME = (1 << 61) - 1
+
+
+def shingles(text, size=SHINGLE_CHARS):
+    """Character shingles of a lower-cased, punctuation-free text."""
+    text = " ".join(re.findall(r"\w+", text.lower()))
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class QuestionPrefilter:
+    """Accepts or rejects QA couples one at a time and counts the reasons. Safe to share between threads."""
+
+    def __init__(self, max_answer_chars=MAX_ANSWER_CHARS, min_question_chars=MIN_QUESTION_CHARS,
+                 max_question_chars=MAX_QUESTION_CHARS, banned_patterns=BANNED_PATTERNS,
+                 similarity=NEAR_DUPLICATE_SIMILARITY, num_permutations=NUM_PERMUTATIONS, seed=42):
+        self.max_answer_chars = max_answer_chars
+        self.min_question_chars = min_question_chars
+        self.max_question_chars = max_question_chars
+        self.banned = re.compile("|".join(banned_patterns), re.IGNORECASE)
+        self.similarity = similarity
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MERSENNE_PRIME, num_permutations, dtype=np.uint64)
+        self.b = rng.integers(0, MERSENNE_PRIME, num_permutations, dtype=np.uint64)
+        self.signatures = np.empty((0, num_permutations), dtype=np.uint64)
+        self.questions = []
+        self.checked = 0
+        self.rejected = {"answer_too_long": 0, "question_length": 0, "banned_phrase": 0, "near_duplicate": 0}
+        self.lock = threading.Lock()
+
+    def signature(self, text):
+        hashes = np.array([zlib.crc32(shingle.encode("utf-8")) for shingle in shingles(text)], dtype=np.uint64)
+        # (a * h + b) mod p wraps around in uint64, which is still a fine hash family for 32-bit h
+        return ((np.outer(self.a, hashes) + self.b[:, None]) % MERSENNE_PRIME).min(axis=1)
+
+    def add(self, questions):
+        """Accept `questions` without checking them, e.g. those kept by earlier runs."""
+        questions = [question for question in questions if question]
+        if not questions:
+            return
+        with self.lock:
+            self.signatures = np.vstack([self.signatures] + [self.signature(question) for question in questions])
+            self.questions += questions
+
+    def nearest(self, signature):
+        """(similarity, question) of the closest accepted question, or (0.0, None)."""
+        if not self.questions:
+            return 0.0, None
+        similarities = (self.signatures == signature).mean(axis=1)
+        best = int(similarities.argmax())
+        return float(similarities[best]), self.questions[best]
+
+    def check(self, question, answer):
+        """None when the QA couple is accepted (and remembered for the duplicate check), else the rejection reason."""
+        question, answer = (question or "").strip(), (answer or "").strip()
+        if len(answer) >= self.max_answer_chars:
+            reason = "answer_too_long"
+        elif not self.min_question_chars <= len(question) <= self.max_question_chars:
+            reason = "question_length"
+        elif self.banned.search(question):
+            reason = "banned_phrase"
+        else:
+            reason = None
+        signature = self.signature(question) if reason is None else None
+        with self.lock:
+            self.checked += 1
+            if reason is None and self.nearest(signature)[0] >= self.similarity:
+                reason = "near_duplicate"
+            if reason is not None:
+                self.rejected[reason] += 1
+                return reason
+            self.signatures = np.vstack([self.signatures, signature])
+            self.questions.append(question)
+        return None
+
+    def print_stats(self, calls_per_couple):
+        """Rejections by reason and the critique calls they saved (`calls_per_couple` calls per QA couple)."""
+        rejected = sum(self.rejected.values())
+        reasons = ", ".join(f"{count} {reason.replace('_', ' ')}" for reason, count in self.rejected.items())
+        print(f"prefilter: {rejected} of {self.checked} QA couples rejected ({reasons}), "
+              f"saving {rejected * calls_per_couple} critique calls")
@@ -0,0 +1,368 @@
+## Versioned evaluation results: one entry layout for every evaluator, run manifests and an indexed results store
+## EvalEntry and RunManifest define both layouts. Eval entries keep the keys the plots read (average_score_<metric>
+## / total_scores_<metric>, average_score / total_scores for the LLM judge) and carry schema_version, run_id and
+## question_ids; upgrade_entry / upgrade_manifest bring older files to the current layout (e.g. the misspelled
+## average_score_faithfullness). A run manifest records what produced the scores: evaluator, models, answer files
+## with their dataset hash and retriever config hashes, timings and token counts; evaluators append it to
+## <eval>_manifests.jsonl. ResultStore indexes manifests and per-metric means in SQLite, so reports query metrics
+## across many runs without opening the eval files.
+##   python common/results.py ingest ../data/eval                      # index eval files and their manifests
+##   python common/results.py query --metric faithfulness --retriever hybrid
+import argparse
+import glob
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import sys
+import time
+import uuid
+from typing import Any, Dict, List, Optional, TypedDict
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.checkpoint import KEY_FIELD, stable_hash
+from common.columnar import JUDGE_METRIC, load_eval, retriever_name
+from common.significance import eval_metrics, score_key
+
+SCHEMA_VERSION = 1
+RESULTS_DB = '../data/eval/results.sqlite'  # relative to scripts/
+# keys written by older versions of the scripts -> current keys
+LEGACY_KEYS = {
+    "average_score_faithfullness": "average_score_faithfulness",
+    "total_scores_faithfullness": "total_scores_faithfulness",
+}
+
+
+class EvalEntry(TypedDict, total=False):
+    """
+    Scores of one answer file in an eval file. Besides these keys it holds average_score_<metric> and
+    total_scores_<metric> per metric (average_score / total_scores for the LLM judge) and evaluator counts
+    such as unparsed_questions.
+    """
+    schema_version: int
+    run_id: Optional[str]  # None for entries written before run manifests
+    path: str
+    total_questions: int
+    question_ids: List[str]  # question_hash of each question, in the order of the scores
+
+
+class AnswerFileRecord(TypedDict, total=False):
+    """What a run recorded about one evaluated answer file (legacy manifests only know retriever and questions)."""
+    retriever: str
+    questions: Optional[int]
+    dataset_hash: str
+    file_hash: Optional[str]
+    retriever_configs: List[str]
+    generation_models: List[str]
+    seconds: float
+
+
+class RunManifest(TypedDict):
+    """One evaluation run, as appended to <eval>_manifests.jsonl and stored in ResultStore."""
+    schema_version: int
+    run_id: str
+    evaluator: str
+    output_file: str
+    models: Dict[str, Any]
+    started_at: Optional[str]
+    finished_at: Optional[str]
+    seconds: Optional[float]
+    answer_files: Dict[str, AnswerFileRecord]
+    tokens: Dict[str, int]
+
+
+# perf_counter() at new_run of the runs not finished yet, kept out of the manifest itself
+_run_starts = {}
+
+
+def mean_key(metric):
+    return "average_score" if metric == JUDGE_METRIC else f"average_score_{metric}"
+
+
+def mean(scores):
+    """Mean of the finite scores; None (not scored) and NaN (failed ragas jobs) are left out."""
+    present = [score for score in scores if score is not None and math.isfinite(score)]
+    return sum(present) / len(present) if present else None
+
+
+def result_entry(path, scores, run_id, question_ids=None, **extra) -> EvalEntry:
+    """Eval entry of one answer file; `scores` maps each metric to its per-question scores (None if missing)."""
+    entry = {"schema_version": SCHEMA_VERSION, "run_id": run_id, "path": path,
+             "total_questions": max((len(values) for values in scores.values()), default=0)}
+    if question_ids is not None:
+        entry["question_ids"] = list(question_ids)
+    for metric, values in scores.items():
+        entry[mean_key(metric)] = mean(values)
+        entry[score_key(metric)] = list(values)
+    entry.update(extra)
+    return entry
+
+
+def upgrade_entry(entry) -> EvalEntry:
+    """Copy of an eval entry in the current layout; raises ValueError for entries it can't read."""
+    if not isinstance(entry, dict) or "path" not in entry:
+        raise ValueError(f"not an eval entry: {str(entry)[:80]}")
+    version = entry.get("schema_version", 0)
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"eval entry of '{entry['path']}' has schema version {version}, "
+                         f"this code reads up to {SCHEMA_VERSION}")
+    upgraded = {LEGACY_KEYS.get(key, key): value for key, value in entry.items()}
+    for metric in eval_metrics([upgraded]):
+        if upgraded.get(mean_key(metric)) is None:
+            upgraded[mean_key(metric)] = mean(upgraded[score_key(metric)] or [])
+    upgraded.setdefault("total_questions", max((len(upgraded[score_key(m)] or []) for m in eval_metrics([upgraded])),
+                                               default=0))
+    upgraded["schema_version"] = SCHEMA_VERSION
+    upgraded.setdefault("run_id", None)
+    return upgraded
+
+
+def load_results(path, metrics=None) -> List[EvalEntry]:
+    """Eval entries of a .json or columnar eval file, in the current layout."""
+    return [upgrade_entry(entry) for entry in load_eval(path, metrics=metrics)]
+
+
+def metric_mean(entry, metric):
+    return upgrade_entry(entry).get(mean_key(metric))
+
+
+def metric_scores(entry, metric):
+    return upgrade_entry(entry).get(score_key(metric)) or []
+
+
+## --- run manifests ---
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def dataset_hash(records):
+    """Hash of the evaluated questions and reference answers, equal for every retriever answering the same set."""
+    return stable_hash(sorted([str(record.get("question")), str(record.get("ref_answer"))] for record in records))
+
+
+def new_run(evaluator, models, output_file) -> RunManifest:
+    """Manifest of an evaluation run, completed by add_answer_file / finish_run."""
+    run_id = f"{evaluator}-{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    _run_starts[run_id] = time.perf_counter()
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "run_id": run_id,
+        "evaluator": evaluator,
+        "output_file": output_file,
+        "models": models,
+        "started_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "finished_at": None,
+        "seconds": None,
+        "answer_files": {},
+        "tokens": {},
+    }
+
+
+def upgrade_manifest(manifest) -> RunManifest:
+    """Copy of a run manifest in the current layout; raises ValueError for manifests it can't read."""
+    if not isinstance(manifest, dict) or not manifest.get("run_id"):
+        raise ValueError(f"not a run manifest: {str(manifest)[:80]}")
+    version = manifest.get("schema_version", 0)
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"manifest of run '{manifest['run_id']}' has schema version {version}, "
+                         f"this code reads up to {SCHEMA_VERSION}")
+    upgraded = {"evaluator": None, "output_file": None, "models": {}, "started_at": None, "finished_at": None,
+                "seconds": None, "answer_files": {}, "tokens": {}}
+    upgraded.update({key: value for key, value in manifest.items() if not key.startswith("_")})
+    upgraded["schema_version"] = SCHEMA_VERSION
+    return upgraded
+
+
+def add_answer_file(manifest: RunManifest, path, records, seconds):
+    """Record an evaluated answer file: its dataset hash, the retriever configs and models that produced it."""
+    # answer records carry "<question hash>:<retriever config hash>:<model>" checkpoint keys
+    keys = [record[KEY_FIELD].split(":", 2) for record in records if record.get(KEY_FIELD)]
+    manifest["answer_files"][path] = {
+        "retriever": retriever_name(path),
+        "questions": len(records),
+        "dataset_hash": dataset_hash(records),
+        "file_hash": file_hash(path) if os.path.exists(path) else None,
+        "retriever_configs": sorted({key[1] for key in keys if len(key) == 3}),
+        "generation_models": sorted({key[2] for key in keys if len(key) == 3}),
+        "seconds": round(seconds, 3),
+    }
+
+
+def finish_run(manifest: RunManifest, tokens=None) -> RunManifest:
+    manifest["finished_at"] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    start = _run_starts.pop(manifest["run_id"], None)
+    manifest["seconds"] = round(time.perf_counter() - start, 3) if start is not None else None
+    manifest["tokens"] = tokens or {}
+    return manifest
+
+
+def manifests_path(eval_path):
+    return os.path.splitext(eval_path)[0] + "_manifests.jsonl"
+
+
+def append_manifest(manifest: RunManifest, eval_path):
+    with open(manifests_path(eval_path), 'a') as f:
+        f.write(json.dumps(manifest) + "\n")
+
+
+def read_manifests(eval_path) -> List[RunManifest]:
+    path = manifests_path(eval_path)
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return [upgrade_manifest(json.loads(line)) for line in f if line.strip()]
+
+
+def legacy_manifest(eval_path, entries) -> RunManifest:
+    """Manifest standing in for the unknown run that wrote an eval file without one."""
+    metrics = eval_metrics(entries)
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "run_id": f"legacy-{file_hash(eval_path)[:12]}",
+        "evaluator": "llm_as_judge" if metrics == [JUDGE_METRIC] else "ragas",
+        "output_file": eval_path,
+        "models": {},
+        "started_at": None,
+        "finished_at": time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(os.path.getmtime(eval_path))),
+        "seconds": None,
+        "answer_files": {entry["path"]: {"retriever": retriever_name(entry["path"]),
+                                         "questions": entry.get("total_questions")} for entry in entries},
+        "tokens": {},
+    }
+
+
+## --- indexed store ---
+
+class ResultStore:
+    """SQLite index of run manifests and per (run, answer file, metric) means."""
+
+    def __init__(self, path=RESULTS_DB):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS runs (
+                               run_id TEXT PRIMARY KEY,
+                               schema_version INTEGER NOT NULL,
+                               evaluator TEXT,
+                               output_file TEXT,
+                               started_at TEXT,
+                               finished_at TEXT,
+                               manifest TEXT NOT NULL)""")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS results (
+                               run_id TEXT NOT NULL,
+                               path TEXT NOT NULL,
+                               retriever TEXT NOT NULL,
+                               metric TEXT NOT NULL,
+                               mean REAL,
+                               questions INTEGER,
+                               PRIMARY KEY (run_id, path, metric))""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS results_metric ON results(metric, retriever)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS results_retriever ON results(retriever)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS runs_finished ON runs(finished_at)")
+        self.db.commit()
+
+    def add_run(self, manifest: RunManifest, entries):
+        """Index a run and the means of the eval entries it wrote; entries of other runs, or without a run_id,
+        are left to theirs (ingest gives entries without one a legacy run)."""
+        manifest = upgrade_manifest(manifest)
+        run_id = manifest["run_id"]
+        self.db.execute("INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (run_id, manifest["schema_version"], manifest.get("evaluator"), manifest.get("output_file"),
+                         manifest.get("started_at"), manifest.get("finished_at"), json.dumps(manifest)))
+        self.db.execute("DELETE FROM results WHERE run_id = ?", (run_id,))
+        rows = []
+        for entry in map(upgrade_entry, entries):
+            if entry["run_id"] != run_id:
+                continue
+            for metric in eval_metrics([entry]):
+                rows.append((run_id, entry["path"], retriever_name(entry["path"]), metric, entry[mean_key(metric)],
+                             len(entry[score_key(metric)] or [])))
+        self.db.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self.db.commit()
+        return len(rows)
+
+    def ingest(self, eval_path):
+        """Index an eval file: the runs of its manifests file, and a legacy run for entries without a run_id."""
+        entries = load_results(eval_path)
+        added = 0
+        for manifest in read_manifests(eval_path):
+            added += self.add_run(manifest, [entry for entry in entries if entry["run_id"] == manifest["run_id"]])
+        legacy = [entry for entry in entries if entry["run_id"] is None]
+        if legacy:  # written before run manifests: one stand-in run owns them all
+            manifest = legacy_manifest(eval_path, legacy)
+            added += self.add_run(manifest, [dict(entry, run_id=manifest["run_id"]) for entry in legacy])
+        return added
+
+    def query(self, metric=None, retriever=None, evaluator=None, since=None):
+        """Means per (run, answer file, metric), newest runs first; every filter is optional."""
+        conditions, values = [], []
+        for column, value in (("results.metric", metric), ("results.retriever", retriever),
+                              ("runs.evaluator", evaluator)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                values.append(value)
+        if since is not None:
+            conditions.append("runs.finished_at >= ?")
+            values.append(since)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self.db.execute(f"""SELECT runs.run_id, runs.evaluator, runs.finished_at, results.path,
+                                          results.retriever, results.metric, results.mean, results.questions
+                                   FROM results JOIN runs ON runs.run_id = results.run_id {where}
+                                   ORDER BY runs.finished_at DESC, results.retriever, results.metric""", values)
+        columns = ["run_id", "evaluator", "finished_at", "path", "retriever", "metric", "mean", "questions"]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def manifest(self, run_id) -> Optional[RunManifest]:
+        row = self.db.execute("SELECT manifest FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def close(self):
+        self.db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index eval results and query metrics across runs")
+    parser.add_argument("--db", default=RESULTS_DB)
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="index eval files (directories are searched recursively)")
+    ingest.add_argument("paths", nargs="+")
+    query = commands.add_parser("query", help="print the indexed means")
+    query.add_argument("--metric")
+    query.add_argument("--retriever")
+    query.add_argument("--evaluator")
+    query.add_argument("--since", help="runs finished at or after this ISO date")
+    show = commands.add_parser("manifest", help="print the manifest of a run")
+    show.add_argument("run_id")
+    args = parser.parse_args()
+
+    store = ResultStore(args.db)
+    if args.command == "ingest":
+        start = time.perf_counter()
+        for path in args.paths:
+            files = [path] if os.path.isfile(path) else glob.glob(os.path.join(path, "**", "eval*.json"), recursive=True)
+            for eval_path in sorted(files):
+                if os.path.splitext(eval_path)[0].endswith(("_progress", "_comparison")):
+                    continue
+                try:
+                    print(f"{store.ingest(eval_path):5} results from '{eval_path}'")
+                except (OSError, ValueError) as e:
+                    print(f"Skipping '{eval_path}': {e}")
+        print(f"Indexed in {time.perf_counter() - start:.2f}s -> '{args.db}'")
+    elif args.command == "query":
+        rows = store.query(args.metric, args.retriever, args.evaluator, args.since)
+        print(f"{'run':42} {'finished':19} {'retriever':28} {'metric':22} {'mean':>7} {'n':>5}")
+        for row in rows:
+            score = "n/a" if row["mean"] is None else f"{row['mean']:.3f}"
+            print(f"{row['run_id']:42} {row['finished_at'] or '':19} {row['retriever']:28} {row['metric']:22} "
+                  f"{score:>7} {row['questions']:>5}")
+        print(f"{len(rows)} results")
+    else:
+        print(json.dumps(store.manifest(args.run_id), indent=1))
+    store.close()
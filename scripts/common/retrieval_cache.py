@@ -0,0 +1,135 @@
+## On-disk cache of Elasticsearch retrieval results
+## Hits are keyed by (index, normalized query body, question) and stored zlib-compressed in SQLite,
+## together with a fingerprint of the index's _stats (uuid, doc counts, indexing and refresh totals).
+## When the index is reindexed or refreshed with new data the fingerprint changes and the entry is
+## treated as a miss, so prompt / model sweeps reuse retrieval without serving stale hits.
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+GENERATION_METRICS = "docs,indexing,refresh"
+
+
+def retrieval_key(index, body, question):
+    payload = json.dumps([index, body, " ".join(str(question).split())], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def index_generation(stats):
+    """Fingerprint of the indices in an `indices.stats(metric=GENERATION_METRICS)` response."""
+    state = []
+    for name, entry in sorted(stats.get("indices", {}).items()):
+        primaries = entry.get("primaries", {})
+        state.append([
+            name,
+            entry.get("uuid"),
+            primaries.get("docs", {}).get("count"),
+            primaries.get("docs", {}).get("deleted"),
+            primaries.get("indexing", {}).get("index_total"),
+            primaries.get("indexing", {}).get("delete_total"),
+            primaries.get("refresh", {}).get("total"),
+        ])
+    return hashlib.sha256(json.dumps(state).encode("utf-8")).hexdigest()[:16]
+
+
+class RetrievalCache:
+    """SQLite store of compressed `hits` lists. Safe to share between threads."""
+
+    def __init__(self, path, name="retrieval"):
+        self.path = path
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        # index name -> generation fingerprint, looked up once per run (see search_hits)
+        self.generations = {}
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS retrievals (
+                               key TEXT PRIMARY KEY,
+                               generation TEXT NOT NULL,
+                               hits BLOB NOT NULL,
+                               created REAL NOT NULL)""")
+        self.db.commit()
+
+    def get(self, index, body, question):
+        """Cached hits for this search at the index's current generation, or None."""
+        key = retrieval_key(index, body, question)
+        with self.lock:
+            row = self.db.execute("SELECT generation, hits FROM retrievals WHERE key = ?", (key,)).fetchone()
+            if row is None or row[0] != self.generations.get(index):
+                self.misses += 1
+                self.stale += row is not None
+                return None
+            self.hits += 1
+        return json.loads(zlib.decompress(row[1]))
+
+    def put(self, index, body, question, hits):
+        key = retrieval_key(index, body, question)
+        data = zlib.compress(json.dumps(hits, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO retrievals (key, generation, hits, created) VALUES (?, ?, ?, ?)",
+                            (key, self.generations.get(index, ""), data, time.time()))
+            self.db.commit()
+
+    def print_stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups * 100 if lookups else 0
+        print(f"{self.name} cache: {self.hits} hits, {self.misses} misses ({self.stale} stale, "
+              f"{hit_rate:.1f}% hit rate) in '{self.path}'")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def cached_search(cache, index, body, question, metrics=None, retriever=None):
+    """(hits of `cache` for this search or None, start time of the search); a hit is recorded as a cached search."""
+    start = time.perf_counter()
+    hits = cache.get(index, body, question) if cache is not None else None
+    if hits is not None and metrics:
+        metrics.es("search", start, retriever=retriever, question=question, cached=True)
+    return hits, start
+
+
+def searched_hits(cache, index, body, question, response, start, metrics=None, retriever=None):
+    """Hits of a search `response`, recorded in `metrics` and stored in `cache`."""
+    if metrics:
+        metrics.es("search", start, response, retriever, question)
+    hits = response["hits"]["hits"]
+    if cache is not None:
+        cache.put(index, body, question, hits)
+    return hits
+
+
+def search_hits(es_client, cache, index, body, question, metrics=None, retriever=None):
+    """
+    `es_client.search(...)["hits"]["hits"]`, answered from `cache` when it holds a current entry; the search
+    (latency and ES `took`) is recorded in `metrics` (common.call_metrics.CallMetrics) when given.
+    """
+    if cache is not None and index not in cache.generations:
+        cache.generations[index] = index_generation(es_client.indices.stats(index=index, metric=GENERATION_METRICS))
+    hits, start = cached_search(cache, index, body, question, metrics, retriever)
+    if hits is not None:
+        return hits
+    return searched_hits(cache, index, body, question, es_client.search(index=index, body=body), start,
+                         metrics, retriever)
+
+
+async def async_search_hits(es_client, cache, index, body, question, metrics=None, retriever=None):
+    """search_hits with an AsyncElasticsearch client."""
+    if cache is not None and index not in cache.generations:
+        stats = await es_client.indices.stats(index=index, metric=GENERATION_METRICS)
+        cache.generations[index] = index_generation(stats)
+    hits, start = cached_search(cache, index, body, question, metrics, retriever)
+    if hits is not None:
+        return hits
+    response = await es_client.search(index=index, body=body)
+    return searched_hits(cache, index, body, question, response, start, metrics, retriever)
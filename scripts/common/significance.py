@@ -0,0 +1,175 @@
+## Paired statistics for comparing retrievers on the same questions
+## Scores come from eval files (total_scores / total_scores_<metric> per answer file) as a [retriever, question]
+## matrix whose columns are joined on the entries' question_ids, so files that scored different question sets
+## are still paired question by question. Bootstrap resamples are turned into per-question draw counts, so the
+## means of a block of resamples are one matrix product; permutation tests flip the signs of the paired
+## differences the same way. Both work in blocks of at most BLOCK_ELEMENTS values, so time grows linearly with
+## the questions and memory stays flat.
+import numpy as np
+
+from common.columnar import JUDGE_METRIC, retriever_name
+
+N_RESAMPLES = 10000
+CONFIDENCE = 0.95
+BLOCK_ELEMENTS = 1 << 22
+# per-question ids (common.checkpoint.question_hash) of an eval entry, in the order of its scores
+QUESTION_IDS = "question_ids"
+
+
+def score_key(metric):
+    return "total_scores" if metric == JUDGE_METRIC else f"total_scores_{metric}"
+
+
+def eval_metrics(entries):
+    """Metrics with per-question scores in the eval entries (JUDGE_METRIC for the LLM judge's total_scores)."""
+    metrics = sorted({key[len("total_scores_"):] for entry in entries for key in entry
+                      if key.startswith("total_scores_")})
+    if any("total_scores" in entry for entry in entries):
+        metrics.append(JUDGE_METRIC)
+    return metrics
+
+
+def join_keys(question_ids):
+    """(question id, occurrence) per position, so a question asked twice pairs with its same occurrence elsewhere."""
+    seen = {}
+    keys = []
+    for question_id in question_ids:
+        keys.append((question_id, seen.get(question_id, 0)))
+        seen[question_id] = seen.get(question_id, 0) + 1
+    return keys
+
+
+def score_matrix(entries, metric, require_ids=False):
+    """
+    (retriever names, question ids, [retriever, question] float scores); missing scores are nan.
+    Entries are joined on their question_ids, so a question missing from one file doesn't shift the others.
+    When an entry has no ids the scores are placed by position and the ids are None, or, with require_ids,
+    ValueError is raised.
+    """
+    names = []
+    for entry in entries:  # older eval files can hold several runs of the same answer file
+        name = retriever_name(entry["path"])
+        repeats = sum(existing == name or existing.startswith(f"{name} (") for existing in names)
+        names.append(f"{name} ({repeats + 1})" if repeats else name)
+    rows = [[np.nan if score is None else score for score in entry.get(score_key(metric)) or []] for entry in entries]
+    without_ids = [entry["path"] for entry in entries if not entry.get(QUESTION_IDS)]
+    if without_ids and require_ids:
+        raise ValueError(f"no {QUESTION_IDS} in the eval entries of {', '.join(without_ids)}; "
+                         f"evaluate them again to get scores that can be paired by question")
+    if without_ids:
+        scores = np.full((len(rows), max((len(row) for row in rows), default=0)), np.nan)
+        for i, row in enumerate(rows):
+            scores[i, :len(row)] = row
+        return names, None, scores
+
+    keys = [join_keys(entry[QUESTION_IDS]) for entry in entries]
+    columns = {}
+    for entry_keys in keys:
+        for key in entry_keys:
+            columns.setdefault(key, len(columns))
+    scores = np.full((len(rows), len(columns)), np.nan)
+    for i, (entry, row) in enumerate(zip(entries, rows)):
+        if row and len(row) != len(keys[i]):
+            raise ValueError(f"'{entry['path']}' has {len(row)} {metric} scores for {len(keys[i])} question ids")
+        scores[i, [columns[key] for key in keys[i][:len(row)]]] = row
+    return names, [question_id for question_id, _ in columns], scores
+
+
+def blocks(n_resamples, n_questions):
+    """Sizes of the resample blocks, each holding at most BLOCK_ELEMENTS question draws."""
+    size = max(1, BLOCK_ELEMENTS // max(n_questions, 1))
+    return [min(size, n_resamples - start) for start in range(0, n_resamples, size)]
+
+
+def bootstrap_means(scores, n_resamples=N_RESAMPLES, rng=None):
+    """[resample, retriever] means over questions resampled with replacement, the same resample for every retriever."""
+    rng = rng or np.random.default_rng(0)
+    n = scores.shape[1]
+    means = []
+    for size in blocks(n_resamples, n):
+        # one bincount over row-offset draws gives the [resample, question] counts of the whole block
+        draws = rng.integers(0, n, size=(size, n)) + np.arange(size)[:, None] * n
+        counts = np.bincount(draws.ravel(), minlength=size * n).reshape(size, n)
+        means.append(counts @ scores.T / n)
+    return np.vstack(means)
+
+
+def permutation_pvalues(differences, n_resamples=N_RESAMPLES, rng=None):
+    """Two-sided paired permutation (sign-flip) p-values of the mean of each row of [pair, question] differences."""
+    rng = rng or np.random.default_rng(0)
+    n = differences.shape[1]
+    observed = np.abs(differences.mean(axis=1))
+    extreme = np.zeros(len(differences))
+    for size in blocks(n_resamples, n):
+        signs = rng.integers(0, 2, size=(size, n)) * 2.0 - 1.0
+        extreme += (np.abs(signs @ differences.T / n) >= observed - 1e-12).sum(axis=0)
+    return (extreme + 1) / (n_resamples + 1)
+
+
+def win_loss(scores):
+    """[i, j] number of questions where retriever i scores higher than retriever j."""
+    return (scores[:, None, :] > scores[None, :, :]).sum(axis=2)
+
+
+def interval(samples, confidence=CONFIDENCE):
+    """Percentile interval of bootstrap samples along axis 0."""
+    tail = (1 - confidence) / 2 * 100
+    return np.percentile(samples, tail, axis=0), np.percentile(samples, 100 - tail, axis=0)
+
+
+def mean_intervals(entries, metric, n_resamples=N_RESAMPLES, confidence=CONFIDENCE, seed=0):
+    """(low, high) bootstrap interval of each entry's mean over all of its own scores, e.g. for error bars."""
+    rng = np.random.default_rng(seed)
+    intervals = []
+    for row in score_matrix(entries, metric)[2]:
+        row = row[np.isfinite(row)]
+        if not len(row):
+            intervals.append((np.nan, np.nan))
+            continue
+        low, high = interval(bootstrap_means(row[None, :], n_resamples, rng), confidence)
+        intervals.append((float(low[0]), float(high[0])))
+    return intervals
+
+
+def compare(entries, metric, n_resamples=N_RESAMPLES, confidence=CONFIDENCE, seed=0):
+    """
+    Per-retriever means with bootstrap confidence intervals over the questions each retriever scored and, for
+    every pair, over the questions both scored: the mean paired difference with its interval, the permutation
+    p-value and the per-question wins / losses / ties.
+
+    Scores are paired by question id; entries without question_ids raise ValueError instead of being paired
+    by position.
+    """
+    names, ids, scores = score_matrix(entries, metric, require_ids=True)
+    scored = np.isfinite(scores)
+    result = {"metric": metric, "questions": len(ids), "questions_scored_by_all": int(scored.all(axis=0).sum()),
+              "n_resamples": n_resamples, "confidence": confidence, "retrievers": [], "pairs": []}
+    rng = np.random.default_rng(seed)
+    for i, name in enumerate(names):
+        row = scores[i, scored[i]]
+        if not len(row):
+            result["retrievers"].append({"retriever": name, "questions": 0, "mean": None,
+                                         "ci_low": None, "ci_high": None})
+            continue
+        low, high = interval(bootstrap_means(row[None, :], n_resamples, rng), confidence)
+        result["retrievers"].append({"retriever": name, "questions": len(row), "mean": float(row.mean()),
+                                     "ci_low": float(low[0]), "ci_high": float(high[0])})
+
+    # nan never compares greater, so every count is over the questions both retrievers scored
+    wins = win_loss(scores)
+    for i in range(len(names)):
+        for j in range(i + 1, len(names)):
+            both = scored[i] & scored[j]
+            pair = {"a": names[i], "b": names[j], "questions": int(both.sum()), "mean_diff": None, "ci_low": None,
+                    "ci_high": None, "p_value": None, "wins": int(wins[i, j]), "losses": int(wins[j, i]),
+                    "ties": int(both.sum() - wins[i, j] - wins[j, i])}
+            if both.any():
+                paired = scores[[i, j]][:, both]
+                means = bootstrap_means(paired, n_resamples, rng)
+                low, high = interval(means[:, 0] - means[:, 1], confidence)
+                pair.update(mean_diff=float(paired[0].mean() - paired[1].mean()), ci_low=float(low),
+                            ci_high=float(high),
+                            p_value=float(permutation_pvalues(paired[:1] - paired[1:], n_resamples, rng)[0]))
+            result["pairs"].append(pair)
+    result["win_matrix"] = {"retrievers": names, "wins": wins.tolist()}
+    return result
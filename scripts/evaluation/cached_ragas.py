@@ -0,0 +1,97 @@
+## Ragas LLM / embedding wrappers answered from the on-disk caches in common/
+import numpy as np
+from langchain_core.outputs import Generation, LLMResult
+from ragas.embeddings import LangchainEmbeddingsWrapper
+from ragas.llms import LangchainLLMWrapper
+
+from common.llm_cache import cache_key
+
+
+class CachedLangchainLLMWrapper(LangchainLLMWrapper):
+    """LangchainLLMWrapper whose generations are cached by (model, deployment, temperature, prompt, n)."""
+
+    def __init__(self, langchain_llm, cache, **kwargs):
+        super().__init__(langchain_llm, **kwargs)
+        self.response_cache = cache
+        self.usage = {"calls": 0, "cached_calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def _key(self, prompt, n, temperature):
+        llm = self.langchain_llm
+        if temperature is None:  # same default ragas applies before calling the model
+            temperature = self.get_temperature(n=n)
+        return cache_key(getattr(llm, "model_name", None), getattr(llm, "deployment_name", None),
+                         temperature, [prompt.to_string(), n])
+
+    def _from_cache(self, key):
+        cached = self.response_cache.get(key)
+        if cached is None:
+            return None
+        self.usage["cached_calls"] += 1
+        return LLMResult(generations=[[Generation(text=g["text"], generation_info=g["generation_info"])
+                                       for g in cached]])
+
+    def _to_cache(self, key, result):
+        usage = (result.llm_output or {}).get("token_usage") or {}
+        self.usage["calls"] += 1
+        self.usage["prompt_tokens"] += usage.get("prompt_tokens", 0)
+        self.usage["completion_tokens"] += usage.get("completion_tokens", 0)
+        self.response_cache.put(key, [{"text": g.text, "generation_info": g.generation_info}
+                                      for g in result.generations[0]])
+
+    def generate_text(self, prompt, n=1, temperature=None, stop=None, callbacks=None):
+        key = self._key(prompt, n, temperature)
+        result = self._from_cache(key)
+        if result is None:
+            result = super().generate_text(prompt, n=n, temperature=temperature, stop=stop, callbacks=callbacks)
+            self._to_cache(key, result)
+        return result
+
+    async def agenerate_text(self, prompt, n=1, temperature=None, stop=None, callbacks=None):
+        key = self._key(prompt, n, temperature)
+        result = self._from_cache(key)
+        if result is None:
+            result = await super().agenerate_text(prompt, n=n, temperature=temperature, stop=stop,
+                                                  callbacks=callbacks)
+            self._to_cache(key, result)
+        return result
+
+
+class CachedLangchainEmbeddingsWrapper(LangchainEmbeddingsWrapper):
+    """LangchainEmbeddingsWrapper whose vectors are kept in a common.embedding_cache.EmbeddingCache."""
+
+    def __init__(self, embeddings, cache, **kwargs):
+        super().__init__(embeddings, **kwargs)
+        self.embedding_cache = cache
+
+    def _keys(self, texts):
+        embeddings = self.embeddings
+        model, deployment = getattr(embeddings, "model", None), getattr(embeddings, "deployment", None)
+        return [self.embedding_cache.key(model, deployment, text) for text in texts]
+
+    def _split(self, texts):
+        """Return keys, cached vectors (None where missing) and the indices that still need embedding."""
+        keys = self._keys(texts)
+        vectors = self.embedding_cache.get_many(keys)
+        return keys, vectors, [i for i, vector in enumerate(vectors) if vector is None]
+
+    def _merge(self, keys, vectors, missing, computed):
+        self.embedding_cache.put_many([keys[i] for i in missing], computed)
+        for i, vector in zip(missing, computed):
+            vectors[i] = vector
+        return [vector.tolist() if isinstance(vector, np.ndarray) else vector for vector in vectors]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def embed_documents(self, texts):
+        keys, vectors, missing = self._split(texts)
+        computed = super().embed_documents([texts[i] for i in missing]) if missing else []
+        return self._merge(keys, vectors, missing, computed)
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+    async def aembed_documents(self, texts):
+        keys, vectors, missing = self._split(texts)
+        computed = await super().aembed_documents([texts[i] for i in missing]) if missing else []
+        return self._merge(keys, vectors, missing, computed)
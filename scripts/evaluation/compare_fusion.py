@@ -0,0 +1,119 @@
+## Compare fusion strategies for the match + sparse_vector retrievers on cached candidates
+## Uses the candidate lists of sweep_fusion.py (fetched once, then read from ../data/fusion_candidates.json)
+## and fuses them locally with common/fusion.py: RRF, min-max / z-score linear combinations and convex
+## combinations over a grid of alphas. --check-es N replays the registry's rrf retriever on ES for N
+## questions and reports how often the local RRF reproduces its ordering.
+##   python compare_fusion.py --rank-window 20 --alphas 0,0.25,0.5,0.75,1 --check-es 50
+from dotenv import load_dotenv
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'rag_scenarios'))
+from common.fusion import convex, linear, retrieved, rrf, top_k
+from common.ir_metrics import batch_scores
+from eval_retrieval import QUESTIONS_FILE, create_es_client
+from retrievers import SEMANTIC_INDEX, match_query, rrf_query, sparse_vector_query
+from sweep_fusion import CANDIDATES_FILE, SUB_RETRIEVERS, candidate_arrays, load_candidates, msearch, parse_list
+
+# Load environment variables from .env file
+if os.path.exists("../.env"):
+    load_dotenv(override=True)
+
+OUTPUT_FILE_FUSION = '../../data/eval/medical/multi/compare_fusion.csv'
+
+
+def within_window(arrays, rank_window_size):
+    """Ranks and scores with everything past `rank_window_size` dropped, as a sub-retriever window would."""
+    inside = arrays["ranks"] <= rank_window_size
+    return np.where(inside, arrays["ranks"], np.inf), np.where(inside, arrays["scores"], np.nan)
+
+
+def strategies(rank_constants, alphas):
+    """(name, params, fuse(ranks, scores, window)) for every strategy to compare."""
+    first, second = list(SUB_RETRIEVERS)[:2]
+    for constant in rank_constants:
+        yield "rrf", {"rank_constant": constant}, \
+            lambda ranks, scores, window, constant=constant: rrf(ranks, constant, window)
+    for normalizer in ("minmax", "zscore"):
+        yield f"linear_{normalizer}", {"weights": "equal"}, \
+            lambda ranks, scores, window, normalizer=normalizer: linear(scores, [1.0] * len(scores), normalizer)
+        for alpha in alphas:
+            yield f"convex_{normalizer}", {"alpha": alpha, "alpha_on": first, "1-alpha_on": second}, \
+                lambda ranks, scores, window, alpha=alpha, normalizer=normalizer: convex(scores, alpha, normalizer)
+
+
+def compare(arrays, rank_window_size, rank_constants, alphas, size, ks):
+    ranks, scores = within_window(arrays, rank_window_size)
+    keep = retrieved(ranks)
+    rows = []
+    for name, params, fuse in strategies(rank_constants, alphas):
+        order, filled = top_k(fuse(ranks, scores, rank_window_size), keep, size)
+        gains = np.take_along_axis(arrays["relevant"], order, axis=1) & filled
+        rows.append({"strategy": name, **params, **batch_scores(gains, arrays["n_relevant"], ks)})
+    return pd.DataFrame(rows)
+
+
+def check_es_rrf(es_client, candidates, index, rank_constant, rank_window_size, size, batch_size):
+    """Run the ES rrf retriever for `candidates` and count questions whose top `size` ids match the local RRF."""
+    ranks, _ = within_window(candidate_arrays(candidates), rank_window_size)
+    order, filled = top_k(rrf(ranks, rank_constant, rank_window_size), retrieved(ranks), size)
+    bodies = [{"retriever": rrf_query([match_query(candidate["question"]), sparse_vector_query(candidate["question"])],
+                                      rank_window_size=rank_window_size, rank_constant=rank_constant),
+               "size": size, "_source": False}
+              for candidate in candidates]
+    same_order, same_set = 0, 0
+    for q, (candidate, hits) in enumerate(zip(candidates, msearch(es_client, index, bodies, batch_size))):
+        local = [candidate["ids"][column] for column, ok in zip(order[q], filled[q]) if ok]
+        remote = [hit["_id"] for hit in hits]
+        same_order += local == remote
+        same_set += set(local) == set(remote)
+    print(f"ES rrf (rank_constant={rank_constant}, rank_window_size={rank_window_size}, size={size}): "
+          f"local order matches for {same_order}/{len(candidates)} questions, "
+          f"same documents for {same_set}/{len(candidates)} (mismatches usually come from score ties)")
+    return same_order, same_set
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare client-side fusion strategies on cached candidates")
+    parser.add_argument("--questions", default=QUESTIONS_FILE)
+    parser.add_argument("--index", default=SEMANTIC_INDEX)
+    parser.add_argument("--window", type=int, default=50, help="hits fetched per sub-retriever and question")
+    parser.add_argument("--batch-size", type=int, default=50, help="searches per _msearch request")
+    parser.add_argument("--candidates", default=CANDIDATES_FILE)
+    parser.add_argument("--refresh", action="store_true", help="refetch the candidates even if cached")
+    parser.add_argument("--rank-window", type=int, default=20, help="hits of each sub-retriever taken into the fusion")
+    parser.add_argument("--rank-constants", default="60,200")
+    parser.add_argument("--alphas", default="0,0.1,0.2,0.3,0.4,0.5,0.6,0.7,0.8,0.9,1")
+    parser.add_argument("--size", type=int, default=3)
+    parser.add_argument("--sort-by", default="ndcg@3")
+    parser.add_argument("--check-es", type=int, default=0, metavar="N",
+                        help="compare the local RRF with the ES rrf retriever on the first N questions")
+    parser.add_argument("--output", default=OUTPUT_FILE_FUSION)
+    args = parser.parse_args()
+
+    if args.rank_window > args.window:
+        parser.error(f"--rank-window {args.rank_window} is larger than the fetched --window {args.window}")
+
+    candidates = load_candidates(args.candidates, args.questions, args.index, args.window, args.batch_size,
+                                 refresh=args.refresh)
+    ks = tuple(k for k in (1, 3, 5, 10) if k <= args.size) or (args.size,)
+    start = time.perf_counter()
+    df = compare(candidate_arrays(candidates), args.rank_window, parse_list(args.rank_constants, int),
+                 parse_list(args.alphas), args.size, ks)
+    print(f"Scored {len(df)} fusion configurations in {time.perf_counter() - start:.2f}s\n")
+    df = df.sort_values(args.sort_by, ascending=False)
+    df.to_csv(args.output, index=False)
+    print(df.round(3).to_string(index=False))
+
+    if args.check_es:
+        es_client = create_es_client()
+        print()
+        for constant in parse_list(args.rank_constants, int):
+            check_es_rrf(es_client, candidates[:args.check_es], args.index, constant, args.rank_window,
+                         args.size, args.batch_size)
@@ -0,0 +1,69 @@
+## Paired significance of the differences between retrievers in an eval file
+## For every metric of eval.json / eval_ragas.json (or their Parquet / Arrow copies): per-retriever means with
+## bootstrap confidence intervals, and for every pair of retrievers the mean difference with its interval,
+## a paired permutation p-value and per-question wins / losses / ties. Scores are paired by the question ids the
+## evaluators store in each entry; eval files written without them are refused. Results go to <eval>_comparison.json,
+## which the print_results bar charts use for their error bars.
+##   python compare_results.py ../../data/eval/medical/multi/eval_ragas.json --resamples 10000
+import argparse
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.columnar import load_eval
+from common.significance import CONFIDENCE, N_RESAMPLES, compare, eval_metrics
+
+EVAL_FILE = '../../data/eval/medical/multi/eval.json'
+
+
+def comparison_path(eval_path):
+    return os.path.splitext(eval_path)[0] + '_comparison.json'
+
+
+def print_comparison(result):
+    print(f"\n== {result['metric']}: {result['questions']} questions, {result['questions_scored_by_all']} scored by "
+          f"every retriever; {result['confidence'] * 100:.0f}% bootstrap intervals, each pair over the questions "
+          f"both retrievers scored")
+    if not result["retrievers"]:
+        return
+    print(pd.DataFrame(result["retrievers"]).set_index("retriever").round(3).to_string())
+    if result["pairs"]:
+        pairs = pd.DataFrame(result["pairs"])
+        pairs[["p_value", "ci_low", "ci_high"]] = pairs[["p_value", "ci_low", "ci_high"]].astype(float)
+        pairs["significant"] = (pairs["p_value"] < 1 - result["confidence"]) & \
+                               ((pairs["ci_low"] > 0) | (pairs["ci_high"] < 0))
+        print()
+        print(pairs.round(4).to_string(index=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bootstrap intervals, permutation tests and win/loss counts "
+                                                 "between the retrievers of an eval file")
+    parser.add_argument("eval_path", nargs="?", default=EVAL_FILE)
+    parser.add_argument("--metrics", help="comma separated metrics (default: every metric in the file)")
+    parser.add_argument("--resamples", type=int, default=N_RESAMPLES)
+    parser.add_argument("--confidence", type=float, default=CONFIDENCE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="default: <eval_path>_comparison.json")
+    args = parser.parse_args()
+
+    entries = load_eval(args.eval_path)
+    metrics = args.metrics.split(",") if args.metrics else eval_metrics(entries)
+    start = time.perf_counter()
+    try:
+        results = [compare(entries, metric, args.resamples, args.confidence, args.seed) for metric in metrics]
+    except ValueError as e:
+        sys.exit(f"Cannot compare the retrievers of '{args.eval_path}': {e}")
+    print(f"Compared {len(entries)} retrievers on {len(metrics)} metrics with {args.resamples} resamples "
+          f"in {time.perf_counter() - start:.2f}s")
+    for result in results:
+        print_comparison(result)
+
+    output = args.output or comparison_path(args.eval_path)
+    with open(output, 'w') as f:
+        json.dump({"eval_path": args.eval_path, "comparisons": results}, f, indent=4)
+    print(f"\nWritten to '{output}'")
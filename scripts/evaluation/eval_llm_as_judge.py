@@ -4,8 +4,10 @@ from langchain.docstore.document import Document as LangchainDocument
 from openai import AzureOpenAI
 from langchain.chat_models import AzureChatOpenAI
 import os
+import sys
 import csv
 import json
+import time
 from dotenv import load_dotenv
 from dotenv import dotenv_values
 import random
@@ -17,7 +19,16 @@ from langchain.prompts.chat import (
     ChatPromptTemplate,
     HumanMessagePromptTemplate,
 )
-from langchain.schema import SystemMessage
+from langchain.schema import HumanMessage, SystemMessage
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.call_metrics import CallMetrics
+from common.checkpoint import CheckpointLog, checkpoint_key, question_hash
+from common.columnar import JUDGE_METRIC, eval_to_table, load_answers, retriever_name, write_table
+from common.judge_output import JUDGE_FORMAT, Judge
+from common.llm_cache import CachedChatModel, ResponseCache
+from common.results import (ResultStore, add_answer_file, append_manifest, finish_run, mean, new_run,
+                            result_entry, upgrade_entry)
 
 # Load environment variables from .env file
 if os.path.exists("../.env"):
@@ -32,6 +43,15 @@ ENGINE = os.getenv("AZURE_OPENAI_DEPLOYMENT")
 MODEL = os.getenv("AZURE_OPENAI_MODEL")
 ANSWER_PATH = ["../data/fulltext_answers.json", "../data/hybrid_answers.json", "../data/vector_answers.json", "../data/rerank_answers.json"]
 OUTPUT_FILE_EVALUATION = '../../data/eval/medical/multi/eval.json'
+# per-question judge results, so an interrupted run resumes where it stopped
+PROGRESS_FILE_EVALUATION = os.path.splitext(OUTPUT_FILE_EVALUATION)[0] + '_progress.json'
+# one row per (answer file, question), read column-wise by the plots
+OUTPUT_FILE_SCORES = os.path.splitext(OUTPUT_FILE_EVALUATION)[0] + '.parquet'
+LLM_CACHE_FILE = '../data/llm_cache.sqlite'
+# run manifests and per-metric means of every eval file, queried by common/results.py
+RESULTS_DB = '../../data/eval/results.sqlite'
+# tokens, latency and re-asks of every judge call, one JSON line each (summary: python ../common/call_metrics.py <file>)
+METRICS_FILE = '../data/metrics/llm_as_judge.jsonl'
 
 
 openai_client = AzureOpenAI(api_version=API_VERSION,
@@ -90,67 +110,117 @@ if __name__ == "__main__":
     output_file = OUTPUT_FILE_EVALUATION
     try:  # load previous generations if they exist
         with open(output_file, "r") as out_f:
-            outputs = json.load(out_f)
+            outputs = [upgrade_entry(entry) for entry in json.load(out_f)]
     except:
         outputs = []
-
+    progress = CheckpointLog(PROGRESS_FILE_EVALUATION)
+    manifest = new_run("llm_as_judge", {"judge": MODEL, "deployment": ENGINE, "api_version": API_VERSION},
+                       output_file)
+    llm_cache = ResponseCache(LLM_CACHE_FILE)
+    judge_client = CachedChatModel(llm_client, llm_cache)
+    # JSON verdicts through structured outputs, free-text parsing as fallback, malformed items asked again
+    judge = Judge(JUDGE_FORMAT, name="llm_as_judge")
+    call_metrics = CallMetrics(METRICS_FILE, name="llm_as_judge")
+
+    failed_files = []  # (path, error) of answer files that could not be evaluated
     for path in ANSWER_PATH:
         print(f"Loading: File '{path}'")
 
         if not os.path.exists(path):
             print(f"Error: File '{path}' not found.")
+            failed_files.append((path, "not found"))
+            continue
 
         try:
-            with open(path, 'r') as file:
-                data = json.load(file)
-                total_scores = []
-                for doc in data:
-
-                    question = doc.get('question')
-                    context = doc.get('retrieved_context')
-                    ref_anwser = doc.get('ref_answer')
-                    generated_answer = doc.get('generated_answer')
-
+            file_start = time.perf_counter()
+            # answer files may be .json or .parquet / .arrow (common/columnar.py)
+            data = load_answers(path, columns=["question", "ref_answer", "generated_answer", "checkpoint_key"])
+            total_scores = []
+            unparsed = 0
+            for doc in data:
+
+                question = doc.get('question')
+                ref_anwser = doc.get('ref_answer')
+                generated_answer = doc.get('generated_answer')
+
+                key = checkpoint_key(question, {"evaluator": "llm_as_judge", "path": path, "answer": generated_answer}, MODEL)
+                judged = progress.get(key)
+                if judged is None:
                     eval_prompt = evaluation_prompt_template.format_messages(
                         instruction=question,
                         response=generated_answer,
                         reference_answer=ref_anwser,
                     )
 
-                    eval_result = llm_client.invoke(eval_prompt)
-
-                    feedback, score = [
-                        item.strip() for item in eval_result.content.split("[RESULT]")
-                    ]
-
-                    total_scores.append(int(score))
-
-                    print(f"Question: {question}")
-                    print(f"Ref: {ref_anwser}")
-                    print(f"Answer: {generated_answer}")
-                    print(f"score: {score}")
-                    print(f"feedback: {feedback}")
-                    print("-" * 50)  # Print a separator between rows
-
-                if total_scores:
-                    average_score = sum(total_scores) / len(total_scores)
-                    print(f"\nAverage Score: {average_score:.2f}/5.00")
-                    print(f"Total Evaluated: {len(total_scores)} questions")
-                    print(f"\nfile: {path}")
-
-                    result = {
-                        "average_score": average_score,
-                        "total_questions": len(total_scores),
-                        "path": path,
-                        "total_scores": total_scores
-                    }
-                    outputs.append(result)
-
-                    with open(output_file, "w") as f:
-                        json.dump(outputs, f)
-                else:
-                    print("No valid scores were calculated")
+                    def call(options, reminder, eval_prompt=eval_prompt, question=question):
+                        messages = (eval_prompt + [HumanMessage(content=reminder)]) if reminder else eval_prompt
+                        start = time.perf_counter()
+                        # only parsable verdicts are cached, so a failed item is asked again on the next run
+                        response = judge_client.invoke(messages, accept=judge.parses, **options)
+                        call_metrics.llm("judge", start, response, retriever_name(path), question, MODEL,
+                                         retries=int(bool(reminder)),
+                                         cached=response.response_metadata.get("cached", False))
+                        return response.content
+
+                    verdict = judge.judge(call)
+                    if verdict is None:  # not checkpointed, so the next run asks again
+                        unparsed += 1
+                        print(f"No parsable verdict for '{question[:60]}', no score")
+                        # None keeps the positions of the later scores aligned with the questions
+                        total_scores.append(None)
+                        continue
+                    judged = progress.add(key, {"path": path, "question": question, **verdict})
+                feedback, score = judged["feedback"], judged["score"]
+
+                total_scores.append(int(score))
+
+                print(f"Question: {question}")
+                print(f"Ref: {ref_anwser}")
+                print(f"Answer: {generated_answer}")
+                print(f"score: {score}")
+                print(f"feedback: {feedback}")
+                print("-" * 50)  # Print a separator between rows
+
+            if unparsed < len(total_scores):
+                average_score = mean(total_scores)  # over the parsed verdicts
+                print(f"\nAverage Score: {average_score:.2f}/5.00")
+                print(f"Total Evaluated: {len(total_scores) - unparsed} questions "
+                      f"({unparsed} without a parsable verdict)")
+                print(f"\nfile: {path}")
+
+                result = result_entry(path, {JUDGE_METRIC: total_scores}, manifest["run_id"],
+                                      question_ids=[question_hash(doc.get('question')) for doc in data],
+                                      unparsed_questions=unparsed)
+                add_answer_file(manifest, path, data, time.perf_counter() - file_start)
+                # replace a previous result for the same file instead of duplicating it
+                outputs = [entry for entry in outputs if entry.get("path") != path]
+                outputs.append(result)
+
+                with open(output_file, "w") as f:
+                    json.dump(outputs, f)
+                write_table(eval_to_table(outputs), OUTPUT_FILE_SCORES)
+            else:
+                print("No valid scores were calculated")
 
 
         except Exception as e:
-            print(f"Error processing file: {e}")
+            print(f"Error processing file '{path}': {e.__class__.__name__}: {e}")
+            failed_files.append((path, f"{e.__class__.__name__}: {e}"))
+
+    progress.close()
+    finish_run(manifest, tokens=judge_client.usage)
+    append_manifest(manifest, output_file)
+    results = ResultStore(RESULTS_DB)
+    results.add_run(manifest, outputs)
+    results.close()
+    print(f"Run {manifest['run_id']}: {len(manifest['answer_files'])} answer files in {manifest['seconds']:.1f}s, "
+          f"{judge_client.usage['prompt_tokens']} prompt / {judge_client.usage['completion_tokens']} completion tokens")
+    judge.print_stats()
+    llm_cache.print_stats()
+    call_metrics.print_summary()
+    call_metrics.close()
+    if failed_files:
+        print(f"\n{len(failed_files)} of {len(ANSWER_PATH)} answer files failed:")
+        for path, error in failed_files:
+            print(f"  {path}: {error}")
+        sys.exit(1)
@@ -3,7 +3,12 @@ from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings
 from ragas.llms import LangchainLLMWrapper
 from ragas.embeddings import LangchainEmbeddingsWrapper
 import os
+import sys
 import json
+import math
+import time
+import argparse
+import pandas as pd
 from dotenv import load_dotenv
 from dotenv import dotenv_values
 
@@ -12,6 +17,15 @@ from ragas import evaluate,RunConfig
 from ragas.metrics import Faithfulness, AnswerRelevancy, context_precision, LLMContextPrecisionWithReference
 from ragas.metrics import LLMContextRecall
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.checkpoint import CheckpointLog, checkpoint_key, question_hash
+from common.columnar import contexts_of, eval_to_table, load_answers, write_table
+from common.llm_cache import ResponseCache
+from common.results import (ResultStore, add_answer_file, append_manifest, finish_run, mean, new_run,
+                            result_entry, upgrade_entry)
+from common.embedding_cache import EmbeddingCache
+from cached_ragas import CachedLangchainLLMWrapper, CachedLangchainEmbeddingsWrapper
+
 
 # Load environment variables from .env file
 if os.path.exists("../.env"):
@@ -26,6 +40,15 @@ ENGINE = os.getenv("AZURE_OPENAI_DEPLOYMENT")
 MODEL = os.getenv("AZURE_OPENAI_MODEL")
 ANSWER_PATH = ["../data/law_en_fulltext_answers.json","../data/law_en_bge_answers.json", "../data/law_en_hybrid_bge_answers.json", "../data/law_en_hybrid_linear_bge_answers.json", "../data/law_en_hybrid_rerank_bge_answers.json"]
 OUTPUT_FILE_EVALUATION = '../../data/eval/medical/multi/eval_ragas.json'
+# per-question scores, so an interrupted run resumes where it stopped
+PROGRESS_FILE_EVALUATION = os.path.splitext(OUTPUT_FILE_EVALUATION)[0] + '_progress.json'
+# one row per (answer file, question), read column-wise by the plots
+OUTPUT_FILE_SCORES = os.path.splitext(OUTPUT_FILE_EVALUATION)[0] + '.parquet'
+LLM_CACHE_FILE = '../data/llm_cache.sqlite'
+# run manifests and per-metric means of every eval file, queried by common/results.py
+RESULTS_DB = '../../data/eval/results.sqlite'
+# original questions are the same in every ANSWER_PATH file, so their vectors are computed once
+EMBEDDING_CACHE_DIR = '../data/embedding_cache'
 
 API_VERSION_EMBEDDING = os.getenv("AZURE_API_VERSION_EMBEDDING")
 ENGINE_EMBEDDING = os.getenv("AZURE_ENGINE_EMBEDDING")
@@ -48,142 +71,186 @@ azure_embeddings = AzureOpenAIEmbeddings(
 )
 
 
+# our score names -> column names in the ragas result DataFrame
+METRIC_COLUMNS = {
+    "faithfulness": "faithfulness",
+    "answer_relevancy": "answer_relevancy",
+    "context_precision": "llm_context_precision_with_reference",
+    "context_recall": "context_recall",
+}
+
+
+def evaluate_rows(rows, metrics, run_config):
+    """Evaluate many answer records in one ragas evaluate() call and return (per-row scores, result DataFrame)."""
+    dataset = Dataset.from_dict({
+        "question": [doc.get('question') for doc in rows],
+        "answer": [doc.get('generated_answer') for doc in rows],
+        "contexts": [contexts_of(doc) for doc in rows],
+        "ground_truth": [doc.get('ref_answer') for doc in rows]
+    })
+    result = evaluate(
+        dataset=dataset,
+        metrics=metrics,
+        run_config=run_config
+    )
+    df = result.to_pandas()
+    scores = [
+        {name: float(row[column]) for name, column in METRIC_COLUMNS.items()}
+        for row in df.to_dict(orient="records")
+    ]
+    return scores, df
+
+
+def is_scored(scores):
+    """True when every metric of a row got a finite score; failed ragas jobs leave NaN."""
+    return scores is not None and all(isinstance(scores.get(name), (int, float)) and math.isfinite(scores[name])
+                                      for name in METRIC_COLUMNS)
+
+
 if __name__ == "__main__":
-    # Wrap models for Ragas compatibility
-    ragas_llm = LangchainLLMWrapper(llm_client)
-    ragas_embeddings = LangchainEmbeddingsWrapper(azure_embeddings)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=0, help="questions per evaluate() call (0 = whole file)")
+    parser.add_argument("--max-workers", type=int, default=16, help="concurrent ragas jobs within a batch")
+    args = parser.parse_args()
+
+    # Wrap models for Ragas compatibility, answering repeated prompts from the on-disk cache
+    llm_cache = ResponseCache(LLM_CACHE_FILE)
+    embedding_cache = EmbeddingCache(EMBEDDING_CACHE_DIR)
+    ragas_llm = CachedLangchainLLMWrapper(llm_client, llm_cache)
+    ragas_embeddings = CachedLangchainEmbeddingsWrapper(azure_embeddings, embedding_cache)
+
+    # metrics and run config are shared by every batch
+    run_config = RunConfig(timeout=120, max_workers=args.max_workers)
+    metrics = [
+        Faithfulness(llm=ragas_llm),
+        AnswerRelevancy(llm=ragas_llm, embeddings=ragas_embeddings),
+        LLMContextPrecisionWithReference(llm=ragas_llm),  # Measures if relevant items in context are ranked higher[2]
+        LLMContextRecall(llm=ragas_llm)
+    ]
+    result_frames = []
 
     output_file = OUTPUT_FILE_EVALUATION
     try:  # load previous generations if they exist
         with open(output_file, "r") as out_f:
-            outputs = json.load(out_f)
+            outputs = [upgrade_entry(entry) for entry in json.load(out_f)]
     except:
         outputs = []
+    progress = CheckpointLog(PROGRESS_FILE_EVALUATION)
+    manifest = new_run("ragas", {"llm": MODEL, "deployment": ENGINE, "api_version": API_VERSION,
+                                 "embeddings": "text-embedding-3-large"}, output_file)
 
+    failed_files = []  # (path, error) of answer files that could not be evaluated
     for path in ANSWER_PATH:
         print(f"Loading: File '{path}'")
 
         if not os.path.exists(path):
             print(f"Error: File '{path}' not found.")
+            failed_files.append((path, "not found"))
+            continue
 
         try:
-            with open(path, 'r') as file:
-                data = json.load(file)
-                total_scores_faithfulness = []
-                total_scores_answer_relevancy = []
-                total_scores_context_precision = []
-                total_scores_context_recall = []
-
-
-                for doc in data:
-                    question = doc.get('question')
-                    contexts = doc.get('raw_context')
-                    ref_anwser = doc.get('ref_answer')
-                    generated_answer = doc.get('generated_answer')
-
-                    dataset_dict = {
-                        "question": [question],
-                        "answer": [generated_answer],
-                        "contexts": [contexts],
-                        "ground_truth": [
-                            ref_anwser]
-                    }
-
-                    run_config = RunConfig(timeout=120)
-                    dataset = Dataset.from_dict(dataset_dict)
-                    metrics = [
-                        Faithfulness(llm=ragas_llm),
-                        AnswerRelevancy(llm=ragas_llm, embeddings=ragas_embeddings),
-                        LLMContextPrecisionWithReference(llm=ragas_llm),  # Measures if relevant items in context are ranked higher[2]
-                        LLMContextRecall(llm=ragas_llm)
-                    ]
-
-                    # Run evaluation
-                    result = evaluate(
-                        dataset=dataset,
-                        metrics=metrics,
-                        run_config=run_config
-                    )
-
-                    # Convert to pandas and save results
-                    df = result.to_pandas()
-                    df.to_csv("../data/rag_evaluation_results.csv", index=False)
-
-
-                    print("Evaluation Results:")
-                    # Proper score handling
-                    if isinstance(result['faithfulness'], list):
-                        avg_score = sum(result['faithfulness']) / len(result['faithfulness'])
-                        total_scores_faithfulness.extend(result['faithfulness'])
-                        print(f"Faithfulness: {avg_score:.2f}")
-                    else:  # Handle single-sample edge case
-                        print(f"Faithfulness: {result['faithfulness']:.2f}")
-
-                    # Proper score handling
-                    if isinstance(result['answer_relevancy'], list):
-                        avg_score = sum(result['answer_relevancy']) / len(result['answer_relevancy'])
-                        print(f"Answer Relevancy: {avg_score:.2f}")
-                        total_scores_answer_relevancy.extend(result['answer_relevancy'])
-                    else:  # Handle single-sample edge case
-                        print(f"Answer Relevancy: {result['answer_relevancy']:.2f}")
-                    #print(f"Context Precision: {result['context_precision']:.2f}")
-                    #print(f"Context Recall: {result['context_recall']:.2f}")
-
-
-                    if isinstance(result['llm_context_precision_with_reference'], list):
-                        avg_score = sum(result['llm_context_precision_with_reference']) / len(result['llm_context_precision_with_reference'])
-                        print(f"Context precision: {avg_score:.2f}")
-                        total_scores_context_precision.extend(result['llm_context_precision_with_reference'])
-                    else:  # Handle single-sample edge case
-                        print(f"Context precision: {result['llm_context_precision_with_reference']:.2f}")
-
-                    if isinstance(result['context_recall'], list):
-                        avg_score = sum(result['context_recall']) / len(result['context_recall'])
-                        print(f"Context recall: {avg_score:.2f}")
-                        total_scores_context_recall.extend(result['context_recall'])
-                    else:  # Handle single-sample edge case
-                        print(f"Context recall: {result['context_recall']:.2f}")
-
-
-
-                if total_scores_faithfulness:
-                    print(f"\nfile: {path}")
-                    print(f"Total Evaluated: {len(total_scores_faithfulness)} questions")
-                    average_score_faithfulness = sum(total_scores_faithfulness) / len(total_scores_faithfulness)
-                    print(f"\nAverage Score Faithfulness: {average_score_faithfulness:.2f}")
-
-                    average_score_answer_relevancy = sum(total_scores_answer_relevancy) / len(total_scores_faithfulness)
-                    print(f"\nAverage Score answer relevancy: {average_score_answer_relevancy:.2f}")
-
-
-                    average_score_context_precision = sum(total_scores_context_precision) / len(total_scores_context_precision)
-                    print(f"\nAverage Score context precision: {average_score_context_precision:.2f}")
-
-
-                    average_score_context_recall = sum(total_scores_context_recall) / len(total_scores_context_recall)
-                    print(f"\nAverage Score context recall: {average_score_context_recall:.2f}")
-
-
-
-                    result = {
-                        "average_score_faithfulness": average_score_faithfulness,
-                        "average_score_answer_relevancy": average_score_answer_relevancy,
-                        "average_score_context_precision": average_score_context_precision,
-                        "average_score_context_recall": average_score_context_recall,
-                        "total_questions": len(total_scores_faithfulness),
-                        "path": path,
-                        "total_scores_faithfulness": total_scores_faithfulness,
-                        "total_scores_answer_relevancy": total_scores_answer_relevancy,
-                        "total_scores_context_precision": total_scores_context_precision,
-                        "total_scores_context_recall": total_scores_context_recall
-                    }
-                    outputs.append(result)
-
-                    with open(output_file, "w") as f:
-                        json.dump(outputs, f)
-                else:
-                    print("No valid scores were calculated")
+            file_start = time.perf_counter()
+            # answer files may be .json or .parquet / .arrow (common/columnar.py)
+            data = load_answers(path, columns=["question", "generated_answer", "retrieved_context", "ref_answer",
+                                               "checkpoint_key"])
+            total_scores_faithfulness = []
+            total_scores_answer_relevancy = []
+            total_scores_context_precision = []
+            total_scores_context_recall = []
+
+
+            keys = [
+                checkpoint_key(doc.get('question'),
+                               {"evaluator": "ragas", "path": path, "answer": doc.get('generated_answer')}, MODEL)
+                for doc in data
+            ]
+            # rows without finite scores (never evaluated, or failed in an earlier run) are evaluated again
+            pending = [i for i, key in enumerate(keys) if not is_scored(progress.get(key))]
+            print(f"{len(data) - len(pending)} questions already evaluated, {len(pending)} to go")
+            batch_size = args.batch_size or len(pending)
+
+            for start in range(0, len(pending), batch_size or 1):
+                batch = pending[start:start + batch_size]
+                batch_scores, df = evaluate_rows([data[i] for i in batch], metrics, run_config)
+                df.insert(0, "path", path)
+                result_frames.append(df)
+                failed = 0
+                for i, scores in zip(batch, batch_scores):
+                    if not is_scored(scores):  # not checkpointed, so the next run evaluates it again
+                        failed += 1
+                        continue
+                    progress.add(keys[i], dict(scores, path=path, question=data[i].get('question')))
+                print(f"Evaluated {start + len(batch)}/{len(pending)} questions ({failed} without a score)")
+
+            # one entry per question, None where ragas gave no finite score, so positions stay aligned
+            unscored = 0
+            for key in keys:
+                scores = progress.get(key)
+                if not is_scored(scores):
+                    unscored += 1
+                    scores = dict.fromkeys(METRIC_COLUMNS)
+                total_scores_faithfulness.append(scores['faithfulness'])
+                total_scores_answer_relevancy.append(scores['answer_relevancy'])
+                total_scores_context_precision.append(scores['context_precision'])
+                total_scores_context_recall.append(scores['context_recall'])
+
+            if unscored < len(keys):
+                print(f"\nfile: {path}")
+                print(f"Total Evaluated: {len(keys) - unscored} questions ({unscored} without a score)")
+                # means over the finite scores only
+                average_score_faithfulness = mean(total_scores_faithfulness)
+                print(f"\nAverage Score Faithfulness: {average_score_faithfulness:.2f}")
+
+                average_score_answer_relevancy = mean(total_scores_answer_relevancy)
+                print(f"\nAverage Score answer relevancy: {average_score_answer_relevancy:.2f}")
+
+
+                average_score_context_precision = mean(total_scores_context_precision)
+                print(f"\nAverage Score context precision: {average_score_context_precision:.2f}")
+
+
+                average_score_context_recall = mean(total_scores_context_recall)
+                print(f"\nAverage Score context recall: {average_score_context_recall:.2f}")
+
+
+
+                result = result_entry(path, {
+                    "faithfulness": total_scores_faithfulness,
+                    "answer_relevancy": total_scores_answer_relevancy,
+                    "context_precision": total_scores_context_precision,
+                    "context_recall": total_scores_context_recall
+                }, manifest["run_id"], question_ids=[question_hash(doc.get('question')) for doc in data],
+                    unscored_questions=unscored)
+                add_answer_file(manifest, path, data, time.perf_counter() - file_start)
+                # replace a previous result for the same file instead of duplicating it
+                outputs = [entry for entry in outputs if entry.get("path") != path]
+                outputs.append(result)
+
+                with open(output_file, "w") as f:
+                    json.dump(outputs, f)
+                write_table(eval_to_table(outputs), OUTPUT_FILE_SCORES)
+            else:
+                print("No valid scores were calculated")
 
 
         except Exception as e:
-            print(f"Error processing file: {e}")
+            print(f"Error processing file '{path}': {e.__class__.__name__}: {e}")
+            failed_files.append((path, f"{e.__class__.__name__}: {e}"))
+
+    progress.close()
+    finish_run(manifest, tokens=ragas_llm.usage)
+    append_manifest(manifest, output_file)
+    results = ResultStore(RESULTS_DB)
+    results.add_run(manifest, outputs)
+    results.close()
+    print(f"Run {manifest['run_id']}: {len(manifest['answer_files'])} answer files in {manifest['seconds']:.1f}s, "
+          f"{ragas_llm.usage['prompt_tokens']} prompt / {ragas_llm.usage['completion_tokens']} completion tokens")
+    llm_cache.print_stats()
+    embedding_cache.print_stats()
+    if result_frames:
+        pd.concat(result_frames).to_csv("../data/rag_evaluation_results.csv", index=False)
+    if failed_files:
+        print(f"\n{len(failed_files)} of {len(ANSWER_PATH)} answer files failed:")
+        for path, error in failed_files:
+            print(f"  {path}: {error}")
+        sys.exit(1)
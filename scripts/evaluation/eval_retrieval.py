@@ -0,0 +1,122 @@
+## Retrieval-only evaluation: no generation, no judge LLM
+## Sends the questions of multi_question_medical.json to ES in _msearch batches for every retriever of
+## rag_scenarios/retrievers.py and scores the returned hospital records against
+## references[].hospital_patient_name with recall@k, MRR and nDCG@k. Every retriever searches the same index
+## (--index, the multi corpus by default) so their scores are comparable.
+##   python eval_retrieval.py --retrievers fulltext,hybrid --size 10 --batch-size 50
+from elasticsearch import Elasticsearch
+from dotenv import load_dotenv
+import argparse
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'rag_scenarios'))
+from common.ir_metrics import mean_scores, score_ranking
+from retrievers import RETRIEVERS, SEMANTIC_INDEX
+
+# Load environment variables from .env file
+if os.path.exists("../.env"):
+    load_dotenv(override=True)
+
+ES_URL = os.getenv("ES_URL")
+QUESTIONS_FILE = '../../data/raw/multi_question_medical.json'
+OUTPUT_FILE_EVALUATION = '../../data/eval/medical/multi/eval_retrieval.json'
+OUTPUT_FILE_CSV = '../../data/eval/medical/multi/eval_retrieval.csv'
+DOC_ID_FIELD = "hospital_patient_name"
+KS = (1, 3, 5, 10)
+
+
+def create_es_client():
+    if ES_URL:  # e.g. a local cluster or tools/mock_backend.py
+        return Elasticsearch(ES_URL, request_timeout=300)
+    return Elasticsearch(
+        cloud_id=os.environ["ES_CID"],
+        basic_auth=(os.environ["ES_USER"], os.environ["ES_PWD"]),
+        request_timeout=300
+    )
+
+
+def retrieval_body(retriever, question, size):
+    """The retriever's usual search body, returning `size` hits and only the record id."""
+    body = retriever["build_query"](question)
+    body["size"] = size
+    body["_source"] = [DOC_ID_FIELD]
+    body.pop("highlight", None)
+    return body
+
+
+def msearch_rankings(es_client, retriever, index, questions, size, batch_size):
+    """Rankings (lists of record ids) of `index` for every question, plus the total ES `took` in ms."""
+    rankings, took = [], 0
+    for start in range(0, len(questions), batch_size):
+        searches = []
+        for doc in questions[start:start + batch_size]:
+            searches.append({"index": index})
+            searches.append(retrieval_body(retriever, doc["question"], size))
+        response = es_client.msearch(searches=searches)
+        for doc, result in zip(questions[start:start + batch_size], response["responses"]):
+            if "error" in result:
+                print(f"Search failed for '{doc['question'][:60]}': {result['error']}")
+                rankings.append([])
+                continue
+            took += result.get("took", 0)
+            rankings.append([hit["_source"].get(DOC_ID_FIELD) for hit in result["hits"]["hits"]
+                             if hit.get("_source")])
+    return rankings, took
+
+
+def evaluate_retriever(es_client, name, index, questions, size, batch_size):
+    start = time.perf_counter()
+    rankings, took = msearch_rankings(es_client, RETRIEVERS[name], index, questions, size, batch_size)
+    elapsed = time.perf_counter() - start
+    per_question, question_scores = [], []
+    for doc, ranking in zip(questions, rankings):
+        relevant = {ref[DOC_ID_FIELD] for ref in doc.get("references", []) if ref.get(DOC_ID_FIELD)}
+        scores = score_ranking(ranking, relevant, KS)
+        question_scores.append(scores)
+        per_question.append({"question": doc["question"], "relevant": sorted(relevant), "retrieved": ranking,
+                             **scores})
+    scores = mean_scores(question_scores)
+    print(f"{name}: {len(questions)} questions on '{index}' in {elapsed:.1f}s (ES took {took} ms)")
+    return {"retriever": name, "index": index, "size": size, "questions": len(questions),
+            "elapsed_s": round(elapsed, 3), "es_took_ms": took, "scores": scores, "per_question": per_question}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score retrievers on the reference records, without any LLM call")
+    parser.add_argument("--retrievers", default=",".join(RETRIEVERS),
+                        help=f"comma separated names from {', '.join(RETRIEVERS)}")
+    parser.add_argument("--questions", default=QUESTIONS_FILE)
+    parser.add_argument("--index", default=SEMANTIC_INDEX,
+                        help="index every retriever searches, overriding the registry's per-retriever index")
+    parser.add_argument("--size", type=int, default=10, help="hits per question (metrics use k up to this)")
+    parser.add_argument("--batch-size", type=int, default=50, help="searches per _msearch request")
+    parser.add_argument("--output", default=OUTPUT_FILE_EVALUATION)
+    parser.add_argument("--csv", default=OUTPUT_FILE_CSV)
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.retrievers.split(",") if name.strip()]
+    unknown = [name for name in names if name not in RETRIEVERS]
+    if unknown:
+        parser.error(f"unknown retrievers: {', '.join(unknown)}")
+
+    with open(args.questions, 'r') as file:
+        questions = [doc for doc in json.load(file) if doc.get("references")]
+
+    es_client = create_es_client()
+    start = time.perf_counter()
+    results = [evaluate_retriever(es_client, name, args.index, questions, args.size, args.batch_size) for name in names]
+    print(f"Evaluated {len(names)} retrievers x {len(questions)} questions in {time.perf_counter() - start:.1f}s\n")
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=4)
+
+    df = pd.DataFrame([{"retriever": result["retriever"], **result["scores"]} for result in results])
+    df = df.set_index("retriever")
+    df.to_csv(args.csv)
+    print(df.round(3).to_string())
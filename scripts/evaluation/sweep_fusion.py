@@ -0,0 +1,208 @@
+## Parameter sweep for the hybrid / hybrid_rerank retrievers, without one ES round trip per config
+## Candidates are fetched once per question: the BM25 `match` and ELSER `sparse_vector` lists with a
+## wide window, plus the cohere-rerank score of every document in their union. RRF (rank_constant,
+## rank_window_size) and the reranker's rank_window_size / min_score are then recomputed locally
+## with NumPy for every grid point and scored against references[].hospital_patient_name.
+##   python sweep_fusion.py --window 50 --rank-constants 10,60,200 --min-scores 0,0.5,0.8
+from dotenv import load_dotenv
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'rag_scenarios'))
+from common.fusion import rrf, top_k
+from common.ir_metrics import batch_scores
+from eval_retrieval import DOC_ID_FIELD, QUESTIONS_FILE, create_es_client
+from retrievers import SEMANTIC_INDEX, match_query, sparse_vector_query, text_similarity_reranker_query
+
+# Load environment variables from .env file
+if os.path.exists("../.env"):
+    load_dotenv(override=True)
+
+CANDIDATES_FILE = '../data/fusion_candidates.json'
+OUTPUT_FILE_SWEEP = '../../data/eval/medical/multi/sweep_fusion.csv'
+SUB_RETRIEVERS = {
+    "match": match_query,
+    "sparse_vector": sparse_vector_query,
+}
+
+
+def parse_list(value, cast=float):
+    return [cast(item) for item in value.split(",") if item.strip()]
+
+
+def msearch(es_client, index, bodies, batch_size):
+    """Run `bodies` through _msearch in batches and return the hits of each, [] for a failed search."""
+    results = []
+    for start in range(0, len(bodies), batch_size):
+        searches = []
+        for body in bodies[start:start + batch_size]:
+            searches.append({"index": index})
+            searches.append(body)
+        for result in es_client.msearch(searches=searches)["responses"]:
+            if "error" in result:
+                print(f"Search failed: {result['error']}")
+            results.append(result.get("hits", {}).get("hits", []))
+    return results
+
+
+def fetch_candidates(es_client, questions, index, window, batch_size):
+    """One wide ranked list per sub-retriever and one rerank score per candidate, for every question."""
+    ranked = {}
+    for name, build in SUB_RETRIEVERS.items():
+        bodies = [{"retriever": build(doc["question"]), "size": window, "_source": [DOC_ID_FIELD]}
+                  for doc in questions]
+        ranked[name] = msearch(es_client, index, bodies, batch_size)
+
+    candidates = []
+    for position, doc in enumerate(questions):
+        ids, names = [], []
+        ranks = {name: [] for name in SUB_RETRIEVERS}
+        scores = {name: [] for name in SUB_RETRIEVERS}
+        for name in SUB_RETRIEVERS:
+            for hit in ranked[name][position]:
+                if hit["_id"] not in ids:
+                    ids.append(hit["_id"])
+                    names.append(hit.get("_source", {}).get(DOC_ID_FIELD))
+        for name in SUB_RETRIEVERS:
+            by_id = {hit["_id"]: (rank, hit["_score"]) for rank, hit in enumerate(ranked[name][position], start=1)}
+            ranks[name] = [by_id.get(doc_id, (None, None))[0] for doc_id in ids]
+            scores[name] = [by_id.get(doc_id, (None, None))[1] for doc_id in ids]
+        candidates.append({
+            "question": doc["question"],
+            "relevant": sorted({ref[DOC_ID_FIELD] for ref in doc["references"] if ref.get(DOC_ID_FIELD)}),
+            "ids": ids,
+            "names": names,
+            "ranks": ranks,
+            "scores": scores,
+        })
+
+    # the reranker scores the whole candidate union once; every rerank window / min_score is a local filter
+    bodies = [{"retriever": text_similarity_reranker_query(
+                   candidate["question"], {"standard": {"query": {"ids": {"values": candidate["ids"]}}}},
+                   rank_window_size=max(len(candidate["ids"]), 1), min_score=None),
+               "size": max(len(candidate["ids"]), 1), "_source": False}
+              for candidate in candidates]
+    for candidate, hits in zip(candidates, msearch(es_client, index, bodies, batch_size)):
+        by_id = {hit["_id"]: hit["_score"] for hit in hits}
+        candidate["rerank"] = [by_id.get(doc_id) for doc_id in candidate["ids"]]
+    return candidates
+
+
+def candidate_arrays(candidates, retrievers=tuple(SUB_RETRIEVERS)):
+    """
+    Pad the per-question candidate lists into dense arrays:
+    ranks [retriever, question, doc] (1-based, inf when absent), scores (nan when absent),
+    rerank [question, doc] (nan when absent), relevant [question, doc] and n_relevant [question].
+    """
+    width = max((len(candidate["ids"]) for candidate in candidates), default=0) or 1
+    shape = (len(candidates), width)
+    ranks = np.full((len(retrievers),) + shape, np.inf)
+    scores = np.full((len(retrievers),) + shape, np.nan)
+    rerank = np.full(shape, np.nan)
+    relevant = np.zeros(shape, dtype=bool)
+    n_relevant = np.array([len(candidate["relevant"]) for candidate in candidates])
+    for q, candidate in enumerate(candidates):
+        count = len(candidate["ids"])
+        for r, name in enumerate(retrievers):
+            ranks[r, q, :count] = [np.inf if rank is None else rank for rank in candidate["ranks"][name]]
+            scores[r, q, :count] = [np.nan if score is None else score for score in candidate["scores"][name]]
+        rerank[q, :count] = [np.nan if score is None else score for score in candidate["rerank"]]
+        relevant[q, :count] = [name in set(candidate["relevant"]) for name in candidate["names"]]
+    return {"ranks": ranks, "scores": scores, "rerank": rerank, "relevant": relevant, "n_relevant": n_relevant}
+
+
+def load_candidates(path, questions_path, index, window, batch_size, refresh=False):
+    """Candidates from the cache file when it was built with the same settings, else fetched and cached."""
+    meta = {"index": index, "window": window, "questions": os.path.abspath(questions_path)}
+    if os.path.exists(path) and not refresh:
+        with open(path, 'r') as file:
+            cached = json.load(file)
+        if cached.get("meta") == meta:
+            print(f"Loaded candidates for {len(cached['candidates'])} questions from '{path}'")
+            return cached["candidates"]
+        print(f"'{path}' was built with {cached.get('meta')}, refetching")
+
+    with open(questions_path, 'r') as file:
+        questions = [doc for doc in json.load(file) if doc.get("references")]
+    start = time.perf_counter()
+    candidates = fetch_candidates(create_es_client(), questions, index, window, batch_size)
+    print(f"Fetched candidates for {len(candidates)} questions in {time.perf_counter() - start:.1f}s")
+    with open(path, 'w') as file:
+        json.dump({"meta": meta, "candidates": candidates}, file)
+    return candidates
+
+
+def sweep(arrays, rank_constants, rank_windows, rerank_windows, min_scores, size, ks):
+    """Metrics for every grid point; rerank_window 0 means plain RRF without the reranker."""
+    relevant, n_relevant = arrays["relevant"], arrays["n_relevant"]
+    rows = []
+    for rank_constant, rank_window in itertools.product(rank_constants, rank_windows):
+        fused = rrf(arrays["ranks"], rank_constant, rank_window)
+        # rrf returns at most rank_window_size docs
+        fused_order, fused_filled = top_k(fused, fused > 0, int(rank_window))
+        for rerank_window in rerank_windows:
+            if rerank_window > rank_window:
+                continue
+            if rerank_window == 0:
+                order, filled = fused_order[:, :size], fused_filled[:, :size]
+                grid = [(None, order, filled)]
+            else:
+                # the reranker only sees the first rerank_window fused hits
+                window_docs = fused_order[:, :int(rerank_window)]
+                window_filled = fused_filled[:, :int(rerank_window)]
+                window_scores = np.take_along_axis(arrays["rerank"], window_docs, axis=1)
+                grid = []
+                for min_score in min_scores:
+                    keep = window_filled & (window_scores >= min_score)
+                    local_order, filled = top_k(np.nan_to_num(window_scores, nan=-np.inf), keep, size)
+                    grid.append((min_score, np.take_along_axis(window_docs, local_order, axis=1), filled))
+            for min_score, order, filled in grid:
+                gains = np.take_along_axis(relevant, order, axis=1) & filled
+                rows.append({"rank_constant": rank_constant, "rank_window_size": rank_window,
+                             "rerank_window_size": rerank_window or None, "min_score": min_score,
+                             "mean_hits": float(filled.sum(axis=1).mean()),
+                             **batch_scores(gains, n_relevant, ks)})
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep RRF and reranker parameters on locally fused candidates")
+    parser.add_argument("--questions", default=QUESTIONS_FILE)
+    parser.add_argument("--index", default=SEMANTIC_INDEX)
+    parser.add_argument("--window", type=int, default=50, help="hits fetched per sub-retriever and question")
+    parser.add_argument("--batch-size", type=int, default=50, help="searches per _msearch request")
+    parser.add_argument("--candidates", default=CANDIDATES_FILE, help="candidate cache, reused when it matches")
+    parser.add_argument("--refresh", action="store_true", help="refetch the candidates even if cached")
+    parser.add_argument("--rank-constants", default="1,10,20,60,100,200")
+    parser.add_argument("--rank-windows", default="5,10,20,50")
+    parser.add_argument("--rerank-windows", default="0,3,5,10", help="0 = no reranker")
+    parser.add_argument("--min-scores", default="0,0.25,0.5,0.8,0.9")
+    parser.add_argument("--size", type=int, default=3, help="hits passed to the LLM, as in the retriever scripts")
+    parser.add_argument("--sort-by", default="ndcg@3")
+    parser.add_argument("--output", default=OUTPUT_FILE_SWEEP)
+    args = parser.parse_args()
+
+    candidates = load_candidates(args.candidates, args.questions, args.index, args.window, args.batch_size,
+                                 refresh=args.refresh)
+    rank_windows = parse_list(args.rank_windows, int)
+    if max(rank_windows) > args.window:
+        print(f"Skipping rank windows above the fetched window of {args.window}")
+        rank_windows = [window for window in rank_windows if window <= args.window]
+    ks = tuple(k for k in (1, 3, 5, 10) if k <= args.size) or (args.size,)
+    start = time.perf_counter()
+    df = sweep(candidate_arrays(candidates),
+               parse_list(args.rank_constants), rank_windows,
+               parse_list(args.rerank_windows, int), parse_list(args.min_scores), args.size, ks)
+    print(f"Scored {len(df)} configurations in {time.perf_counter() - start:.2f}s\n")
+
+    df = df.sort_values(args.sort_by, ascending=False)
+    df.to_csv(args.output, index=False)
+    print(df.head(20).round(3).to_string(index=False))
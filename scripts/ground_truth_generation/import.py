@@ -1,17 +1,27 @@
-from langchain_community.document_loaders import JSONLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.docstore.document import Document as LangchainDocument
-from openai import AzureOpenAI
+from openai import AzureOpenAI, RateLimitError
+from concurrent.futures import ThreadPoolExecutor
+import argparse
 import os
+import sys
 import json
+import time
 from dotenv import load_dotenv
 from dotenv import dotenv_values
 import random
+import threading
 from tqdm import tqdm
 import pandas as pd
 from IPython.display import display
 import datasets
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.call_metrics import CallMetrics
+from common.corpus_reader import iter_documents, reservoir_sample
+from common.judge_output import CRITIQUE_FORMAT, Judge, combined_format
+from common.prefilter import QuestionPrefilter
+
 # Load environment variables from .env file
 if os.path.exists("../.env"):
     load_dotenv(override=True)
@@ -22,16 +32,25 @@ API_TYPE = os.environ.get("AZURE_OPENAI_TYPE", "azure")
 API_VERSION = os.getenv("AZURE_OPENAI_VERSION")
 ENGINE = os.getenv("AZURE_OPENAI_DEPLOYMENT")
 MODEL = os.getenv("AZURE_OPENAI_MODEL")
-RAW_DATA_FILE = "../../data/raw/dragonball_docs_med_en.json"
+RAW_DATA_FILE = "../../data/raw/dragonball_docs_med_en.json"  # JSON array or .ndjson
 OUTPUT_GROUND_TRUTH_FILE = "../../data/eval/medical/small/med_ground_truth.json"
-
-loader = JSONLoader(
-    file_path=RAW_DATA_FILE,
-    jq_schema=".[].content",
-    text_content=True
-)
-
-documents = loader.load()
+N_WORKERS = 8     # QA pairs generated / critiqued concurrently
+MAX_RETRIES = 6   # retries of a call answered with 429, with exponential backoff
+SEED = 42         # fixes the sampled contexts and so the output order
+MAX_GENERATIONS = 600
+# a QA couple is kept when every critique reaches its threshold
+CRITIQUE_THRESHOLDS = {"groundedness": 4, "relevance": 2, "standalone": 2}
+CALIBRATION_FILE = "../../data/eval/medical/small/critique_calibration.csv"
+CRITIQUE_CALLS = {"separate": 3, "combined": 1}  # per QA couple
+# tokens, latency and retries of every call, one JSON line each (summary: python ../common/call_metrics.py <file>)
+METRICS_FILE = "../data/metrics/ground_truth_generation.jsonl"
+
+parser = argparse.ArgumentParser(description="Generate ground-truth QA couples and filter them with LLM critiques")
+parser.add_argument("--critique", choices=["separate", "combined"], default="separate",
+                    help="one call per criterion, or a single call rating all criteria")
+parser.add_argument("--calibrate", type=int, default=0, metavar="N",
+                    help="critique N QA couples in both modes, report how well they agree and exit")
+args = parser.parse_args()
 
 text_splitter = RecursiveCharacterTextSplitter(
     chunk_size=2000,
@@ -41,33 +60,65 @@ text_splitter = RecursiveCharacterTextSplitter(
 )
 
 
-docs_processed = []
+def iter_chunks(path):
+    """Lazily split every corpus document into chunks, with the same metadata JSONLoader used to set."""
+    source = os.path.abspath(path)
+    for seq_num, doc in enumerate(iter_documents(path), start=1):
+        document = LangchainDocument(page_content=doc.get("content", ""),
+                                     metadata={"source": source, "seq_num": seq_num})
+        yield from text_splitter.split_documents([document])
 
-for doc in documents:
-    #print(f"Document Content:\n{doc.page_content},...\n")
-    docs_processed += text_splitter.split_documents([doc])
-    #print(f"Metadata: {doc.metadata},\n{'-'*50},")
 
-for doc in docs_processed:
-    print(f"Docs: {doc}")
+# only the sampled chunks are kept in memory
+sampled_contexts = reservoir_sample(iter_chunks(RAW_DATA_FILE), MAX_GENERATIONS, random.Random(SEED))
+print(f"Sampled {len(sampled_contexts)} chunks from '{RAW_DATA_FILE}'")
 
 client = AzureOpenAI(api_version=API_VERSION,
                      azure_endpoint=API_BASE,
                      api_key=API_KEY,
-                     azure_deployment=ENGINE
+                     azure_deployment=ENGINE,
+                     max_retries=0  # 429s are retried in call_llm
                      )
 
 
-def call_llm(client: AzureOpenAI, prompt: str):
-    response = client.chat.completions.create(
-        model=ENGINE,  # or use the model name if different
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": prompt}
-        ],
-        max_tokens=1000
-    )
-    return response.choices[0].message.content
+usage_lock = threading.Lock()
+call_metrics = CallMetrics(METRICS_FILE, name="ground truth generation")
+
+
+def call_llm(client: AzureOpenAI, prompt: str, options=None, usage=None, stage="generation", question=None,
+             reasked=False):
+    """
+    `options` are extra chat-completion arguments, e.g. a structured-output response_format; the calls
+    and tokens of the request are added to the `usage` dict when given. Every call is recorded in call_metrics
+    under `stage`, with its 429 retries (plus one when `reasked` after an unparsable answer).
+    """
+    start = time.perf_counter()
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = client.chat.completions.create(
+                model=ENGINE,  # or use the model name if different
+                messages=[
+                    {"role": "system", "content": "You are a helpful assistant."},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=1000,
+                **(options or {})
+            )
+            if usage is not None and response.usage is not None:
+                with usage_lock:
+                    usage["calls"] += 1
+                    usage["prompt_tokens"] += response.usage.prompt_tokens
+                    usage["completion_tokens"] += response.usage.completion_tokens
+            call_metrics.llm(stage, start, response, question=question, model=MODEL, retries=attempt + reasked)
+            return response.choices[0].message.content
+        except RateLimitError as e:
+            if attempt == MAX_RETRIES:
+                call_metrics.record("llm", stage, time.perf_counter() - start, question=question, model=MODEL,
+                                    retries=attempt + reasked, error="rate limited")
+                raise
+            retry_after = e.response.headers.get("retry-after") if e.response is not None else None
+            delay = float(retry_after) if retry_after else 2 ** attempt
+            time.sleep(delay + random.random())
 
 # Test the call
 print(call_llm(client, "This is a test context, what is your name"))
@@ -90,50 +141,6 @@ Context: {context}\n
 Output:::"""
 
 
-N_GENERATIONS = min(600, len(docs_processed))   # We intentionally generate only 10 QA couples here for cost and time considerations
-
-print(f"Generating {N_GENERATIONS} QA couples...")
-
-outputs = []
-for sampled_context in tqdm(random.sample(docs_processed, N_GENERATIONS), desc="Generating QAs"):
-    try:
-        output_QA_couple = call_llm(
-            client,
-            QA_generation_prompt.format(context=sampled_context.page_content)
-        )
-
-        # More robust parsing
-        if "Factoid question:" in output_QA_couple and "Answer:" in output_QA_couple:
-            parts = output_QA_couple.split("Factoid question:")[-1].split("Answer:")
-            question = parts[0].strip()
-            answer = parts[1].strip()
-
-            if len(answer) >= 300:
-                continue  # Skip too long answers
-
-            outputs.append({
-                "context": sampled_context.page_content,
-                "question": question,
-                "answer": answer,
-                "source_doc": sampled_context.metadata.get("source", "unknown"),
-            })
-    except Exception as e:
-        print(f"Error processing document: {e}")
-        continue
-
-# Display results
-df = pd.DataFrame(outputs)
-
-# Configure Pandas to show ALL data without truncation
-pd.set_option('display.max_rows', None)  # Show all rows
-pd.set_option('display.max_columns', None)  # Show all columns
-pd.set_option('display.width', 1000)  # Adjust based on your console width
-pd.set_option('display.max_colwidth', 50)  # Adjust for text columns
-
-# Print the full DataFrame
-print(df.to_string())  # to_string() ensures proper formatting
-
-
 question_groundedness_critique_prompt = """
 You will be given a context and a question.
 Your task is to provide a 'total rating' scoring how well one can answer the given question unambiguously with the given context.
@@ -188,39 +195,258 @@ Now here is the question.
 Question: {question}\n
 Answer::: """
 
+# the three critiques above in one call: instructions and context are sent once instead of three times
+combined_critique_prompt = """
+You will be given a context and a question.
+Your task is to provide a 'total rating' for each of three criteria, on a scale of 1 to 5:
+- Groundedness: how well one can answer the given question unambiguously with the given context. 1 means that the question is not answerable at all given the context, and 5 means that the question is clearly and unambiguously answerable with the context.
+- Relevance: how useful this question can be to doctors, medical school students or medical researchers. 1 means that the question is not useful at all, and 5 means that the question is extremely useful.
+- Standalone: how context-independent this question is. 1 means that the question depends on additional information to be understood, and 5 means that the question makes sense by itself.
+
+Provide your answer as follows:
+
+Answer:::
+Groundedness evaluation: (your rationale for the rating, as a text)
+Groundedness total rating: (your rating, as a number between 1 and 5)
+Relevance evaluation: (your rationale for the rating, as a text)
+Relevance total rating: (your rating, as a number between 1 and 5)
+Standalone evaluation: (your rationale for the rating, as a text)
+Standalone total rating: (your rating, as a number between 1 and 5)
+
+You MUST provide an evaluation and a total rating for each of the three criteria.
+
+Now here are the question and context.
+
+Question: {question}\n
+Context: {context}\n
+Answer::: """
+
 
-print("Generating critique for each QA couple...")
-for output in tqdm(outputs):
-    evaluations = {
-        "groundedness": call_llm(
-            client,
+def generate_qa_couple(sampled_context):
+    """Generate one QA couple from a context, or None when the output is unusable."""
+    output_QA_couple = call_llm(
+        client,
+        QA_generation_prompt.format(context=sampled_context.page_content)
+    )
+
+    # More robust parsing
+    if "Factoid question:" in output_QA_couple and "Answer:" in output_QA_couple:
+        parts = output_QA_couple.split("Factoid question:")[-1].split("Answer:")
+        question = parts[0].strip()
+        answer = parts[1].strip()
+
+        # too long answers are rejected by the prefilter, which counts them
+        return {
+            "context": sampled_context.page_content,
+            "question": question,
+            "answer": answer,
+            "source_doc": sampled_context.metadata.get("source", "unknown"),
+        }
+    return None
+
+
+# JSON critiques through structured outputs, "Total rating:" parsing as fallback, malformed ones asked again
+critique_judge = Judge(CRITIQUE_FORMAT, name="critique")
+combined_critique_judge = Judge(combined_format(CRITIQUE_FORMAT, CRITIQUE_THRESHOLDS), name="combined critique")
+
+
+def critique(prompt, judge=critique_judge, usage=None, stage="critique", question=None):
+    """Verdict of one critique prompt, or None when no answer could be parsed."""
+    return judge.judge(
+        lambda options, reminder: call_llm(client, f"{prompt}\n{reminder}" if reminder else prompt, options, usage,
+                                           stage, question, reasked=bool(reminder))
+    )
+
+
+def critique_qa_couple(output, critique_pool, mode="separate", usage=None):
+    """Critique a QA couple with three parallel calls, or one combined call, and return the verdict of each criterion."""
+    if mode == "combined":
+        verdicts = critique(
+            combined_critique_prompt.format(context=output["context"], question=output["question"]),
+            combined_critique_judge,
+            usage,
+            "critique/combined",
+            output["question"],
+        )
+        return verdicts or {criterion: None for criterion in CRITIQUE_THRESHOLDS}
+    futures = {
+        "groundedness": critique_pool.submit(
+            critique,
             question_groundedness_critique_prompt.format(
                 context=output["context"], question=output["question"]
             ),
+            usage=usage,
+            stage="critique/groundedness",
+            question=output["question"],
         ),
-        "relevance": call_llm(
-            client,
+        "relevance": critique_pool.submit(
+            critique,
             question_relevance_critique_prompt.format(question=output["question"]),
+            usage=usage,
+            stage="critique/relevance",
+            question=output["question"],
         ),
-        "standalone": call_llm(
-            client,
+        "standalone": critique_pool.submit(
+            critique,
             question_standalone_critique_prompt.format(question=output["question"]),
+            usage=usage,
+            stage="critique/standalone",
+            question=output["question"],
         ),
     }
+    return {criterion: future.result() for criterion, future in futures.items()}
+
+
+def passes_critiques(verdicts):
+    return all(verdicts.get(criterion) is not None and verdicts[criterion]["score"] >= threshold
+               for criterion, threshold in CRITIQUE_THRESHOLDS.items())
+
+
+def generate_safely(sampled_context):
     try:
-        for criterion, evaluation in evaluations.items():
-            score, eval = (
-                int(evaluation.split("Total rating: ")[-1].strip()),
-                evaluation.split("Total rating: ")[-2].split("Evaluation: ")[1],
-            )
-            output.update(
-                {
-                    f"{criterion}_score": score,
-                    f"{criterion}_eval": eval,
-                }
-            )
+        return generate_qa_couple(sampled_context)
     except Exception as e:
-        continue
+        print(f"Error processing document: {e}")
+        return None
+
+
+def critique_safely(output, critique_pool):
+    try:
+        return critique_qa_couple(output, critique_pool, args.critique)
+    except Exception as e:
+        print(f"Error processing document: {e}")
+        return None
+
+
+def previous_questions(path):
+    """Questions kept by earlier runs (the output file holds records, or one list of records per run)."""
+    try:
+        with open(path, "r") as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return []
+    records = [record for entry in entries for record in (entry if isinstance(entry, list) else [entry])]
+    return [record.get("question") for record in records]
+
+
+def critique_all(outputs, mode):
+    """Verdicts of every QA couple in one critique mode, with the calls, tokens and wall time spent."""
+    usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=N_WORKERS) as pool, \
+            ThreadPoolExecutor(max_workers=3 * N_WORKERS) as critique_pool:
+        verdicts = list(pool.map(lambda output: critique_qa_couple(output, critique_pool, mode, usage), outputs))
+    usage["seconds"] = round(time.perf_counter() - start, 2)
+    return verdicts, usage
+
+
+def calibrate(contexts):
+    """Critique the same QA couples in both modes and compare scores, filter decisions and cost."""
+    prefilter = QuestionPrefilter(seed=SEED)
+    with ThreadPoolExecutor(max_workers=N_WORKERS) as pool:
+        outputs = [output for output in pool.map(generate_qa_couple, contexts)
+                   if output is not None and prefilter.check(output["question"], output["answer"]) is None]
+    print(f"Calibrating the combined critique against the separate critiques on {len(outputs)} QA couples...")
+    separate, separate_usage = critique_all(outputs, "separate")
+    combined, combined_usage = critique_all(outputs, "combined")
+
+    rows = []
+    for output, reference, candidate in zip(outputs, separate, combined):
+        row = {"question": output["question"]}
+        for criterion in CRITIQUE_THRESHOLDS:
+            row[f"{criterion}_separate"] = (reference[criterion] or {}).get("score")
+            row[f"{criterion}_combined"] = (candidate[criterion] or {}).get("score")
+        row["keep_separate"] = passes_critiques(reference)
+        row["keep_combined"] = passes_critiques(candidate)
+        rows.append(row)
+    df = pd.DataFrame(rows)
+    df.to_csv(CALIBRATION_FILE, index=False)
+
+    agreement = []
+    for criterion in CRITIQUE_THRESHOLDS:
+        both = df[[f"{criterion}_separate", f"{criterion}_combined"]].dropna()
+        difference = (both.iloc[:, 0] - both.iloc[:, 1]).abs()
+        agreement.append({"criterion": criterion, "scored": len(both), "exact": (difference == 0).mean(),
+                          "within_1": (difference <= 1).mean(), "mean_abs_diff": difference.mean(),
+                          "mean_separate": both.iloc[:, 0].mean(), "mean_combined": both.iloc[:, 1].mean()})
+    print(pd.DataFrame(agreement).set_index("criterion").round(3).to_string())
+
+    # filter decisions: raw agreement and Cohen's kappa (agreement beyond chance)
+    observed = (df["keep_separate"] == df["keep_combined"]).mean()
+    p_separate, p_combined = df["keep_separate"].mean(), df["keep_combined"].mean()
+    chance = p_separate * p_combined + (1 - p_separate) * (1 - p_combined)
+    kappa = (observed - chance) / (1 - chance) if chance < 1 else 1.0
+    print(f"\nFilter decisions agree on {observed * 100:.1f}% of QA couples (kappa {kappa:.2f}); "
+          f"kept {df['keep_separate'].sum()} (separate) vs {df['keep_combined'].sum()} (combined)")
+
+    cost = pd.DataFrame({"separate": separate_usage, "combined": combined_usage})
+    cost["ratio"] = cost["separate"] / cost["combined"].where(cost["combined"] > 0)
+    print(f"\n{cost.round(2).to_string()}")
+    critique_judge.print_stats()
+    combined_critique_judge.print_stats()
+    print(f"\nPer-question scores written to '{CALIBRATION_FILE}'")
+
+
+if args.calibrate:
+    calibrate(sampled_contexts[:args.calibrate])
+    call_metrics.print_summary()
+    sys.exit(0)
+
+N_GENERATIONS = len(sampled_contexts)   # at most MAX_GENERATIONS, for cost and time considerations
+
+print(f"Generating {N_GENERATIONS} QA couples and their critiques with {N_WORKERS} workers...")
+
+# length / banned phrase / near-duplicate checks that spare the critique calls of hopeless QA couples;
+# questions kept by earlier runs count as accepted, so reruns don't add their duplicates
+prefilter = QuestionPrefilter(seed=SEED)
+prefilter.add(previous_questions(OUTPUT_GROUND_TRUTH_FILE))
+
+with ThreadPoolExecutor(max_workers=N_WORKERS) as generation_pool, \
+        ThreadPoolExecutor(max_workers=N_WORKERS) as couple_pool, \
+        ThreadPoolExecutor(max_workers=3 * N_WORKERS) as critique_pool:
+    # map() yields in sample order, so the prefilter and the output only depend on SEED;
+    # a QA couple's critiques start as soon as it passes the prefilter
+    pending = []
+    for output in tqdm(generation_pool.map(generate_safely, sampled_contexts), total=N_GENERATIONS,
+                       desc="Generating QAs"):
+        if output is None or prefilter.check(output["question"], output["answer"]) is not None:
+            continue
+        pending.append((output, couple_pool.submit(critique_safely, output, critique_pool)))
+    results = [(output, future.result()) for output, future in pending]
+
+prefilter.print_stats(CRITIQUE_CALLS[args.critique])
+outputs = []
+critiques = []
+for output, verdicts in results:
+    if verdicts is not None:
+        outputs.append(output)
+        critiques.append(verdicts)
+
+# Display results
+df = pd.DataFrame(outputs)
+
+# Configure Pandas to show ALL data without truncation
+pd.set_option('display.max_rows', None)  # Show all rows
+pd.set_option('display.max_columns', None)  # Show all columns
+pd.set_option('display.width', 1000)  # Adjust based on your console width
+pd.set_option('display.max_colwidth', 50)  # Adjust for text columns
+
+# Print the full DataFrame
+print(df.to_string())  # to_string() ensures proper formatting
+
+critique_judge.print_stats()
+combined_critique_judge.print_stats()
+call_metrics.print_summary()
+for output, evaluations in zip(outputs, critiques):
+    for criterion, verdict in evaluations.items():
+        if verdict is None:  # left empty, so the filter below drops the QA couple
+            continue
+        output.update(
+            {
+                f"{criterion}_score": verdict["score"],
+                f"{criterion}_eval": verdict["feedback"],
+            }
+        )
 
 pd.set_option("display.max_colwidth", None)
 
@@ -238,11 +464,10 @@ display(
         ]
     ]
 )
-generated_questions = generated_questions.loc[
-    (generated_questions["groundedness_score"] >= 4)
-    & (generated_questions["relevance_score"] >= 2)
-    & (generated_questions["standalone_score"] >= 2)
-]
+keep = pd.Series(True, index=generated_questions.index)
+for criterion, threshold in CRITIQUE_THRESHOLDS.items():
+    keep &= generated_questions[f"{criterion}_score"] >= threshold
+generated_questions = generated_questions.loc[keep]
 print("============================================")
 print("Final evaluation dataset:")
 display(
@@ -0,0 +1,154 @@
+## Bulk-load a raw corpus into an eval-rag-medical-en-* index
+## Creates the index from configs/medical-mapping.json and the ingest pipeline from
+## configs/medical-ingest-pipeline.json, then streams the NDJSON (or JSON array) file through
+## helpers.parallel_bulk. Refresh is disabled while loading, chunk size adapts to the cluster and
+## documents rejected by semantic_text inference backpressure (429) are retried after a pause.
+##   python ingest_ndjson.py --file ../../data/raw/dragonball_docs_med_en_multi.ndjson --index eval-rag-medical-en-multi
+from elasticsearch import Elasticsearch, helpers
+from dotenv import load_dotenv
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.corpus_reader import iter_documents
+
+# Load environment variables from .env file
+if os.path.exists("../.env"):
+    load_dotenv(override=True)
+
+ES_URL = os.getenv("ES_URL")
+DEFAULT_FILE = '../../data/raw/dragonball_docs_med_en_multi.ndjson'
+DEFAULT_INDEX = 'eval-rag-medical-en-multi'
+MAPPING_FILE = '../../configs/medical-mapping.json'
+PIPELINE_FILE = '../../configs/medical-ingest-pipeline.json'
+PIPELINE_ID = 'eval-rag-medical-ingest'
+
+MIN_CHUNK_SIZE = 10
+MAX_BACKOFF = 120
+# bulk item errors that mean "slow down", e.g. the ELSER endpoint behind semantic_text is saturated
+BACKPRESSURE_STATUS = {429, 503}
+BACKPRESSURE_ERRORS = {"es_rejected_execution_exception", "circuit_breaking_exception"}
+
+
+def create_es_client():
+    if ES_URL:  # e.g. a local cluster or tools/mock_backend.py
+        return Elasticsearch(ES_URL, request_timeout=300)
+    return Elasticsearch(
+        cloud_id=os.environ["ES_CID"],
+        basic_auth=(os.environ["ES_USER"], os.environ["ES_PWD"]),
+        request_timeout=300
+    )
+
+
+def setup_index(es_client, index, pipeline_id):
+    """Create the ingest pipeline and, if missing, the index with the medical mapping."""
+    with open(PIPELINE_FILE, 'r') as f:
+        pipeline = json.load(f)
+    es_client.ingest.put_pipeline(id=pipeline_id, **pipeline)
+
+    if not es_client.indices.exists(index=index):
+        with open(MAPPING_FILE, 'r') as f:
+            mapping = json.load(f)
+        es_client.indices.create(index=index, mappings=mapping,
+                                 settings={"index": {"default_pipeline": pipeline_id}})
+        print(f"Created index '{index}'")
+
+
+def index_settings(es_client, index, names):
+    """The index's own value of each setting in `names`, None for those left at their default."""
+    response = es_client.indices.get_settings(index=index)
+    settings = next(iter(response.values()), {}).get("settings", {}).get("index", {})
+    return {name: settings.get(name) for name in names}
+
+
+def is_backpressure(item):
+    status = item.get("status", 500)
+    error = item.get("error") or {}
+    error_type = error.get("type") if isinstance(error, dict) else None
+    return status in BACKPRESSURE_STATUS or error_type in BACKPRESSURE_ERRORS
+
+
+def bulk_window(es_client, index, pipeline_id, docs, chunk_size, thread_count):
+    """Index one window of documents; return (indexed count, docs to retry, other failures)."""
+    actions = [{"_index": index, "_source": doc} for doc in docs]
+    indexed, retry, failed = 0, [], []
+    results = helpers.parallel_bulk(es_client, actions, thread_count=thread_count, chunk_size=chunk_size,
+                                    pipeline=pipeline_id, raise_on_error=False, raise_on_exception=False)
+    # parallel_bulk yields results in action order, so they line up with `docs`
+    for doc, (ok, result) in zip(docs, results):
+        item = next(iter(result.values()))
+        if ok:
+            indexed += 1
+        elif is_backpressure(item):
+            retry.append(doc)
+        else:
+            failed.append(item)
+    return indexed, retry, failed
+
+
+def ingest(es_client, path, index, pipeline_id, chunk_size, thread_count, max_chunk_size):
+    """Stream `path` into `index` window by window and return (indexed, failed) counts."""
+    documents = iter_documents(path)
+    indexed_total, failed_total = 0, 0
+    backoff = 1
+    start = time.perf_counter()
+    while True:
+        window = list(itertools.islice(documents, chunk_size * thread_count))
+        if not window:
+            break
+        while window:
+            indexed, window, failed = bulk_window(es_client, index, pipeline_id, window, chunk_size, thread_count)
+            indexed_total += indexed
+            failed_total += len(failed)
+            for item in failed[:3]:
+                print(f"Failed to index document: {item.get('error')}")
+            if window:
+                # inference backpressure: pause, send smaller chunks and retry only the rejected documents
+                chunk_size = max(MIN_CHUNK_SIZE, chunk_size // 2)
+                print(f"{len(window)} documents rejected by backpressure, pausing {backoff}s "
+                      f"(chunk size {chunk_size})")
+                time.sleep(backoff)
+                backoff = min(MAX_BACKOFF, backoff * 2)
+            else:
+                backoff = 1
+                chunk_size = min(max_chunk_size, chunk_size * 2)
+        elapsed = time.perf_counter() - start
+        print(f"{indexed_total} documents indexed, {indexed_total / elapsed:.1f} docs/s")
+    return indexed_total, failed_total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-load a raw NDJSON / JSON corpus into Elasticsearch")
+    parser.add_argument("--file", default=DEFAULT_FILE)
+    parser.add_argument("--index", default=DEFAULT_INDEX)
+    parser.add_argument("--pipeline-id", default=PIPELINE_ID)
+    parser.add_argument("--chunk-size", type=int, default=100, help="initial documents per bulk request")
+    parser.add_argument("--max-chunk-size", type=int, default=500)
+    parser.add_argument("--thread-count", type=int, default=4)
+    parser.add_argument("--refresh-interval", help="refresh interval set after loading "
+                                                   "(default: the one the index had before)")
+    args = parser.parse_args()
+
+    es_client = create_es_client()
+    setup_index(es_client, args.index, args.pipeline_id)
+
+    # no refreshes while loading, one refresh at the end; the index's previous setting is put back
+    # (None resets it to the default when it had none of its own)
+    previous = index_settings(es_client, args.index, ["refresh_interval"])
+    restored = {"refresh_interval": args.refresh_interval} if args.refresh_interval else previous
+    es_client.indices.put_settings(index=args.index, settings={"index": {"refresh_interval": "-1"}})
+    start = time.perf_counter()
+    try:
+        indexed, failed = ingest(es_client, args.file, args.index, args.pipeline_id,
+                                 args.chunk_size, args.thread_count, args.max_chunk_size)
+    finally:
+        es_client.indices.put_settings(index=args.index, settings={"index": restored})
+        print(f"Restored {restored} on '{args.index}'")
+        es_client.indices.refresh(index=args.index)
+    elapsed = time.perf_counter() - start
+    print(f"\nIndexed {indexed} documents into '{args.index}' in {elapsed:.1f}s "
+          f"({indexed / elapsed if elapsed else 0:.1f} docs/s), {failed} failed")
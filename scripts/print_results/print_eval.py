@@ -1,77 +1,84 @@
-import json
+import os
+import sys
 import matplotlib.pyplot as plt
 import numpy as np
 
-# Load JSON data
-with open('../data/eval/eval_ragas.json', 'r') as f:
-    rag_data = json.load(f)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.columnar import JUDGE_METRIC
+from common.results import load_results, metric_mean
 
-with open('../../data/eval/medical/big/eval.json', 'r') as f:
-    eval_data = json.load(f)
+DEFAULT_RAGAS_PATH = '../data/eval/eval_ragas.json'
+DEFAULT_EVAL_PATH = '../../data/eval/medical/big/eval.json'
+OUTPUT_FILE = 'multi_metric_comparison.png'
 
-# Create path-indexed dictionary for quick lookup
-eval_scores = {entry['path']: entry['average_score']*100/5 for entry in eval_data}
 
-# Extract data for plotting
-paths = []
-faithfulness = []
-relevancy = []
-combined_scores = []
+def plot_multi_metric(rag_data, eval_data):
+    """RAGAS faithfulness / answer relevancy next to the LLM-judge score (%) for every answer file."""
+    # Create path-indexed dictionary for quick lookup
+    eval_scores = {entry['path']: metric_mean(entry, JUDGE_METRIC)*100/5 for entry in eval_data}
 
-for entry in rag_data:
-    path_key = entry['path']
-    base_name = path_key.split('/')[-1].replace('_answers.json', '')
-    paths.append(base_name)
-    faithfulness.append(entry['average_score_faithfullness']*100)
-    relevancy.append(entry['average_score_answer_relevancy']*100)
-    combined_scores.append(eval_scores[path_key])
+    # Extract data for plotting
+    paths = []
+    faithfulness = []
+    relevancy = []
+    combined_scores = []
 
-# Visualization parameters
-x = np.arange(len(paths))  # Category positions
-total_width = 0.8         # Total width for all bars in a group
-bar_width = total_width / 3  # Width for individual bars
+    for entry in rag_data:
+        path_key = entry['path']
+        base_name = path_key.split('/')[-1].replace('_answers.json', '')
+        paths.append(base_name)
+        faithfulness.append(metric_mean(entry, 'faithfulness')*100)
+        relevancy.append(metric_mean(entry, 'answer_relevancy')*100)
+        combined_scores.append(eval_scores[path_key])
 
-fig, ax = plt.subplots(figsize=(14, 8))
-rects1 = ax.bar(x - bar_width, faithfulness, bar_width,
-                label='RAGAS Faithfulness', color='#1f77b4', edgecolor='white')
-rects2 = ax.bar(x, relevancy, bar_width,
-                label='RAGAS Answer Relevancy', color='#ff7f0e', edgecolor='white')
-rects3 = ax.bar(x + bar_width, combined_scores, bar_width,
-                label='LLM as judge prompting', color='#2ca02c', edgecolor='white')
+    # Visualization parameters
+    x = np.arange(len(paths))  # Category positions
+    total_width = 0.8         # Total width for all bars in a group
+    bar_width = total_width / 3  # Width for individual bars
 
-# Formatting enhancements
-ax.set_title('Multi-Metric RAG Configuration Comparison', fontsize=16, pad=20)
-ax.set_xlabel('RAG Methods', fontsize=12)
-ax.set_ylabel('Normalized Scores', fontsize=12)
-ax.set_xticks(x)
-ax.set_xticklabels([p.capitalize() for p in paths], fontsize=11)
-ax.legend(title='Metric Type', fontsize=10, title_fontsize=11)
-ax.grid(True, linestyle=':', alpha=0.7)
-ax.set_axisbelow(True)
+    fig, ax = plt.subplots(figsize=(14, 8))
+    rects1 = ax.bar(x - bar_width, faithfulness, bar_width,
+                    label='RAGAS Faithfulness', color='#1f77b4', edgecolor='white')
+    rects2 = ax.bar(x, relevancy, bar_width,
+                    label='RAGAS Answer Relevancy', color='#ff7f0e', edgecolor='white')
+    rects3 = ax.bar(x + bar_width, combined_scores, bar_width,
+                    label='LLM as judge prompting', color='#2ca02c', edgecolor='white')
 
-# Dynamic annotation positioning
-def autolabel(rects):
-    for rect in rects:
-        height = rect.get_height()
-        ax.annotate(f'{height:.2f}',
-                    xy=(rect.get_x() + rect.get_width() / 2, height),
-                    xytext=(0, 2),
-                    textcoords="offset points",
-                    ha='center', va='bottom',
-                    fontsize=9,
-                    bbox=dict(boxstyle="round,pad=0.3",
-                            fc="white", ec="grey", lw=0.5))
+    # Formatting enhancements
+    ax.set_title('Multi-Metric RAG Configuration Comparison', fontsize=16, pad=20)
+    ax.set_xlabel('RAG Methods', fontsize=12)
+    ax.set_ylabel('Normalized Scores', fontsize=12)
+    ax.set_xticks(x)
+    ax.set_xticklabels([p.capitalize() for p in paths], fontsize=11)
+    ax.legend(title='Metric Type', fontsize=10, title_fontsize=11)
+    ax.grid(True, linestyle=':', alpha=0.7)
+    ax.set_axisbelow(True)
 
-autolabel(rects1)
-autolabel(rects2)
-autolabel(rects3)
+    # Dynamic annotation positioning
+    def autolabel(rects):
+        for rect in rects:
+            height = rect.get_height()
+            ax.annotate(f'{height:.2f}',
+                        xy=(rect.get_x() + rect.get_width() / 2, height),
+                        xytext=(0, 2),
+                        textcoords="offset points",
+                        ha='center', va='bottom',
+                        fontsize=9,
+                        bbox=dict(boxstyle="round,pad=0.3",
+                                fc="white", ec="grey", lw=0.5))
 
-# Adjust layout and save
-plt.tight_layout()
-plt.savefig('multi_metric_comparison.png', dpi=300, bbox_inches='tight')
-plt.show()
+    autolabel(rects1)
+    autolabel(rects2)
+    autolabel(rects3)
 
+    fig.tight_layout()
+    return fig
 
-plt.tight_layout()
-plt.savefig('rag_evaluation_comparison_ragas.png', dpi=300)
-plt.show()
\ No newline at end of file
+
+if __name__ == "__main__":
+    # Load JSON (or Parquet / Arrow, see common/columnar.py) data, older result layouts upgraded (common/results.py)
+    ragas_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_RAGAS_PATH
+    eval_path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_EVAL_PATH
+    fig = plot_multi_metric(load_results(ragas_path), load_results(eval_path, metrics=[JUDGE_METRIC]))
+    fig.savefig(OUTPUT_FILE, dpi=300, bbox_inches='tight')
+    plt.show()
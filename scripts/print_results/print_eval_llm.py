@@ -1,32 +1,42 @@
-import json
+import os
+import sys
 import matplotlib.pyplot as plt
 import numpy as np
 
-# Load JSON data
-with open('../../data/eval/medical/big/eval.json', 'r') as f:
-    data = json.load(f)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.columnar import JUDGE_METRIC, load_eval
+from common.significance import mean_intervals
 
-# Extract data for plotting
-paths = [entry['path'].split('/')[-1].replace('_answers.json', '') for entry in data]
-faithfulness = [entry['average_score']*100/5 for entry in data]
+DEFAULT_EVAL_PATH = '../../data/eval/medical/big/eval.json'
+OUTPUT_FILE = 'rag_evaluation_comparison_llm.png'
 
-# Plot configuration
-x = np.arange(len(paths))  # label locations
-width = 0.35  # width of the bars
 
-fig, ax = plt.subplots(figsize=(12, 6))
-rects = ax.bar(x - width/2, faithfulness, width, label='Faithfulness', color='#1f77b4')
+def plot_judge_bars(data):
+    """Bar chart of the judge's average score (%) per answer file, with 95% bootstrap error bars."""
+    # Extract data for plotting
+    paths = [entry['path'].split('/')[-1].replace('_answers.json', '') for entry in data]
+    faithfulness = [entry['average_score']*100/5 for entry in data]
+    # 95% bootstrap interval of each mean (see evaluation/compare_results.py for the paired tests)
+    intervals = np.array(mean_intervals(data, JUDGE_METRIC)) * 100 / 5
+    errors = np.abs(intervals.T - np.array(faithfulness))
 
-# Add labels and title
-ax.set_ylabel('Scores', fontsize=12)
-ax.set_title('RAG Evaluation Metrics Comparison LLM as judge', fontsize=14, pad=20)
-ax.set_xticks(x)
-ax.set_xticklabels([p.capitalize() for p in paths], fontsize=11)
-ax.legend(fontsize=10)
-ax.grid(True, linestyle='--', alpha=0.6)
+    # Plot configuration
+    x = np.arange(len(paths))  # label locations
+    width = 0.35  # width of the bars
 
-# Add value labels
-def autolabel(rects):
+    fig, ax = plt.subplots(figsize=(12, 6))
+    rects = ax.bar(x - width/2, faithfulness, width, label='Faithfulness', color='#1f77b4',
+                  yerr=errors, capsize=4, error_kw={'elinewidth': 1, 'ecolor': 'grey'})
+
+    # Add labels and title
+    ax.set_ylabel('Scores', fontsize=12)
+    ax.set_title('RAG Evaluation Metrics Comparison LLM as judge', fontsize=14, pad=20)
+    ax.set_xticks(x)
+    ax.set_xticklabels([p.capitalize() for p in paths], fontsize=11)
+    ax.legend(fontsize=10)
+    ax.grid(True, linestyle='--', alpha=0.6)
+
+    # Add value labels
     for rect in rects:
         height = rect.get_height()
         ax.annotate(f'{height:.2f}',
@@ -35,9 +45,14 @@ def autolabel(rects):
                     textcoords="offset points",
                     ha='center', va='bottom',
                     fontsize=9)
-autolabel(rects)
+
+    fig.tight_layout()
+    return fig
 
 
-plt.tight_layout()
-plt.savefig('rag_evaluation_comparison_llm.png', dpi=300)
-plt.show()
\ No newline at end of file
+if __name__ == "__main__":
+    # Load JSON (or Parquet / Arrow, see common/columnar.py) data
+    eval_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_EVAL_PATH
+    fig = plot_judge_bars(load_eval(eval_path, metrics=[JUDGE_METRIC]))
+    fig.savefig(OUTPUT_FILE, dpi=300)
+    plt.show()
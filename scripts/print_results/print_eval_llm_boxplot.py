@@ -1,43 +1,55 @@
-import json
+import os
+import sys
 import matplotlib.pyplot as plt
 import numpy as np
 
-# Load JSON data
-with open('../../data/eval/medical/multi/eval.json', 'r') as f:
-    data = json.load(f)
-
-# Extract document names and scores
-max_score = 5
-doc_names = [entry['path'].split('/')[-1].replace('_answers.json', '') for entry in data]
-scores_percent = {name: [(score/max_score)*100 for score in doc['total_scores']]
-                 for name, doc in zip(doc_names, data)}
-
-# Create figure
-plt.figure(figsize=(12, 7))
-boxes = plt.boxplot(scores_percent.values(), patch_artist=True, tick_labels=scores_percent.keys())
-
-# Customize boxplot appearance
-for box in boxes['boxes']:
-    box.set_facecolor('#1f77b4')
-    box.set_alpha(0.5)
-
-# Add statistical markers
-for i, (doc, values) in enumerate(scores_percent.items()):
-    # Calculate statistics
-    min_val = np.min(values)
-    max_val = np.max(values)
-    avg_val = np.mean(values)
-
-    # Plot markers
-    plt.plot(i + 1, min_val, 'r^', markersize=8, label='Min' if i == 0 else "")
-    plt.plot(i + 1, max_val, 'rv', markersize=8, label='Max' if i == 0 else "")
-    plt.plot(i + 1, avg_val, 'go', markersize=8, label='Mean' if i == 0 else "")
-
-# Add labels and legend
-plt.title('RAG Benchmark LLM as a judge', fontsize=14)
-plt.xlabel('RAG methods', fontsize=12)
-plt.ylabel('Scores', fontsize=12)
-plt.grid(True, linestyle='--', alpha=0.7)
-plt.legend(title='Statistics', loc='upper right')
-
-plt.show()
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.columnar import JUDGE_METRIC, load_eval
+
+DEFAULT_EVAL_PATH = '../../data/eval/medical/multi/eval.json'
+
+
+def plot_judge_boxplot(data, max_score=5):
+    """Boxplot of the judge's per-question scores (%) per answer file, with min / max / mean markers."""
+    # Extract document names and scores
+    doc_names = [entry['path'].split('/')[-1].replace('_answers.json', '') for entry in data]
+    scores_percent = {name: [(score/max_score)*100 for score in doc['total_scores'] if score is not None]
+                      for name, doc in zip(doc_names, data)}
+
+    # Create figure
+    fig, ax = plt.subplots(figsize=(12, 7))
+    boxes = ax.boxplot(scores_percent.values(), patch_artist=True, tick_labels=scores_percent.keys())
+
+    # Customize boxplot appearance
+    for box in boxes['boxes']:
+        box.set_facecolor('#1f77b4')
+        box.set_alpha(0.5)
+
+    # Add statistical markers
+    for i, (doc, values) in enumerate(scores_percent.items()):
+        if not values:
+            continue
+        # Calculate statistics
+        min_val = np.min(values)
+        max_val = np.max(values)
+        avg_val = np.mean(values)
+
+        # Plot markers
+        ax.plot(i + 1, min_val, 'r^', markersize=8, label='Min' if i == 0 else "")
+        ax.plot(i + 1, max_val, 'rv', markersize=8, label='Max' if i == 0 else "")
+        ax.plot(i + 1, avg_val, 'go', markersize=8, label='Mean' if i == 0 else "")
+
+    # Add labels and legend
+    ax.set_title('RAG Benchmark LLM as a judge', fontsize=14)
+    ax.set_xlabel('RAG methods', fontsize=12)
+    ax.set_ylabel('Scores', fontsize=12)
+    ax.grid(True, linestyle='--', alpha=0.7)
+    ax.legend(title='Statistics', loc='upper right')
+    return fig
+
+
+if __name__ == "__main__":
+    # Load JSON (or Parquet / Arrow, see common/columnar.py) data
+    eval_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_EVAL_PATH
+    plot_judge_boxplot(load_eval(eval_path, metrics=[JUDGE_METRIC]))
+    plt.show()
@@ -1,15 +1,13 @@
-import json
 import matplotlib.pyplot as plt
 import numpy as np
 import os
+import sys
 
-# Load the JSON data
-json_path = '../../data/eval/law/en/bg3/eval_ragas.json'
-with open(json_path, 'r') as f:
-    data = json.load(f)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.columnar import load_eval
+from common.significance import mean_intervals
 
-# Extract document names
-doc_names = [os.path.basename(entry['path']).replace('_answers.json', '').replace('.json', '') for entry in data]
+DEFAULT_EVAL_PATH = '../../data/eval/law/en/bg3/eval_ragas.json'
 
 # Define metrics and colors
 metrics = [
@@ -21,34 +19,51 @@ metrics = [
 metric_names = [m[0] for m in metrics]
 colors = [m[1] for m in metrics]
 
-# Extract average scores for each metric and document
-avg_scores = {m: [] for m in metric_names}
-for entry in data:
-    for m in metric_names:
-        avg_key = f'average_score_{m}'
-        avg = entry.get(avg_key, None)
-        if avg is not None:
-            avg_scores[m].append(avg * 100)  # convert to percentage
-        else:
-            avg_scores[m].append(np.nan)
-
-# Prepare data for plotting
-x = np.arange(len(doc_names))  # the label locations
-width = 0.1  # the width of the bars
-
-fig, ax = plt.subplots(figsize=(10, 6))
-
-# Plot bars for each metric
-for i, m in enumerate(metric_names):
-    ax.bar(x + i*width, avg_scores[m], width, label=m.replace('_', ' ').capitalize(), color=colors[i])
-
-# Add some text for labels, title and custom x-axis tick labels, etc.
-ax.set_ylabel('Average Score (%)')
-ax.set_title('Average Scores Eval Metric and RAG Method')
-ax.set_xticks(x + width * (len(metrics)-1) / 2)
-ax.set_xticklabels(doc_names, rotation=30, ha='right')
-ax.legend()
-ax.grid(axis='y', linestyle='--', alpha=0.7)
-
-plt.tight_layout()
-plt.show()
+
+def plot_metric_bars(data):
+    """Grouped bars of the average ragas scores (%) per answer file, with 95% bootstrap error bars."""
+    # Extract document names
+    doc_names = [os.path.basename(entry['path']).replace('_answers.json', '').replace('.json', '') for entry in data]
+
+    # Extract average scores for each metric and document
+    avg_scores = {m: [] for m in metric_names}
+    for entry in data:
+        for m in metric_names:
+            avg_key = f'average_score_{m}'
+            avg = entry.get(avg_key, None)
+            if avg is not None:
+                avg_scores[m].append(avg * 100)  # convert to percentage
+            else:
+                avg_scores[m].append(np.nan)
+
+    # 95% bootstrap interval of each mean (see evaluation/compare_results.py for the paired tests)
+    errors = {m: np.abs(np.array(mean_intervals(data, m)).T * 100 - np.array(avg_scores[m])) for m in metric_names}
+
+    # Prepare data for plotting
+    x = np.arange(len(doc_names))  # the label locations
+    width = 0.1  # the width of the bars
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+
+    # Plot bars for each metric
+    for i, m in enumerate(metric_names):
+        ax.bar(x + i*width, avg_scores[m], width, label=m.replace('_', ' ').capitalize(), color=colors[i],
+               yerr=errors[m], capsize=2, error_kw={'elinewidth': 0.8, 'ecolor': 'grey'})
+
+    # Add some text for labels, title and custom x-axis tick labels, etc.
+    ax.set_ylabel('Average Score (%)')
+    ax.set_title('Average Scores Eval Metric and RAG Method')
+    ax.set_xticks(x + width * (len(metrics)-1) / 2)
+    ax.set_xticklabels(doc_names, rotation=30, ha='right')
+    ax.legend()
+    ax.grid(axis='y', linestyle='--', alpha=0.7)
+
+    fig.tight_layout()
+    return fig
+
+
+if __name__ == "__main__":
+    # Load the JSON (or Parquet / Arrow, see common/columnar.py) data, only the plotted metrics of a columnar file
+    eval_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_EVAL_PATH
+    plot_metric_bars(load_eval(eval_path, metrics=metric_names))
+    plt.show()
@@ -1,13 +1,21 @@
-import json
+import argparse
 import os
 import sys
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.columnar import load_eval
+
 # --- Configuration ---
 DEFAULT_JSON_PATH = '../../data/archive/bge_e5.json'
 MAX_SCORE = 1.0  # Used to normalize scores to percentage
+# Summary rendering: above SUMMARY_THRESHOLD scores per violin, draw precomputed KDEs / quantiles and a strip sample
+SUMMARY_THRESHOLD = 1000
+MAX_STRIP_POINTS = 200  # strip points per violin
+KDE_BINS = 256  # scores are binned before the KDE, so its cost doesn't grow with the number of questions
+KDE_GRID = 128  # density evaluation points along the violin
 
 # Define metrics and colors
 METRICS = [
@@ -17,12 +25,11 @@ METRICS = [
     ('context_recall', '#d62728')
 ]
 
-def load_data(json_path):
-    """Load JSON data from file."""
+def load_data(json_path, metric_names=None):
+    """Load JSON, Parquet or Arrow eval data from file (only `metric_names` of a columnar file)."""
     if not os.path.exists(json_path):
         raise FileNotFoundError(f"File not found: {json_path}")
-    with open(json_path, 'r') as f:
-        return json.load(f)
+    return load_eval(json_path, metrics=metric_names)
 
 def extract_doc_names(data):
     """Extract document names from data."""
@@ -32,19 +39,36 @@ def extract_doc_names(data):
     ]
 
 def prepare_plot_data(data, metric_names):
-    """Prepare data for plotting."""
+    """Prepare data for plotting: per metric, one array of scores (%) per document, missing scores dropped."""
     plot_data = {m: [] for m in metric_names}
     for entry in data:
         for m in metric_names:
             key = f'total_scores_{m}'
-            scores = entry.get(key, [])
-            if not scores:
-                plot_data[m].append([])
-            else:
-                percent_scores = [(score / MAX_SCORE) * 100 for score in scores]
-                plot_data[m].append(percent_scores)
+            scores = np.array(entry.get(key) or [], dtype=float)
+            plot_data[m].append(scores[np.isfinite(scores)] / MAX_SCORE * 100)
     return plot_data
 
+def summarize_scores(scores, rng, max_points=MAX_STRIP_POINTS):
+    """KDE, box statistics and a strip sample of one violin's scores, at a cost independent of their number."""
+    low, high = scores.min(), scores.max()
+    q1, median, q3 = np.percentile(scores, [25, 50, 75])
+    iqr = q3 - q1
+    summary = {
+        'quartiles': (q1, median, q3),
+        # whiskers as in seaborn's inner='box': furthest scores within 1.5 IQR of the box
+        'whiskers': (scores[scores >= q1 - 1.5 * iqr].min(), scores[scores <= q3 + 1.5 * iqr].max()),
+        'points': scores if len(scores) <= max_points else rng.choice(scores, max_points, replace=False),
+    }
+    # Gaussian KDE with Scott's bandwidth, from binned counts, evaluated between min and max (cut=0)
+    counts, edges = np.histogram(scores, bins=KDE_BINS, range=(low, high))
+    centers = (edges[:-1] + edges[1:]) / 2
+    bandwidth = max(scores.std(ddof=1) * len(scores) ** (-1 / 5), (high - low) / KDE_BINS)
+    grid = np.linspace(low, high, KDE_GRID)
+    density = np.exp(-0.5 * ((grid[:, None] - centers[None, :]) / bandwidth) ** 2) @ counts
+    summary['grid'] = grid
+    summary['density'] = density / density.max()
+    return summary
+
 def print_summary_stats(data, metric_names, doc_names):
     print('\nAverage Scores (%):')
     for i, entry in enumerate(data):
@@ -57,7 +81,17 @@ def print_summary_stats(data, metric_names, doc_names):
             else:
                 print(f"   {m:18}: N/A")
 
-def plot_violinplots(plot_data, doc_names, metrics):
+def use_summaries(plot_data):
+    return any(len(scores) > SUMMARY_THRESHOLD for doc_scores in plot_data.values() for scores in doc_scores)
+
+def plot_violinplots(plot_data, doc_names, metrics, mode='auto'):
+    """Violin + strip plot of every metric's per-question scores, one panel per document; returns the figure.
+
+    mode 'full' hands every score to seaborn, 'summary' draws precomputed summaries (see plot_violin_summaries),
+    'auto' picks 'summary' once a violin has more than SUMMARY_THRESHOLD scores.
+    """
+    if mode == 'summary' or (mode == 'auto' and use_summaries(plot_data)):
+        return plot_violin_summaries(plot_data, doc_names, metrics)
     metric_names = [m[0] for m in metrics]
     colors = [m[1] for m in metrics]
     n_docs = len(doc_names)
@@ -73,9 +107,9 @@ def plot_violinplots(plot_data, doc_names, metrics):
         palette = []
         for m_idx, m in enumerate(metric_names):
             scores = plot_data[m][doc_idx]
-            if not scores or len(set(scores)) <= 1:
+            if len(scores) == 0 or np.unique(scores).size <= 1:
                 # If empty or constant, plot a single point
-                y = scores[0] if scores else 0
+                y = scores[0] if len(scores) else 0
                 ax.scatter([m], [y], color=colors[m_idx], s=80, label=f"{m} (single value)")
             else:
                 all_scores.extend(scores)
@@ -119,20 +153,75 @@ def plot_violinplots(plot_data, doc_names, metrics):
         plt.Line2D([0], [0], marker='o', color='w', markerfacecolor=color, label=name.replace('_', ' ').capitalize(), markersize=10)
         for name, color in metrics
     ]
-    plt.legend(handles=legend_elements, loc='lower right')
-    plt.suptitle('RAG Evaluation Metrics by Document', fontsize=16, y=1.05)
-    plt.tight_layout(rect=[0, 0, 1, 0.97])
-    plt.show()
+    axes[-1].legend(handles=legend_elements, loc='lower right')
+    fig.suptitle('RAG Evaluation Metrics by Document', fontsize=16, y=1.05)
+    fig.tight_layout(rect=[0, 0, 1, 0.97])
+    return fig
+
+def plot_violin_summaries(plot_data, doc_names, metrics, max_points=MAX_STRIP_POINTS, seed=42):
+    """Same figure as plot_violinplots from NumPy summaries: KDE outline, quartile box and at most `max_points`
+    strip points per violin, so the render time and file size stay bounded whatever the number of questions."""
+    metric_names = [m[0] for m in metrics]
+    colors = [m[1] for m in metrics]
+    n_docs = len(doc_names)
+    rng = np.random.default_rng(seed)
+
+    fig, axes = plt.subplots(1, n_docs, figsize=(4 * n_docs, 7), sharey=True)
+    if n_docs == 1:
+        axes = [axes]
+
+    for doc_idx, ax in enumerate(axes):
+        for m_idx, m in enumerate(metric_names):
+            scores = plot_data[m][doc_idx]
+            if len(scores) == 0 or scores.min() == scores.max():
+                # If empty or constant, plot a single point
+                y = scores[0] if len(scores) else 0
+                ax.scatter([m_idx], [y], color=colors[m_idx], s=80, label=f"{m} (single value)")
+                continue
+            summary = summarize_scores(scores, rng, max_points)
+            half_width = 0.4 * summary['density']
+            ax.fill_betweenx(summary['grid'], m_idx - half_width, m_idx + half_width,
+                             facecolor=colors[m_idx], edgecolor='0.25', linewidth=1.2)
+            q1, median, q3 = summary['quartiles']
+            ax.vlines(m_idx, *summary['whiskers'], color='0.25', linewidth=1.2)
+            ax.vlines(m_idx, q1, q3, color='0.25', linewidth=5)
+            ax.scatter([m_idx], [median], color='white', s=12, zorder=3)
+            points = summary['points']
+            ax.scatter(m_idx + rng.uniform(-0.2, 0.2, len(points)), points, color='k', s=9, alpha=0.5,
+                       linewidths=0, zorder=2)
+
+        ax.set_title(doc_names[doc_idx])
+        if doc_idx == 0:
+            ax.set_ylabel('Score (%)')
+        ax.set_ylim(0, 100)
+        ax.grid(True, axis='y', linestyle='--', alpha=0.6)
+        ax.set_xticks(range(len(metric_names)))
+        ax.set_xticklabels([m.replace('_', ' ').capitalize() for m in metric_names], rotation=30, ha='right')
+
+    # Legend
+    legend_elements = [
+        plt.Line2D([0], [0], marker='o', color='w', markerfacecolor=color, label=name.replace('_', ' ').capitalize(), markersize=10)
+        for name, color in metrics
+    ]
+    axes[-1].legend(handles=legend_elements, loc='lower right')
+    fig.suptitle('RAG Evaluation Metrics by Document', fontsize=16, y=1.05)
+    fig.tight_layout(rect=[0, 0, 1, 0.97])
+    return fig
 
 def main():
-    # Allow optional JSON path argument
-    json_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_JSON_PATH
-    data = load_data(json_path)
+    parser = argparse.ArgumentParser(description="Violin + strip plots of the per-question ragas scores")
+    parser.add_argument("eval_path", nargs="?", default=DEFAULT_JSON_PATH)
+    parser.add_argument("--mode", choices=["auto", "full", "summary"], default="auto",
+                        help=f"'summary' draws KDEs / quantiles and at most {MAX_STRIP_POINTS} strip points per violin; "
+                             f"'auto' uses it above {SUMMARY_THRESHOLD} scores per violin")
+    args = parser.parse_args()
     metric_names = [m[0] for m in METRICS]
+    data = load_data(args.eval_path, metric_names)
     doc_names = extract_doc_names(data)
     plot_data = prepare_plot_data(data, metric_names)
     print_summary_stats(data, metric_names, doc_names)
-    plot_violinplots(plot_data, doc_names, METRICS)
+    plot_violinplots(plot_data, doc_names, METRICS, mode=args.mode)
+    plt.show()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,191 @@
+## Headless report of every eval file: bar comparisons, boxplots and violin + strip plots as PNG files
+## Renders with the Agg backend (no display needed) in a process pool, one figure per task. A figure is skipped
+## when the hash of its eval file, figure type and plotting code is the one recorded at its last render, so a
+## rerun only redraws what changed. The report directory gets an index.html of all figures.
+##   python render_report.py ../../data/eval --output-dir ../../data/report --workers 8
+import matplotlib
+matplotlib.use("Agg")
+
+import argparse
+import glob
+import hashlib
+import html
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib.pyplot as plt
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.columnar import COLUMNAR_EXTENSIONS, JUDGE_METRIC, load_eval
+from common.significance import eval_metrics
+
+EVAL_DIR = '../../data/eval'
+REPORT_DIR = '../../data/report'
+HASH_FILE = 'figures.json'  # inside the report directory
+DPI = 150
+# eval-shaped files only: no checkpoint logs, comparison or retrieval-only results
+EXCLUDED_SUFFIXES = ("_progress", "_comparison", "eval_retrieval")
+
+# figure type -> plotting module and the kind of scores it needs
+FIGURES = {
+    "metric_bars": {"module": "print_eval_ragas", "scores": "ragas"},
+    "violin": {"module": "print_eval_ragas_seaborn", "scores": "ragas"},
+    "judge_bars": {"module": "print_eval_llm", "scores": "judge"},
+    "judge_boxplot": {"module": "print_eval_llm_boxplot", "scores": "judge"},
+}
+CODE_FILES = [__file__, '../common/columnar.py', '../common/significance.py'] + \
+             [f"{figure['module']}.py" for figure in FIGURES.values()]
+
+
+def find_eval_files(paths):
+    """Eval files among `paths` (files, or directories searched recursively)."""
+    found = []
+    for path in paths:
+        if os.path.isfile(path):
+            found.append(path)
+            continue
+        for extension in (".json",) + COLUMNAR_EXTENSIONS:
+            found += glob.glob(os.path.join(path, "**", f"eval*{extension}"), recursive=True)
+    return sorted(path for path in set(found)
+                  if not os.path.splitext(os.path.basename(path))[0].endswith(EXCLUDED_SUFFIXES))
+
+
+def figure_types(eval_path):
+    """Figure types that apply to an eval file, from the scores it holds."""
+    try:
+        entries = load_eval(eval_path)
+    except (OSError, ValueError) as e:
+        print(f"Skipping '{eval_path}': {e}")
+        return []
+    if not entries or not all(isinstance(entry, dict) and "path" in entry for entry in entries):
+        return []
+    metrics = eval_metrics(entries)
+    kinds = {"judge" if metric == JUDGE_METRIC else "ragas" for metric in metrics}
+    return [name for name, figure in FIGURES.items() if figure["scores"] in kinds]
+
+
+def code_hash():
+    digest = hashlib.sha256()
+    base = os.path.dirname(os.path.abspath(__file__))
+    for path in CODE_FILES:
+        with open(os.path.join(base, path), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def input_hash(eval_path, figure, code):
+    digest = hashlib.sha256(f"{figure}:{DPI}:{code}".encode())
+    with open(eval_path, 'rb') as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+def figure_path(eval_path, eval_root, figure, output_dir):
+    relative = os.path.relpath(eval_path, eval_root) if eval_root else os.path.basename(eval_path)
+    name = os.path.splitext(relative)[0].replace(os.sep, "__").replace("..", "up")
+    return os.path.join(output_dir, f"{name}__{figure}.png")
+
+
+def draw(figure, eval_path):
+    """Figure of type `figure` for an eval file, drawn by the print_results script that owns it."""
+    if figure == "metric_bars":
+        from print_eval_ragas import metric_names, plot_metric_bars
+        return plot_metric_bars(load_eval(eval_path, metrics=metric_names))
+    if figure == "violin":
+        from print_eval_ragas_seaborn import METRICS, extract_doc_names, plot_violinplots, prepare_plot_data
+        metric_names = [m[0] for m in METRICS]
+        data = load_eval(eval_path, metrics=metric_names)
+        return plot_violinplots(prepare_plot_data(data, metric_names), extract_doc_names(data), METRICS)
+    if figure == "judge_bars":
+        from print_eval_llm import plot_judge_bars
+        return plot_judge_bars(load_eval(eval_path, metrics=[JUDGE_METRIC]))
+    if figure == "judge_boxplot":
+        from print_eval_llm_boxplot import plot_judge_boxplot
+        return plot_judge_boxplot(load_eval(eval_path, metrics=[JUDGE_METRIC]))
+    raise ValueError(f"unknown figure type {figure}")
+
+
+def render(task):
+    """Worker: draw one figure and save it; returns (task, seconds, error)."""
+    start = time.perf_counter()
+    try:
+        fig = draw(task["figure"], task["eval_path"])
+        fig.savefig(task["output"] + ".tmp.png", dpi=DPI, bbox_inches='tight')
+        plt.close(fig)
+        os.replace(task["output"] + ".tmp.png", task["output"])
+        return task, time.perf_counter() - start, None
+    except Exception as e:
+        plt.close("all")
+        return task, time.perf_counter() - start, f"{e.__class__.__name__}: {e}"
+
+
+def write_index(output_dir, figures):
+    """index.html with the figures grouped by eval file."""
+    lines = ["<!doctype html><html><head><meta charset='utf-8'><title>RAG evaluation report</title></head><body>",
+             "<h1>RAG evaluation report</h1>"]
+    for eval_path in sorted({eval_path for eval_path, _ in figures}):
+        lines.append(f"<h2>{html.escape(eval_path)}</h2>")
+        for path, output in sorted(figures):
+            if path == eval_path:
+                lines.append(f"<img src='{html.escape(os.path.basename(output))}' style='max-width:100%'><br>")
+    lines.append("</body></html>")
+    with open(os.path.join(output_dir, "index.html"), 'w') as f:
+        f.write("\n".join(lines))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the figures of all eval files into a report directory")
+    parser.add_argument("paths", nargs="*", default=[EVAL_DIR], help="eval files or directories (searched recursively)")
+    parser.add_argument("--output-dir", default=REPORT_DIR)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--figures", default=",".join(FIGURES), help=f"comma separated, from {', '.join(FIGURES)}")
+    parser.add_argument("--force", action="store_true", help="redraw every figure, even if its inputs didn't change")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    os.makedirs(args.output_dir, exist_ok=True)
+    hash_file = os.path.join(args.output_dir, HASH_FILE)
+    try:
+        with open(hash_file, 'r') as f:
+            rendered = json.load(f)
+    except (OSError, ValueError):
+        rendered = {}
+
+    wanted = set(args.figures.split(","))
+    eval_root = os.path.commonpath([os.path.abspath(path) for path in args.paths]) if args.paths else None
+    if eval_root and os.path.isfile(eval_root):
+        eval_root = os.path.dirname(eval_root)
+    code = code_hash()
+    tasks, figures, skipped = [], [], 0
+    for eval_path in find_eval_files(args.paths):
+        for figure in figure_types(eval_path):
+            if figure not in wanted:
+                continue
+            output = figure_path(os.path.abspath(eval_path), eval_root, figure, args.output_dir)
+            figures.append((eval_path, output))
+            digest = input_hash(eval_path, figure, code)
+            if not args.force and rendered.get(output) == digest and os.path.exists(output):
+                skipped += 1
+                continue
+            tasks.append({"eval_path": eval_path, "figure": figure, "output": output, "hash": digest})
+
+    failed = 0
+    if tasks:
+        with ProcessPoolExecutor(max_workers=min(args.workers, len(tasks))) as pool:
+            for task, seconds, error in pool.map(render, tasks):
+                if error:
+                    failed += 1
+                    rendered.pop(task["output"], None)
+                    print(f"Failed {task['figure']} of '{task['eval_path']}': {error}")
+                    continue
+                rendered[task["output"]] = task["hash"]
+                print(f"Rendered {os.path.basename(task['output'])} in {seconds:.1f}s")
+
+    with open(hash_file, 'w') as f:
+        json.dump(rendered, f, indent=1)
+    write_index(args.output_dir, figures)
+    print(f"{len(tasks) - failed} figures rendered, {skipped} unchanged, {failed} failed, in "
+          f"{time.perf_counter() - start:.1f}s -> '{os.path.join(args.output_dir, 'index.html')}'")
@@ -0,0 +1,111 @@
+## Async building blocks of run_retrievers.py (and so of the retriever_*.py scenarios)
+## Keeps a bounded number of questions in flight and spaces requests with a token bucket
+## instead of sleeping a random amount before every question.
+import asyncio
+import os
+import time
+
+from elasticsearch import AsyncElasticsearch
+from openai import AsyncAzureOpenAI
+
+from common.context_packer import context_tokens
+from common.retrieval_cache import async_search_hits
+
+
+class TokenBucket:
+    """Asyncio token bucket allowing `rate` acquisitions per second with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def create_async_clients(connections=10):
+    """Build the async ES and Azure OpenAI clients from the same env variables as the sync scripts."""
+    es_url = os.getenv("ES_URL")
+    if es_url:
+        es_client = AsyncElasticsearch(es_url, connections_per_node=connections)
+    else:
+        es_client = AsyncElasticsearch(
+            cloud_id=os.getenv("ES_CID"),
+            basic_auth=(os.getenv("ES_USER"), os.getenv("ES_PWD")),
+            connections_per_node=connections
+        )
+    openai_client = AsyncAzureOpenAI(api_version=os.getenv("AZURE_OPENAI_VERSION"),
+                                     azure_endpoint=os.getenv("AZURE_OPENAI_BASE"),
+                                     api_key=os.getenv("AZURE_OPENAI_KEY"),
+                                     azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT")
+                                     )
+    return es_client, openai_client
+
+
+# placeholder of a position that failed, passed over when emitting
+SKIPPED = object()
+
+
+class OrderedEmitter:
+    """Collects results completed in any order and hands them to `on_result` in position order."""
+
+    def __init__(self, count, on_result):
+        self.results = [None] * count
+        self.on_result = on_result
+        self.emitted = 0
+        self.skipped = 0
+
+    def set(self, position, result):
+        self.results[position] = result
+        # Emit the longest finished prefix so output keeps the original question order
+        while self.emitted < len(self.results) and self.results[self.emitted] is not None:
+            if self.results[self.emitted] is SKIPPED:
+                self.skipped += 1
+            else:
+                self.on_result(self.results[self.emitted])
+            self.results[self.emitted] = True
+            self.emitted += 1
+
+    def skip(self, position):
+        """Mark a position that has no result (e.g. its question failed), so the ones after it still go out."""
+        self.set(position, SKIPPED)
+
+
+async def answer_question(es_client, openai_client, model, index, es_query, create_openai_prompt, doc,
+                          retrieval_cache=None, metrics=None, retriever=None):
+    """Retrieve, prompt and generate for one question; returns the answer record. Calls go to `metrics` if given."""
+    question = doc.get('question')
+    hits = await async_search_hits(es_client, retrieval_cache, index, es_query, question, metrics, retriever)
+    context_prompt, raw_context = create_openai_prompt(hits)
+    start = time.perf_counter()
+    response = await openai_client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": context_prompt},
+            {"role": "user", "content": question},
+        ],
+        temperature=1
+    )
+    if metrics:
+        metrics.llm("generation", start, response, retriever, question, model)
+    return {
+        "question": question,
+        "ref_context": doc.get('references'),
+        "ref_answer": doc.get('answer'),
+        "retrieved_context": raw_context,
+        "context_tokens": context_tokens(raw_context),
+        "generated_answer": response.choices[0].message.content
+    }
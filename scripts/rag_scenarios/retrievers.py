@@ -0,0 +1,188 @@
+## Registry of the retriever scenarios
+## Each entry declares the index, the source field used as context and the query builder, so the
+## retriever_*.py scripts and run_retrievers.py share one definition per scenario.
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.context_packer import DEFAULT_CONTEXT_TOKENS, pack_context
+
+SEMANTIC_INDEX = "eval-rag-medical-en-multi"
+# chunk texts (semantic_text inner hits or highlight passages) fetched per hit for the prompt
+DEFAULT_CHUNKS = 5
+
+
+def match_query(query, field="content"):
+    """BM25 `match` retriever."""
+    return {
+        "standard": {
+            "query": {
+                "match": {
+                    field: query
+                }
+            }
+        }
+    }
+
+
+def sparse_vector_query(query, index=SEMANTIC_INDEX, field="content_semantic", inference_id="my-elser-endpoint",
+                        inner_hits_size=DEFAULT_CHUNKS):
+    """ELSER `sparse_vector` retriever on the semantic_text chunks, returning the best chunk texts as inner_hits."""
+    return {
+        "standard": {
+            "query": {
+                "nested": {
+                    "path": f"{field}.inference.chunks",
+                    "query": {
+                        "sparse_vector": {
+                            "inference_id": inference_id,
+                            "field": f"{field}.inference.chunks.embeddings",
+                            "query": query
+                        }
+                    },
+                    "inner_hits": {
+                        "size": inner_hits_size,
+                        "name": f"{index}.{field}",
+                        "_source": [
+                            f"{field}.inference.chunks.text"
+                        ]
+                    }
+                }
+            }
+        }
+    }
+
+
+def rrf_query(retrievers, rank_window_size=20, rank_constant=200):
+    """Reciprocal rank fusion of several retrievers."""
+    return {
+        "rrf": {
+            "retrievers": retrievers,
+            "rank_window_size": rank_window_size,
+            "rank_constant": rank_constant
+        }
+    }
+
+
+def text_similarity_reranker_query(query, retriever, field="content", inference_id="cohere-rerank",
+                                   rank_window_size=10, min_score=0.8):
+    """Rerank the hits of `retriever` with a text similarity inference endpoint; min_score=None keeps every hit."""
+    reranker = {
+        "retriever": retriever,
+        "field": field,
+        "inference_id": inference_id,
+        "inference_text": query,
+        "rank_window_size": rank_window_size,
+    }
+    if min_score is not None:
+        reranker["min_score"] = min_score
+    return {"text_similarity_reranker": reranker}
+
+
+def chunk_highlight(field="content", fragments=DEFAULT_CHUNKS, fragment_size=600):
+    """Best passages of a text field, the context of hits that carry no semantic_text chunks (BM25-only hits)."""
+    return {
+        "fields": {
+            field: {"number_of_fragments": fragments, "fragment_size": fragment_size, "order": "score"}
+        },
+        "pre_tags": [""],
+        "post_tags": [""]
+    }
+
+
+def fulltext_body(query):
+    return {"retriever": match_query(query), "size": 1}
+
+
+## The semantic scenarios only need chunk texts: no whole-document _source (which also carries the
+## semantic_text embeddings), the matching chunks come back as inner_hits and BM25-only hits as highlights.
+def semantic_body(query):
+    return {"retriever": sparse_vector_query(query), "size": 3, "_source": False}
+
+
+def hybrid_body(query):
+    return {
+        "retriever": rrf_query([match_query(query), sparse_vector_query(query)]),
+        "size": 3,
+        "_source": False,
+        "highlight": chunk_highlight()
+    }
+
+
+def hybrid_rerank_body(query):
+    return {
+        "size": 3,
+        "retriever": text_similarity_reranker_query(
+            query, rrf_query([sparse_vector_query(query), match_query(query)])
+        ),
+        "_source": False,
+        "highlight": chunk_highlight()
+    }
+
+
+RETRIEVERS = {
+    "fulltext": {
+        "index": "eval-rag-medical-en-small",
+        "source_field": "content",
+        "use_inner_hits": True,
+        "build_query": fulltext_body,
+    },
+    "semantic": {
+        "index": SEMANTIC_INDEX,
+        "source_field": "content_semantic",
+        "use_inner_hits": True,
+        "highlight_field": "content",
+        "build_query": semantic_body,
+    },
+    "hybrid": {
+        "index": SEMANTIC_INDEX,
+        "source_field": "content_semantic",
+        "use_inner_hits": True,
+        "highlight_field": "content",
+        "build_query": hybrid_body,
+    },
+    "hybrid_rerank": {
+        "index": SEMANTIC_INDEX,
+        "source_field": "content_semantic",
+        "use_inner_hits": True,
+        "highlight_field": "content",
+        "build_query": hybrid_rerank_body,
+    },
+}
+
+
+def hit_chunks(hit, retriever):
+    """(document id, text) pieces of context of one hit, best first."""
+    source_field = retriever["source_field"]
+    inner_hit_path = f"{hit['_index']}.{source_field}"
+    ## For semantic_text matches, we need to extract the text from the inner_hits
+    if retriever["use_inner_hits"] and 'inner_hits' in hit and inner_hit_path in hit['inner_hits']:
+        return [(hit['_id'], inner_hit['_source']['text'])
+                for inner_hit in hit['inner_hits'][inner_hit_path]['hits']['hits']]
+    highlight_field = retriever.get("highlight_field")
+    if highlight_field and highlight_field in hit.get('highlight', {}):
+        return [(hit['_id'], fragment) for fragment in hit['highlight'][highlight_field]]
+    if source_field in hit.get('_source', {}):
+        return [(hit['_id'], hit['_source'][source_field])]
+    return []
+
+
+def create_openai_prompt(results, retriever, context_tokens=DEFAULT_CONTEXT_TOKENS):
+    """Prompt with the hits' context packed in rank order into `context_tokens` tokens (0 = no limit)."""
+    chunks = [chunk for hit in results for chunk in hit_chunks(hit, retriever)]
+    raw_context, _ = pack_context(chunks, context_tokens)
+    context = "\n --- \n".join(raw_context)
+    prompt = f"""
+    <|system|>
+    Using the information contained in the context,
+    give a comprehensive answer to the question.
+    Respond only to the question asked, response should be concise and relevant to the question.
+    Provide the number of the source document when relevant.
+    If the answer cannot be deduced from the context, do not give an answer.</s>
+    <|user|>
+
+  Context:
+  {context}
+
+  """
+    return prompt, raw_context
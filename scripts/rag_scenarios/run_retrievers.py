@@ -0,0 +1,162 @@
+## Run several retriever scenarios in one pass over the questions
+## Every question is fanned out to all selected retrievers from retrievers.RETRIEVERS over one shared,
+## pooled ES client and one Azure OpenAI client. The retriever_*.py scripts are this runner with one retriever.
+##   python run_retrievers.py --retrievers fulltext,hybrid,hybrid_rerank --output-dir ../data
+from dotenv import load_dotenv
+import argparse
+import asyncio
+import functools
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.answer_store import AnswerStore
+from common.call_metrics import CallMetrics
+from common.context_packer import DEFAULT_CONTEXT_TOKENS, MIN_OVERLAP_CHARS
+from common.checkpoint import KEY_FIELD, checkpoint_key, completed_keys, retriever_config
+from common.retrieval_cache import RetrievalCache
+from async_runner import OrderedEmitter, TokenBucket, answer_question, create_async_clients
+from retrievers import RETRIEVERS, create_openai_prompt
+
+# Load environment variables from .env file
+if os.path.exists("../.env"):
+    load_dotenv(override=True)
+
+MODEL = os.getenv("AZURE_OPENAI_MODEL")
+OUTPUT_FILE_QUESTIONS = '../../data/eval/medical/small/med_ground_truth.json'
+OUTPUT_DIR_ANSWERS = '../data'
+RETRIEVAL_CACHE_FILE = '../data/retrieval_cache.sqlite'
+# tokens, latency and ES took of every call, one JSON line each (summary: python ../common/call_metrics.py <file>)
+METRICS_FILE = '../data/metrics/run_retrievers.jsonl'
+
+
+async def run_retrievers(questions, names, stores, concurrency=8, rate=5.0, retrieval_cache=None,
+                         context_budget=DEFAULT_CONTEXT_TOKENS, metrics=None):
+    """
+    Answer every remaining (question, retriever) pair; each retriever's answers reach its store in question order.
+    Returns the (retriever, question position) pairs that failed.
+    """
+    es_client, openai_client = create_async_clients(concurrency)
+    bucket = TokenBucket(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    plans = {}
+    for name in names:
+        retriever = RETRIEVERS[name]
+        prompt = functools.partial(create_openai_prompt, retriever=retriever, context_tokens=context_budget)
+        # anything that changes the generated answer is part of the config, so changing it re-answers the questions
+        config = retriever_config(retriever["index"], retriever["build_query"],
+                                  prompt=prompt([])[0], context_tokens=context_budget,
+                                  min_overlap_chars=MIN_OVERLAP_CHARS,
+                                  context_fields={k: v for k, v in retriever.items() if not callable(v)})
+        done = completed_keys(stores[name].records(), config, MODEL)
+        positions = [i for i, doc in enumerate(questions)
+                     if checkpoint_key(doc.get('question'), config, MODEL) not in done]
+        print(f"{name}: {len(questions) - len(positions)} questions already answered, {len(positions)} to go")
+
+        def on_result(result, store=stores[name], config=config):
+            result[KEY_FIELD] = checkpoint_key(result["question"], config, MODEL)
+            store.append(result)
+
+        plans[name] = {
+            "retriever": retriever,
+            "prompt": prompt,
+            "slots": {position: slot for slot, position in enumerate(positions)},
+            "emitter": OrderedEmitter(len(positions), on_result),
+        }
+
+    failed = []
+
+    async def answer(name, position):
+        plan = plans[name]
+        doc = questions[position]
+        try:
+            async with semaphore:
+                await bucket.acquire()
+                result = await answer_question(es_client, openai_client, MODEL, plan["retriever"]["index"],
+                                               plan["retriever"]["build_query"](doc.get('question')),
+                                               plan["prompt"], doc, retrieval_cache, metrics, name)
+        except Exception as e:
+            # one failed question must not abort the others; it isn't checkpointed, so a rerun retries it
+            failed.append((name, position))
+            print(f"{name}: question {position} failed: {e.__class__.__name__}: {e}")
+            plan["emitter"].skip(plan["slots"][position])
+            return
+        plan["emitter"].set(plan["slots"][position], result)
+
+    # question-major order: each question is sent to every retriever before moving on
+    tasks = [answer(name, position) for position in range(len(questions))
+             for name in names if position in plans[name]["slots"]]
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await es_client.close()
+        await openai_client.close()
+    elapsed = time.perf_counter() - start
+    answered = len(tasks) - len(failed)
+    print(f"Answered {answered} (question, retriever) pairs in {elapsed:.1f}s "
+          f"({answered / elapsed if elapsed else 0:.2f}/s), {len(failed)} failed")
+    for name in names:
+        count = sum(failed_name == name for failed_name, _ in failed)
+        if count:
+            print(f"  {name}: {count} questions failed, rerun to answer them")
+    return failed
+
+
+def main(retrievers=None, argv=None, **defaults):
+    """
+    Command line entry point. The retriever_*.py scripts call it with their retriever and their own paths
+    as `defaults` (keyword names of the options, e.g. output=...), so every flag works for them too.
+    """
+    parser = argparse.ArgumentParser(description="Answer the questions with one or more retriever scenarios")
+    parser.add_argument("--retrievers", default=",".join(retrievers or RETRIEVERS),
+                        help=f"comma separated names from {', '.join(RETRIEVERS)}")
+    parser.add_argument("--questions", default=OUTPUT_FILE_QUESTIONS)
+    parser.add_argument("--output-dir", default=OUTPUT_DIR_ANSWERS, help="answers go to <dir>/<retriever>_answers.json")
+    parser.add_argument("--output", help="answers file when a single retriever runs (overrides --output-dir)")
+    parser.add_argument("--concurrency", type=int, default=8, help="(question, retriever) pairs in flight at once")
+    parser.add_argument("--rate", type=float, default=5.0, help="max pairs started per second (0 = unlimited)")
+    parser.add_argument("--sequential", action="store_true", help="one pair at a time, same as --concurrency 1")
+    parser.add_argument("--context-tokens", type=int, default=DEFAULT_CONTEXT_TOKENS,
+                        help="token budget for the retrieved context in the prompt (0 = no limit)")
+    parser.add_argument("--no-retrieval-cache", action="store_true", help="always query ES instead of reusing cached hits")
+    parser.add_argument("--metrics-file", default=METRICS_FILE, help="JSONL file the per-call metrics are appended to")
+    parser.set_defaults(**defaults)
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.retrievers.split(",") if name.strip()]
+    unknown = [name for name in names if name not in RETRIEVERS]
+    if unknown:
+        parser.error(f"unknown retrievers: {', '.join(unknown)}")
+    if args.output and len(names) != 1:
+        parser.error("--output needs exactly one retriever")
+
+    with open(args.questions, 'r') as file:
+        questions = json.load(file)
+
+    stores = {name: AnswerStore(args.output or os.path.join(args.output_dir, f"{name}_answers.json"))
+              for name in names}
+    retrieval_cache = None if args.no_retrieval_cache else RetrievalCache(RETRIEVAL_CACHE_FILE)
+    call_metrics = CallMetrics(args.metrics_file, name="run_retrievers" if len(names) > 1 else names[0])
+    try:
+        failed = asyncio.run(run_retrievers(questions, names, stores,
+                                            concurrency=1 if args.sequential else args.concurrency, rate=args.rate,
+                                            retrieval_cache=retrieval_cache, context_budget=args.context_tokens,
+                                            metrics=call_metrics))
+    finally:
+        for store in stores.values():
+            store.close()
+        call_metrics.print_summary()
+        call_metrics.close()
+        if retrieval_cache:
+            retrieval_cache.print_stats()
+            retrieval_cache.close()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+## Local stand-in for Elasticsearch and Azure OpenAI
+## Used to exercise the rag_scenarios / evaluation scripts without a cluster or API key:
+##   python tools/mock_backend.py --port 9299 --latency 0.2
+##   ES_URL=http://localhost:9299 AZURE_OPENAI_BASE=http://localhost:9299 python rag_scenarios/retriever_fulltext.py
+import argparse
+import json
+import os
+import random
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              '../../data/raw/dragonball_docs_med_en_multi.ndjson')
+
+TOKEN_PATTERN = re.compile(r"\w+")
+# judge answers that drift from the requested format; the last one can't be parsed at all
+MALFORMED_VERDICTS = ["**Score:** {score}/5 - mock rationale.", "Feedback: Mock feedback.\n[RESULT]: {score}",
+                      "I would rate this response fairly well overall."]
+
+
+def tokenize(text):
+    """Lower-cased word tokens of a text."""
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+def find_query_text(body):
+    """Return the first query string found anywhere in an ES query body."""
+    if isinstance(body, dict):
+        for key in ("query", "inference_text"):
+            if isinstance(body.get(key), str):
+                return body[key]
+        for field in ("content", "content_semantic"):
+            if isinstance(body.get(field), str):
+                return body[field]
+        for value in body.values():
+            text = find_query_text(value)
+            if text:
+                return text
+    elif isinstance(body, list):
+        for value in body:
+            text = find_query_text(value)
+            if text:
+                return text
+    return ""
+
+
+def chunk_text(text, words=60):
+    """Split a document into overlapping chunks of whole lines, like semantic_text's sentence chunking."""
+    lines = [line for line in str(text).splitlines() if line.strip()]
+    chunks, current, count = [], [], 0
+    for line in lines:
+        current.append(line)
+        count += len(line.split())
+        if count >= words:
+            chunks.append("\n".join(current))
+            current, count = current[-1:], len(current[-1].split())
+    if len(current) > 1 or not chunks:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def schema_example(schema, score):
+    """A value matching a structured-output JSON schema: objects are filled in, integers get `score`."""
+    if schema.get("type") == "object":
+        return {name: schema_example(spec, score + i) for i, (name, spec) in enumerate(schema.get("properties", {}).items())}
+    if schema.get("type") == "integer":
+        return score % 5 + 1
+    return "Mock rationale."
+
+
+def find_key(body, key):
+    """Return the value of the first `key` found anywhere in an ES query body, or None."""
+    if isinstance(body, dict):
+        if key in body:
+            return body[key]
+        values = body.values()
+    elif isinstance(body, list):
+        values = body
+    else:
+        return None
+    for value in values:
+        found = find_key(value, key)
+        if found is not None:
+            return found
+    return None
+
+
+class MockBackend:
+    """In-memory corpus scored by term overlap, plus canned LLM answers."""
+
+    def __init__(self, corpus_path, latency, error_rate=0.0, malformed_rate=0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.documents = []
+        self.indices = {}
+        self.pipelines = {}
+        self.request_count = 0
+        self.refreshes = 0
+        self.settings = {}  # index -> flat index settings set through _settings
+        if corpus_path and os.path.exists(corpus_path):
+            with open(corpus_path, 'r') as f:
+                for line in f:
+                    if line.strip():
+                        self.add_document(json.loads(line))
+
+    def add_document(self, source):
+        source.setdefault("content_semantic", source.get("content", ""))
+        self.documents.append((source, set(tokenize(source.get("content", "")))))
+
+    def search(self, index, body):
+        size = body.get("size", 10)
+        rrf = find_key(body, "rrf")
+        if rrf and not find_key(body, "text_similarity_reranker"):
+            hits = self.rrf_hits(index, rrf, size)
+        else:
+            hits = self.ranked_hits(index, body, size)
+        hits = [self.shape_hit(hit, body) for hit in hits]
+        return {
+            "took": int(self.latency * 1000),
+            "timed_out": False,
+            "hits": {"total": {"value": len(hits), "relation": "eq"}, "max_score": hits[0]["_score"] if hits else None,
+                     "hits": hits},
+        }
+
+    def ranked_hits(self, index, body, size):
+        terms = set(tokenize(find_query_text(body)))
+        ids = find_key(body, "ids")
+        allowed = {str(value) for value in ids["values"]} if ids else None
+        if find_key(body, "text_similarity_reranker"):
+            # reranker relevance in [0, 1]
+            score = lambda doc_terms: len(terms & doc_terms) / (len(terms) or 1)
+        elif find_key(body, "sparse_vector"):
+            # a different ranking than BM25 so fusion has something to combine
+            score = lambda doc_terms: len(terms & doc_terms) / len(doc_terms) ** 0.5 if doc_terms else 0.0
+        else:
+            score = lambda doc_terms: len(terms & doc_terms)
+        scored = sorted(((score(doc_terms), i) for i, (source, doc_terms) in enumerate(self.documents)
+                         if allowed is None or str(i) in allowed),
+                        reverse=True)[:size]
+        inner_hits = find_key(body, "inner_hits")
+        hits = []
+        for score, i in scored:
+            source = self.documents[i][0]
+            hit = {"_index": index, "_id": str(i), "_score": float(score), "_source": source}
+            if inner_hits:
+                # semantic_text chunks of the document, best matching first
+                chunks = sorted(chunk_text(source.get("content", "")),
+                                key=lambda chunk: -len(terms & set(tokenize(chunk))))[:inner_hits.get("size", 3)]
+                hit["inner_hits"] = {inner_hits.get("name", "chunks"): {"hits": {"hits": [
+                    {"_score": float(len(terms & set(tokenize(chunk)))), "_source": {"text": chunk}}
+                    for chunk in chunks]}}}
+            hits.append(hit)
+        return hits
+
+    def rrf_hits(self, index, rrf, size):
+        """Reciprocal rank fusion of the sub-retrievers, as the ES `rrf` retriever scores it."""
+        window = rrf.get("rank_window_size", 10)
+        constant = rrf.get("rank_constant", 60)
+        scores, hits = {}, {}
+        for retriever in rrf["retrievers"]:
+            for rank, hit in enumerate(self.ranked_hits(index, {"retriever": retriever}, window), start=1):
+                scores[hit["_id"]] = scores.get(hit["_id"], 0.0) + 1.0 / (constant + rank)
+                hits[hit["_id"]] = dict(hits.get(hit["_id"], {}), **hit)
+        fused = sorted(scores, key=lambda doc_id: -scores[doc_id])[:min(size, window)]
+        return [dict(hits[doc_id], _score=scores[doc_id]) for doc_id in fused]
+
+    def shape_hit(self, hit, body):
+        """Apply the request's `_source` filtering and `highlight` to a hit."""
+        hit = dict(hit)
+        terms = set(tokenize(find_query_text(body)))
+        highlight = body.get("highlight")
+        if highlight:
+            hit["highlight"] = {}
+            for field, options in highlight.get("fields", {}).items():
+                text = str(hit["_source"].get(field, ""))
+                size = options.get("fragment_size", 100)
+                fragments = [text[start:start + size] for start in range(0, len(text), size)]
+                fragments.sort(key=lambda fragment: -len(terms & set(tokenize(fragment))))
+                hit["highlight"][field] = fragments[:options.get("number_of_fragments", 5)]
+        source = body.get("_source", True)
+        if source is False:
+            hit.pop("_source")
+        elif isinstance(source, list):
+            hit["_source"] = {field: value for field, value in hit["_source"].items() if field in source}
+        return hit
+
+    def stats(self, index):
+        """Index stats with the counters a client can use to notice that the corpus changed."""
+        return {"indices": {index: {"uuid": "mock-" + index, "primaries": {
+            "docs": {"count": len(self.documents), "deleted": 0},
+            "indexing": {"index_total": len(self.documents), "delete_total": 0},
+            "refresh": {"total": self.refreshes}}}}}
+
+    def chat_completion(self, body):
+        messages = body.get("messages", [])
+        question = messages[-1]["content"] if messages else ""
+        conversation = "\n".join(m.get("content", "") for m in messages)
+        prompt_tokens = sum(len(tokenize(m.get("content", ""))) for m in messages)
+        schema = (body.get("response_format") or {}).get("json_schema", {}).get("schema")
+        judged = "total rating:" in conversation.lower() or "[RESULT]" in conversation
+        score = len(conversation) % 5 + 1
+        criteria = re.findall(r"^(\w+) total rating:", question, re.MULTILINE)
+        # follow the output format the ground-truth / judge prompts ask for
+        if "Factoid question:" in question:
+            words = tokenize(question.split("Context:")[-1])[:8]
+            answer = f"Factoid question: What is {' '.join(words)}?\nAnswer: {' '.join(words[:4])}"
+        elif judged and random.random() < self.malformed_rate:
+            answer = random.choice(MALFORMED_VERDICTS).format(score=score)
+        elif schema:  # structured outputs: an object with the schema's fields
+            answer = json.dumps(schema_example(schema, score - 1))
+        elif criteria:  # several criteria rated in one answer
+            answer = "\n".join(f"{name} evaluation: Mock rationale.\n{name} total rating: {(score + i) % 5 + 1}"
+                               for i, name in enumerate(criteria))
+        elif "Total rating:" in question:
+            answer = f"Evaluation: Mock rationale.\nTotal rating: {score}"
+        elif "[RESULT]" in question:
+            answer = f"Feedback: Mock feedback. [RESULT] {score}"
+        else:
+            answer = f"Mock answer to: {question[:200]}"
+        return {
+            "id": f"chatcmpl-mock-{self.request_count}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": answer}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokenize(answer)),
+                      "total_tokens": prompt_tokens + len(tokenize(answer))},
+        }
+
+    def embeddings(self, body):
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        data = []
+        for i, text in enumerate(inputs):
+            vector = [0.0] * 16
+            for token in tokenize(text):
+                vector[hash(token) % 16] += 1.0
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        return {"object": "list", "data": data, "model": body.get("model", "mock"),
+                "usage": {"prompt_tokens": 0, "total_tokens": 0}}
+
+
+def make_handler(backend):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def read_body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length) if length else b""
+
+        def send_json(self, payload, status=200):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("X-Elastic-Product", "Elasticsearch")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(data)
+
+        def route(self):
+            raw = self.read_body()
+            backend.request_count += 1
+            time.sleep(backend.latency)
+            path = self.path.split("?")[0].rstrip("/")
+            parts = [p for p in path.split("/") if p]
+
+            if "/openai/" in path and random.random() < backend.error_rate:
+                self.send_response(429)
+                self.send_header("Retry-After", "1")
+                self.send_header("Content-Type", "application/json")
+                data = json.dumps({"error": {"code": "429", "message": "Rate limit is exceeded."}}).encode()
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return
+            if path.endswith("/chat/completions"):
+                return self.send_json(backend.chat_completion(json.loads(raw or b"{}")))
+            if path.endswith("/embeddings"):
+                return self.send_json(backend.embeddings(json.loads(raw or b"{}")))
+            if not parts:
+                return self.send_json({"name": "mock", "cluster_name": "mock",
+                                       "version": {"number": "9.0.0", "build_flavor": "default"},
+                                       "tagline": "You Know, for Search"})
+            if parts[-1] == "_search":
+                index = parts[0] if len(parts) > 1 else "_all"
+                return self.send_json(backend.search(index, json.loads(raw or b"{}")))
+            if parts[-1] == "_msearch":
+                lines = [json.loads(line) for line in raw.decode().splitlines() if line.strip()]
+                responses = []
+                for header, body in zip(lines[0::2], lines[1::2]):
+                    index = header.get("index", parts[0] if len(parts) > 1 else "_all")
+                    response = backend.search(index, body)
+                    response["status"] = 200
+                    responses.append(response)
+                return self.send_json({"took": 0, "responses": responses})
+            if parts[-1] == "_bulk":
+                lines = [json.loads(line) for line in raw.decode().splitlines() if line.strip()]
+                items = []
+                for action, source in zip(lines[0::2], lines[1::2]):
+                    op, meta = next(iter(action.items()))
+                    index = meta.get("_index", parts[0])
+                    if random.random() < backend.error_rate:  # simulated semantic_text inference backpressure
+                        items.append({op: {"_index": index, "status": 429, "error": {
+                            "type": "es_rejected_execution_exception",
+                            "reason": "inference queue is full, rejecting request"}}})
+                        continue
+                    backend.add_document(source)
+                    items.append({op: {"_index": index, "_id": str(len(backend.documents)),
+                                       "status": 201, "result": "created"}})
+                errors = any(item[next(iter(item))]["status"] >= 300 for item in items)
+                return self.send_json({"took": 0, "errors": errors, "items": items})
+            if parts[0] == "_ingest" and len(parts) == 3:
+                backend.pipelines[parts[2]] = json.loads(raw or b"{}")
+                return self.send_json({"acknowledged": True})
+            if len(parts) == 1 and self.command in ("PUT", "HEAD", "DELETE"):
+                if self.command == "PUT":
+                    backend.indices[parts[0]] = json.loads(raw or b"{}")
+                    return self.send_json({"acknowledged": True, "shards_acknowledged": True, "index": parts[0]})
+                if self.command == "DELETE":
+                    backend.indices.pop(parts[0], None)
+                    return self.send_json({"acknowledged": True})
+                return self.send_json({}, status=200 if parts[0] in backend.indices else 404)
+            if len(parts) >= 2 and parts[1] == "_stats":
+                return self.send_json(backend.stats(parts[0]))
+            if len(parts) >= 2 and parts[1] == "_settings":
+                settings = backend.settings.setdefault(parts[0], {})
+                if self.command == "PUT":
+                    body = json.loads(raw or b"{}")
+                    for key, value in (body.get("index") or body).items():
+                        if value is None:  # null resets a setting to its default
+                            settings.pop(key, None)
+                        else:
+                            settings[key] = value
+                    return self.send_json({"acknowledged": True})
+                return self.send_json({parts[0]: {"settings": {"index": dict(settings)} if settings else {}}})
+            if len(parts) >= 2 and parts[1] in ("_refresh", "_mapping"):
+                if parts[1] == "_refresh":
+                    backend.refreshes += 1
+                return self.send_json({"acknowledged": True, "_shards": {"total": 1, "successful": 1, "failed": 0}})
+            return self.send_json({"error": f"unsupported path {self.path}"}, status=404)
+
+        do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = route
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock Elasticsearch + Azure OpenAI server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9299)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds of simulated latency per request")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="NDJSON corpus served by _search")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of OpenAI calls / bulk items answered with 429")
+    parser.add_argument("--malformed-rate", type=float, default=0.0,
+                        help="Fraction of judge / critique answers that drift from the requested format")
+    args = parser.parse_args()
+
+    backend = MockBackend(args.corpus, args.latency, args.error_rate, args.malformed_rate)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(backend))
+    print(f"Mock backend on http://{args.host}:{args.port} ({len(backend.documents)} docs, {args.latency}s latency)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Served {backend.request_count} requests")
+
+
+if __name__ == "__main__":
+    main()